@@ -0,0 +1,86 @@
+"""
+Compare the per-trigger regex loop del_blacklist used to run with the KeywordMatcher automaton.
+
+Usage: python benchmarks/blacklist_matcher.py [messages]
+
+The matcher module is loaded straight from its file so this runs without a bot token or database.
+"""
+import importlib.util
+import os
+import random
+import re
+import string
+import sys
+import time
+
+MATCHER_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "utils", "modules", "helper_funcs", "matcher.py")
+SIZES = (10, 100, 1000, 10000)
+
+
+def load_matcher():
+    spec = importlib.util.spec_from_file_location("matcher", MATCHER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.KeywordMatcher
+
+
+def regex_loop(triggers, text):
+    # the old del_blacklist body
+    for trigger in triggers:
+        pattern = r"( |^|[^\w])" + re.escape(trigger) + r"( |$|[^\w])"
+        if re.search(pattern, text, flags=re.IGNORECASE):
+            return trigger
+    return None
+
+
+def random_word(rng, low=3, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def make_messages(rng, count):
+    # mostly clean chat traffic, which is the worst case for the loop: every trigger gets tried
+    messages = []
+    for _ in range(count):
+        words = [random_word(rng) for _ in range(rng.randint(5, 40))]
+        messages.append(" ".join(w.capitalize() if rng.random() < 0.2 else w for w in words) + "!")
+    return messages
+
+
+def bench(func, messages):
+    start = time.perf_counter()
+    hits = sum(1 for text in messages if func(text))
+    return time.perf_counter() - start, hits
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    KeywordMatcher = load_matcher()
+    rng = random.Random(1337)
+    messages = make_messages(rng, count)
+
+    print("{:>8} {:>12} {:>12} {:>9} {:>7}".format("triggers", "regex ms/msg", "aho ms/msg", "speedup", "hits"))
+    for size in SIZES:
+        triggers = set()
+        while len(triggers) < size:
+            triggers.add(random_word(rng, 4, 12) if rng.random() < 0.9 else random_word(rng) + " " + random_word(rng))
+        triggers = list(triggers)
+
+        build_start = time.perf_counter()
+        matcher = KeywordMatcher(triggers)
+        matcher.search("warm up")
+        build_time = time.perf_counter() - build_start
+
+        # the regex loop gets slow fast; a slice of the messages is plenty to get a stable number
+        sample = messages[:max(10, count * 100 // size)] if size > 100 else messages
+        regex_time, regex_hits = bench(lambda text: regex_loop(triggers, text), sample)
+        aho_time, aho_hits = bench(matcher.search, sample)
+        assert regex_hits == aho_hits, (size, regex_hits, aho_hits)
+
+        per_regex = regex_time * 1000 / len(sample)
+        per_aho = aho_time * 1000 / len(sample)
+        print("{:>8} {:>12.3f} {:>12.4f} {:>8.0f}x {:>7}   (build {:.1f} ms)".format(
+            size, per_regex, per_aho, per_regex / per_aho, aho_hits, build_time * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Throughput of per-group run_async MessageHandlers vs the single-pass moderation pipeline.
+
+Usage: python benchmarks/moderation_pipeline.py [updates] [workers] [admin_latency_ms]
+
+Each of the nine moderation stages does what the real ones have in common: pull the text out of the message,
+check whether the sender is an admin (through a locked cache, paying `admin_latency_ms` on a miss, like a
+getChatMember call) and look at a per-chat in-memory setting. In "handlers" mode every stage is its own
+run_async handler in its own group, as with MODERATION_PIPELINE off; in "pipeline" mode one run_async handler
+runs them all with a shared per-update context. Only python-telegram-bot is needed; each mode runs in a
+separate process because the dispatcher is a singleton.
+"""
+import subprocess
+import sys
+import threading
+import time
+import warnings
+from types import SimpleNamespace
+
+from telegram import Update
+from telegram.ext import Dispatcher, MessageHandler, Filters
+from telegram.ext.dispatcher import run_async
+
+STAGES = ("gban", "gmute", "restrictions", "locks", "blacklist", "antiflood", "warns", "filters", "log_user")
+CHATS = 50
+USERS = 2000
+
+ADMIN_LATENCY = 0.0
+TARGET = 0  # run_async tasks to wait for
+
+ADMIN_CACHE = {}
+ADMIN_LOCK = threading.Lock()
+CHAT_SETTINGS = {str(-1000 - i): {} for i in range(CHATS)}
+STATS = {"done": 0, "admin_lookups": 0, "admin_misses": 0}
+STATS_LOCK = threading.Lock()
+FINISHED = threading.Event()
+
+
+class Context(object):
+    def __init__(self, update):
+        self.update = update
+        self._text = None
+        self._admin = None
+
+    @property
+    def text(self):
+        if self._text is None:
+            message = self.update.effective_message
+            self._text = message.text or message.caption or ""
+        return self._text
+
+    @property
+    def user_is_admin(self):
+        if self._admin is None:
+            self._admin = is_admin(self.update.effective_chat.id, self.update.effective_user.id)
+        return self._admin
+
+
+def is_admin(chat_id, user_id):
+    key = (chat_id, user_id)
+    with ADMIN_LOCK:
+        status = ADMIN_CACHE.get(key)
+        STATS["admin_lookups"] += 1
+    if status is None:
+        time.sleep(ADMIN_LATENCY)
+        status = "administrator" if user_id % 50 == 0 else "member"
+        with ADMIN_LOCK:
+            ADMIN_CACHE[key] = status
+            STATS["admin_misses"] += 1
+    return status == "administrator"
+
+
+def make_stage(name):
+    def stage(bot, update, context=None):
+        context = context or Context(update)
+        settings = CHAT_SETTINGS[str(update.effective_chat.id)]
+        if context.text and not context.user_is_admin:
+            settings.get(name)
+        return False
+
+    stage.__name__ = name
+    return stage
+
+
+def finished_task():
+    with STATS_LOCK:
+        STATS["done"] += 1
+        if STATS["done"] == TARGET:
+            FINISHED.set()
+
+
+def make_updates(count):
+    updates = []
+    for i in range(count):
+        chat_id = -1000 - i % CHATS
+        user_id = 1 + (i * 7919) % USERS
+        updates.append(Update.de_json({
+            "update_id": i,
+            "message": {"message_id": i, "date": 0, "text": "hello there number {}".format(i),
+                        "chat": {"id": chat_id, "type": "supergroup", "title": "group"},
+                        "from": {"id": user_id, "is_bot": False, "first_name": "user"}},
+        }, None))
+    return updates
+
+
+def run_mode(mode, count, workers):
+    global TARGET
+    warnings.simplefilter("ignore")  # old handler API
+    dispatcher = Dispatcher(SimpleNamespace(id=1), None, workers=workers)
+    stages = [make_stage(name) for name in STAGES]
+
+    if mode == "handlers":
+        TARGET = count * len(stages)
+        for group, stage in enumerate(stages, start=1):
+            def handler(bot, update, stage=stage):
+                stage(bot, update)
+                finished_task()
+
+            dispatcher.add_handler(MessageHandler(Filters.all & Filters.group, run_async(handler)), group)
+    else:
+        TARGET = count
+
+        @run_async
+        def pipeline(bot, update):
+            context = Context(update)
+            for stage in stages:
+                if stage(bot, update, context=context):
+                    break
+            finished_task()
+
+        dispatcher.add_handler(MessageHandler(Filters.all, pipeline), 1)
+
+    updates = make_updates(count)
+    dispatcher._init_async_threads("bench", workers)
+    start = time.perf_counter()
+    for update in updates:
+        dispatcher.process_update(update)
+    FINISHED.wait()
+    elapsed = time.perf_counter() - start
+    dispatcher.stop()
+
+    print("{:>9} {:>10.0f} {:>13} {:>14} {:>13}".format(
+        mode, count / elapsed, TARGET, STATS["admin_lookups"], STATS["admin_misses"]))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    latency = sys.argv[3] if len(sys.argv) > 3 else "0"
+
+    if len(sys.argv) > 4:  # child process
+        global ADMIN_LATENCY
+        ADMIN_LATENCY = float(latency) / 1000
+        run_mode(sys.argv[4], count, workers)
+        return
+
+    print("{} updates, {} workers, {} ms per admin cache miss".format(count, workers, latency))
+    print("{:>9} {:>10} {:>13} {:>14} {:>13}".format("mode", "updates/s", "thread tasks", "admin lookups",
+                                                     "admin misses"))
+    for mode in ("handlers", "pipeline"):
+        subprocess.run([sys.executable, __file__, str(count), str(workers), latency, mode], check=True)
+
+
+if __name__ == "__main__":
+    main()
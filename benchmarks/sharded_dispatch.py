@@ -0,0 +1,151 @@
+"""
+Update throughput of the chat-sharded multi-process mode (SHARD_PROCESSES) at 1, 2, 4 and 8 worker processes.
+
+Usage: python benchmarks/sharded_dispatch.py [updates] [chats] [triggers]
+
+The supervisor side does what ShardRouter does: serialise each Update and write it, as a line of JSON, down a
+socketpair to worker `chat_id % workers`. Each worker decodes the updates and runs the CPU-bound part of the
+moderation handlers on them: the blacklist's KeywordMatcher, the filters' combined trigger regex and the warn
+filters' per-keyword regex loop, over `triggers` triggers per chat. There's no Bot API or database work, so this
+is the ceiling the GIL used to put on one process. Expect no gain beyond the machine's core count. The matcher
+module is loaded straight from its file so this runs without a bot token or database.
+"""
+import importlib.util
+import json
+import os
+import random
+import re
+import socket
+import string
+import subprocess
+import sys
+import time
+import warnings
+
+from telegram import Update
+
+MATCHER_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "utils", "modules", "helper_funcs", "matcher.py")
+WORKER_COUNTS = (1, 2, 4, 8)
+WARN_TRIGGERS = 20  # warn filters are few per chat; each is its own regex
+
+
+def load_matcher():
+    spec = importlib.util.spec_from_file_location("matcher", MATCHER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.KeywordMatcher
+
+
+def random_word(rng, low=3, high=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def chat_triggers(chat_id, count):
+    rng = random.Random(chat_id)  # the same triggers in every process
+    return [random_word(rng) for _ in range(count)]
+
+
+class ChatModeration(object):
+    """One chat's blacklist, filters and warn filters, matched the way the handlers match them."""
+
+    def __init__(self, keyword_matcher, chat_id, count):
+        triggers = chat_triggers(chat_id, count)
+        self.blacklist = keyword_matcher(triggers)
+        filters = sorted(set(triggers), key=lambda x: (-len(x), x))
+        self.filters = re.compile(r"(?<!\w)(?=(" + "|".join(re.escape(kw) for kw in filters) + r")(?!\w))",
+                                  flags=re.IGNORECASE)
+        # compiled up front: warns.py leans on re's own cache of 512 patterns, which a process handling fewer
+        # chats overflows less, and that would show up here as a speedup that has nothing to do with cores
+        self.warns = [re.compile(r"( |^|[^\w])" + re.escape(kw) + r"( |$|[^\w])", flags=re.IGNORECASE)
+                      for kw in triggers[:WARN_TRIGGERS]]
+
+    def check(self, text):
+        if self.blacklist.search(text):
+            return True
+        if any(True for _ in self.filters.finditer(text)):
+            return True
+        return any(pattern.search(text) for pattern in self.warns)
+
+
+def make_updates(count, chats):
+    rng = random.Random(1)
+    updates = []
+    for i in range(count):
+        chat_id = -1000 - i % chats
+        text = " ".join(random_word(rng) for _ in range(rng.randint(5, 30)))
+        updates.append(Update.de_json({
+            "update_id": i,
+            "message": {"message_id": i, "date": 0, "text": text,
+                        "chat": {"id": chat_id, "type": "supergroup", "title": "group"},
+                        "from": {"id": 1 + i % 997, "is_bot": False, "first_name": "user"}},
+        }, None))
+    return updates
+
+
+def run_worker(index, workers, fd, chats, triggers):
+    keyword_matcher = load_matcher()
+    moderation = {chat_id: ChatModeration(keyword_matcher, chat_id, triggers)
+                  for chat_id in (-1000 - i for i in range(chats)) if chat_id % workers == index}
+
+    sock = socket.socket(fileno=fd)
+    sock.sendall(b"ready\n")
+    handled = 0
+    with sock.makefile("rb") as stream:
+        for line in stream:
+            update = Update.de_json(json.loads(line.decode("utf-8")), None)
+            moderation[update.effective_chat.id].check(update.effective_message.text)
+            handled += 1
+    sock.sendall("done {}\n".format(handled).encode())
+
+
+def run_supervisor(workers, updates, chats, triggers):
+    procs, socks = [], []
+    for index in range(workers):
+        ours, theirs = socket.socketpair()
+        procs.append(subprocess.Popen([sys.executable, __file__, "worker", str(index), str(workers),
+                                       str(theirs.fileno()), str(chats), str(triggers)],
+                                      pass_fds=(theirs.fileno(),)))
+        theirs.close()
+        socks.append(ours)
+
+    replies = [sock.makefile("rb") for sock in socks]
+    for reply in replies:  # building the matchers isn't part of the run
+        assert reply.readline() == b"ready\n"
+
+    start = time.perf_counter()
+    for update in updates:
+        socks[update.effective_chat.id % workers].sendall(update.to_json().encode("utf-8") + b"\n")
+    for sock in socks:
+        sock.shutdown(socket.SHUT_WR)
+    handled = sum(int(reply.readline().split()[1]) for reply in replies)
+    elapsed = time.perf_counter() - start
+
+    for proc in procs:
+        proc.wait()
+    assert handled == len(updates)
+    return len(updates) / elapsed
+
+
+def main():
+    warnings.simplefilter("ignore")
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        run_worker(*map(int, sys.argv[2:7]))
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chats = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    triggers = int(sys.argv[3]) if len(sys.argv) > 3 else 300
+
+    print("{} updates over {} chats, {} triggers per chat, {} CPU cores".format(count, chats, triggers,
+                                                                             os.cpu_count()))
+    print("{:>8} {:>10} {:>8}".format("workers", "updates/s", "speedup"))
+    updates = make_updates(count, chats)
+    baseline = None
+    for workers in WORKER_COUNTS:
+        rate = run_supervisor(workers, updates, chats, triggers)
+        baseline = baseline or rate
+        print("{:>8} {:>10.0f} {:>7.2f}x".format(workers, rate, rate / baseline))
+
+
+if __name__ == "__main__":
+    main()
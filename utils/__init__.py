@@ -54,9 +54,30 @@ if ENV:
     DEL_CMDS = bool(os.environ.get('DEL_CMDS', False))
     STRICT_GBAN = bool(os.environ.get('STRICT_GBAN', False))
     WORKERS = int(os.environ.get('WORKERS', 8))
+    WORKER_MODE = os.environ.get('WORKER_MODE', 'pool')
+    LONG_WORKERS = int(os.environ.get('LONG_WORKERS', 4))
+    AUTOSCALE = bool(os.environ.get('AUTOSCALE', False))
+    LOAD_SHEDDING = bool(os.environ.get('LOAD_SHEDDING', False))
+    SHED_DEFER_BACKLOG = int(os.environ.get('SHED_DEFER_BACKLOG', 200))
+    SHED_DROP_BACKLOG = int(os.environ.get('SHED_DROP_BACKLOG', 1000))
+    CATCHUP_LAG = int(os.environ.get('CATCHUP_LAG', 0))
+    CACHE_BUS = bool(os.environ.get('CACHE_BUS', False))
+    SHARD_PROCESSES = int(os.environ.get('SHARD_PROCESSES', 0))
+    WEBHOOK_THREADS = int(os.environ.get('WEBHOOK_THREADS', 4))
+    WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 10000))
+    MIN_WORKERS = int(os.environ.get('MIN_WORKERS', 4))
+    MAX_WORKERS = int(os.environ.get('MAX_WORKERS', 32))
     BAN_STICKER = os.environ.get('BAN_STICKER', 'CAACAgQAAxkBAAEHAedfwdK1GHtSZe1Q0F0q6vWRsxL91gAC-QgAAoThEVJCGmPkkeA1_R4E')
     ALLOW_EXCL = os.environ.get('ALLOW_EXCL', False)
     STRICT_GMUTE = bool(os.environ.get('STRICT_GMUTE', False))
+    TARGETED_GBAN = bool(os.environ.get('TARGETED_GBAN', False))
+    MODERATION_PIPELINE = bool(os.environ.get('MODERATION_PIPELINE', False))
+    FANOUT_WORKERS = int(os.environ.get('FANOUT_WORKERS', 4))
+    FANOUT_RATE = float(os.environ.get('FANOUT_RATE', 20))
+    OUTBOUND_RATE = float(os.environ.get('OUTBOUND_RATE', 0))
+    ASYNC_CORE = bool(os.environ.get('ASYNC_CORE', False))
+    ASYNC_TASKS = int(os.environ.get('ASYNC_TASKS', 64))
+    DB_WORKERS = int(os.environ.get('DB_WORKERS', 8))
 
 else:
     from utils.config import Development as Config
@@ -95,13 +116,77 @@ else:
     DEL_CMDS = Config.DEL_CMDS
     STRICT_GBAN = Config.STRICT_GBAN
     WORKERS = Config.WORKERS
+    WORKER_MODE = getattr(Config, 'WORKER_MODE', 'pool')
+    LONG_WORKERS = getattr(Config, 'LONG_WORKERS', 4)
+    AUTOSCALE = getattr(Config, 'AUTOSCALE', False)
+    LOAD_SHEDDING = getattr(Config, 'LOAD_SHEDDING', False)
+    SHED_DEFER_BACKLOG = getattr(Config, 'SHED_DEFER_BACKLOG', 200)
+    SHED_DROP_BACKLOG = getattr(Config, 'SHED_DROP_BACKLOG', 1000)
+    CATCHUP_LAG = getattr(Config, 'CATCHUP_LAG', 0)
+    CACHE_BUS = getattr(Config, 'CACHE_BUS', False)
+    SHARD_PROCESSES = getattr(Config, 'SHARD_PROCESSES', 0)
+    WEBHOOK_THREADS = getattr(Config, 'WEBHOOK_THREADS', 4)
+    WEBHOOK_QUEUE_SIZE = getattr(Config, 'WEBHOOK_QUEUE_SIZE', 10000)
+    MIN_WORKERS = getattr(Config, 'MIN_WORKERS', 4)
+    MAX_WORKERS = getattr(Config, 'MAX_WORKERS', 32)
     BAN_STICKER = Config.BAN_STICKER
     ALLOW_EXCL = Config.ALLOW_EXCL
     STRICT_GMUTE = Config.STRICT_GMUTE
+    TARGETED_GBAN = getattr(Config, 'TARGETED_GBAN', False)
+    MODERATION_PIPELINE = getattr(Config, 'MODERATION_PIPELINE', False)
+    FANOUT_WORKERS = getattr(Config, 'FANOUT_WORKERS', 4)
+    FANOUT_RATE = getattr(Config, 'FANOUT_RATE', 20)
+    OUTBOUND_RATE = getattr(Config, 'OUTBOUND_RATE', 0)
+    ASYNC_CORE = getattr(Config, 'ASYNC_CORE', False)
+    ASYNC_TASKS = getattr(Config, 'ASYNC_TASKS', 64)
+    DB_WORKERS = getattr(Config, 'DB_WORKERS', 8)
 
 SUDO_USERS.add(OWNER_ID)
 
-updater = tg.Updater(TOKEN, workers=WORKERS)
+from queue import Queue
+
+from telegram import Bot
+from telegram.utils.request import Request
+
+if SHARD_PROCESSES:
+    # the shard workers keep each other's sql caches current, and split the send budget between them
+    from utils.modules.helper_funcs import shards
+
+    CACHE_BUS = True
+    if shards.WORKER:
+        OUTBOUND_RATE = OUTBOUND_RATE / shards.WORKER.count
+
+CON_POOL_SIZE = (max(WORKERS, MAX_WORKERS) if AUTOSCALE else WORKERS) + LONG_WORKERS + FANOUT_WORKERS + DB_WORKERS + 8
+
+if OUTBOUND_RATE:
+    # every send goes through one priority-ordered scheduler; see helper_funcs/outbound.py
+    from utils.modules.helper_funcs.outbound import OutboundScheduler, ScheduledRequest
+
+    OUTBOUND_SCHEDULER = OutboundScheduler(OUTBOUND_RATE)
+    bot = Bot(TOKEN, request=ScheduledRequest(OUTBOUND_SCHEDULER, con_pool_size=CON_POOL_SIZE))
+else:
+    OUTBOUND_SCHEDULER = None
+    bot = Bot(TOKEN, request=Request(con_pool_size=CON_POOL_SIZE))
+
+if WORKER_MODE == "sharded":
+    # per-chat ordered lanes instead of one shared pool; see helper_funcs/executor.py
+    from utils.modules.helper_funcs.executor import ShardedDispatcher
+
+    job_queue = tg.JobQueue()
+    # workers=None: Updater defaults it to 4 and then refuses it alongside a dispatcher
+    updater = tg.Updater(dispatcher=ShardedDispatcher(bot, Queue(), workers=WORKERS, long_workers=LONG_WORKERS,
+                                                      job_queue=job_queue), workers=None)
+    job_queue.set_dispatcher(updater.dispatcher)
+elif AUTOSCALE:
+    # the stock pool, but resizable; the autoscaler itself is started in __main__
+    from utils.modules.helper_funcs.executor import ScalableDispatcher
+
+    job_queue = tg.JobQueue()
+    updater = tg.Updater(dispatcher=ScalableDispatcher(bot, Queue(), workers=WORKERS, job_queue=job_queue),
+                         workers=None)
+    job_queue.set_dispatcher(updater.dispatcher)
+else:
+    updater = tg.Updater(bot=bot, workers=WORKERS)
 
 dispatcher = updater.dispatcher
 
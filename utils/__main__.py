@@ -2,6 +2,7 @@ import importlib
 import re
 import html
 from typing import Optional, List
+from functools import partial
 
 from telegram import Message, Chat, Update, Bot, User
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
@@ -11,12 +12,16 @@ from telegram.ext.dispatcher import run_async, DispatcherHandlerStop
 from telegram.utils.helpers import escape_markdown
 
 from utils import dispatcher, updater, TOKEN, WEBHOOK, OWNER_ID, CERT_PATH, PORT, URL, LOGGER, \
-    ALLOW_EXCL
+    ALLOW_EXCL, ASYNC_CORE, ASYNC_TASKS, DB_WORKERS, OUTBOUND_SCHEDULER, AUTOSCALE, MIN_WORKERS, MAX_WORKERS, \
+    LOAD_SHEDDING, SHED_DEFER_BACKLOG, SHED_DROP_BACKLOG, SUDO_USERS, CATCHUP_LAG, \
+    CACHE_BUS, WEBHOOK_THREADS, WEBHOOK_QUEUE_SIZE
 # needed to dynamically load modules
 # NOTE: Module order is not guaranteed, specify that in the config file!
 from utils.modules import ALL_MODULES
 from utils.modules.helper_funcs.chat_status import is_user_admin
 from utils.modules.helper_funcs.misc import paginate_modules
+from utils.modules.helper_funcs import aio, shards, shedding, update_types, webhook
+from utils.modules.helper_funcs.handlers import route_commands
 from utils.modules.sql import users_sql
 from utils.modules.sql.users_sql import del_chat
 from utils.modules.sql import connection_sql
@@ -102,6 +107,7 @@ STATS = []
 USER_INFO = []
 DATA_IMPORT = []
 DATA_EXPORT = []
+STARTUP = []
 
 CHAT_SETTINGS = {}
 USER_SETTINGS = {}
@@ -135,6 +141,9 @@ for module_name in ALL_MODULES:
     if hasattr(imported_module, "__export_data__"):
         DATA_EXPORT.append(imported_module)
 
+    if hasattr(imported_module, "__startup__"):
+        STARTUP.append(imported_module)
+
     if hasattr(imported_module, "__chat_settings__"):
         CHAT_SETTINGS[imported_module.__mod_name__.lower()] = imported_module
 
@@ -781,6 +790,46 @@ def left_chat(bot: Bot, update: Update):
         LOGGER.info("Chat %s removed from database", chat.id)
 
 
+def start_updater(allowed_updates):
+    if WEBHOOK:
+        LOGGER.info("Using webhooks.")
+        webhook.start_webhook(updater,
+                              listen="0.0.0.0",
+                              port=PORT,
+                              url_path=TOKEN,
+                              threads=WEBHOOK_THREADS)
+
+        if CERT_PATH:
+            updater.bot.set_webhook(url=URL + TOKEN,
+                                    certificate=open(CERT_PATH, 'rb'),
+                                    allowed_updates=allowed_updates)
+        else:
+            updater.bot.set_webhook(url=URL + TOKEN, allowed_updates=allowed_updates)
+
+    else:
+        LOGGER.info("Using long polling.")
+        updater.start_polling(timeout=15, read_latency=4, allowed_updates=allowed_updates)
+
+
+def supervise():
+    # this process only takes updates from Telegram and hands each one to the worker process owning its chat
+    from utils.modules.sql import cache_bus
+    if not cache_bus.ENABLED:
+        LOGGER.warning("SHARD_PROCESSES without PostgreSQL: a settings change only reaches the other workers "
+                       "when they restart.")
+    if ASYNC_CORE:
+        LOGGER.warning("ASYNC_CORE is ignored with SHARD_PROCESSES; updates are received by the threaded Updater.")
+
+    shards.ROUTER = shards.ShardRouter(shards.SHARD_PROCESSES)
+    updater.update_queue = dispatcher.update_queue = shards.ROUTER
+    shards.ROUTER.start()
+    update_types.ALLOWED = update_types.allowed_updates(dispatcher.handlers)
+    start_updater(update_types.ALLOWED)
+
+    updater.user_sig_handler = lambda signum, frame: shards.ROUTER.stop()
+    updater.idle()
+
+
 def main():
     test_handler = CommandHandler("test", test)
     genid_handler = CommandHandler("genid", genid, pass_args=True)
@@ -807,50 +856,112 @@ def main():
     dispatcher.add_handler(migrate_handler)
     dispatcher.add_handler(left_chat_handler)
 
+    # after main()'s own handlers, which the supervisor works out allowed_updates from too
+    if shards.SUPERVISOR:
+        supervise()
+        return
+
 
     # dispatcher.add_error_handler(error_callback)
 
 
 
-    if WEBHOOK:
-        LOGGER.info("Using webhooks.")
-        updater.start_webhook(listen="0.0.0.0",
-                              port=PORT,
-                              url_path=TOKEN)
+    if LOAD_SHEDDING or WEBHOOK:
+        # has to go in before polling/webhook start, which hand the queue on. With webhooks it is bounded: the
+        # webhook server answers 503 when it's full and Telegram delivers the update again later.
+        admin_cmds = shedding.admin_commands(dispatcher)
+        update_queue = shedding.PriorityUpdateQueue(dispatcher, admin_cmds, SUDO_USERS,
+                                                    SHED_DEFER_BACKLOG if LOAD_SHEDDING else float("inf"),
+                                                    SHED_DROP_BACKLOG if LOAD_SHEDDING else float("inf"),
+                                                    prefixes=("/", "!") if ALLOW_EXCL else ("/",),
+                                                    maxsize=WEBHOOK_QUEUE_SIZE if WEBHOOK and not ASYNC_CORE else 0)
+        updater.update_queue = dispatcher.update_queue = update_queue
+        if LOAD_SHEDDING:
+            shedding.UPDATE_QUEUE = update_queue
+            LOGGER.info("Load shedding on: %s admin commands, deferring at %s queued, dropping at %s.",
+                        len(admin_cmds), SHED_DEFER_BACKLOG, SHED_DROP_BACKLOG)
+
+    if CATCHUP_LAG:
+        from utils.modules.helper_funcs import catchup, pipeline
+        catchup.CATCH_UP = catchup.CatchUp(dispatcher, CATCHUP_LAG,
+                                           partial(pipeline.run_stages, names=pipeline.ENFORCEMENT_STAGES))
+        catchup.CATCH_UP.register()
+
+    if CACHE_BUS:
+        from utils.modules.sql import cache_bus
+        if not cache_bus.ENABLED:
+            LOGGER.error("CACHE_BUS needs a PostgreSQL database; caches stay local to this process.")
+        else:
+            cache_bus.CacheListener().start()
 
-        if CERT_PATH:
-            updater.bot.set_webhook(url=URL + TOKEN,
-                                    certificate=open(CERT_PATH, 'rb'))
+    # after shedding.admin_commands(), which looks for the CommandHandlers themselves
+    route_commands(dispatcher)
+
+    # with every handler in place, async ones included, so Telegram only sends what one of them can use
+    update_types.ALLOWED = update_types.allowed_updates(dispatcher.handlers, aio.ASYNC_HANDLERS)
+    update_types.UnsubscribedMonitor(update_types.ALLOWED).register(dispatcher)
+
+    worker = None
+    if shards.WORKER:
+        # the supervisor receives the updates; this process runs the handlers for its share of the chats
+        worker = shards.ShardWorker(updater, shards.WORKER)
+        worker.start()
+
+    core = None
+    if ASYNC_CORE and not worker:
+        if not aio.ASYNC_ENABLED:
+            LOGGER.error("ASYNC_CORE needs aiohttp installed; using the threaded Updater instead.")
+        else:
+            LOGGER.info("Using the asyncio core with %s.", "webhooks" if WEBHOOK else "long polling")
+            core = aio.AsyncCore(dispatcher, TOKEN, OUTBOUND_SCHEDULER, tasks=ASYNC_TASKS, db_workers=DB_WORKERS)
+            core.start(webhook=WEBHOOK, port=PORT, url=URL, cert_path=CERT_PATH,
+                       allowed_updates=update_types.ALLOWED)
+
+    if not core and not worker:
+        start_updater(update_types.ALLOWED)
+
+    if AUTOSCALE:
+        from utils.modules.helper_funcs.autoscale import Autoscaler
+        from utils.modules.helper_funcs.executor import ScalableDispatcher
+        if isinstance(dispatcher, ScalableDispatcher):
+            Autoscaler(dispatcher, MIN_WORKERS, MAX_WORKERS).start()
         else:
-            updater.bot.set_webhook(url=URL + TOKEN)
+            LOGGER.warning("AUTOSCALE only works with WORKER_MODE=pool; keeping %s workers.", dispatcher.workers)
 
-    else:
-        LOGGER.info("Using long polling.")
-        updater.start_polling(timeout=15, read_latency=4)
+    # once per bot, not once per shard worker
+    if shards.runs_singletons():
+        # Modules with background work to pick up again, e.g. unfinished gban jobs
+        for mod in STARTUP:
+            mod.__startup__(updater.bot)
 
-    # Send startup notification to all log channels
-    try:
-        from utils.modules.sql import log_channel_sql
-        from datetime import datetime
+        # Send startup notification to all log channels
+        try:
+            from utils.modules.sql import log_channel_sql
+            from datetime import datetime
         
-        log_channels = log_channel_sql.get_all_log_channels()
-        startup_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
-        startup_message = f"<b>🤖 Bot Started</b>\n\n" \
-                         f"✅ Bot is now online and ready\n" \
-                         f"⏰ Started at: <code>{startup_time}</code>"
+            log_channels = log_channel_sql.get_all_log_channels()
+            startup_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")
+            startup_message = f"<b>🤖 Bot Started</b>\n\n" \
+                             f"✅ Bot is now online and ready\n" \
+                             f"⏰ Started at: <code>{startup_time}</code>"
         
-        for log_channel in log_channels:
-            try:
-                updater.bot.send_message(log_channel.log_channel, startup_message, parse_mode=ParseMode.HTML)
-            except Exception as e:
-                LOGGER.warning(f"Failed to send startup message to log channel {log_channel.log_channel}: {e}")
+            for log_channel in log_channels:
+                try:
+                    updater.bot.send_message(log_channel.log_channel, startup_message, parse_mode=ParseMode.HTML)
+                except Exception as e:
+                    LOGGER.warning(f"Failed to send startup message to log channel {log_channel.log_channel}: {e}")
         
-        if log_channels:
-            LOGGER.info(f"Sent startup notification to {len(log_channels)} log channel(s)")
-    except Exception as e:
-        LOGGER.error(f"Error sending startup notifications: {e}")
-
-    updater.idle()
+            if log_channels:
+                LOGGER.info(f"Sent startup notification to {len(log_channels)} log channel(s)")
+        except Exception as e:
+            LOGGER.error(f"Error sending startup notifications: {e}")
+
+    if worker:
+        worker.idle()
+    elif core:
+        core.idle()
+    else:
+        updater.idle()
 
 
 if __name__ == '__main__':
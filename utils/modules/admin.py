@@ -4,16 +4,19 @@ from typing import Optional, List
 from telegram import Message, Chat, Update, Bot, User
 from telegram import ParseMode
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, Filters
+from telegram.ext import CommandHandler, Filters, MessageHandler
 from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import escape_markdown, mention_html
 
 from utils import dispatcher
 from utils.modules.disable import DisableAbleCommandHandler
-from utils.modules.helper_funcs.chat_status import bot_admin, can_promote, user_admin, can_pin
+from utils.modules.helper_funcs.chat_status import bot_admin, can_promote, user_admin, can_pin, cache_admin_list, \
+    invalidate_member_status, get_bot_member, invalidate_bot_member
 from utils.modules.helper_funcs.extraction import extract_user
 from utils.modules.log_channel import loggable
 
+ADMIN_CACHE_GROUP = -2
+
 
 @run_async
 @bot_admin
@@ -41,7 +44,7 @@ def promote(bot: Bot, update: Update, args: List[str]) -> str:
         return ""
 
     # set same perms as bot - bot can't assign higher perms than itself!
-    bot_member = chat.get_member(bot.id)
+    bot_member = get_bot_member(chat, bot.id)
 
     bot.promoteChatMember(chat_id, user_id,
                           can_change_info=bot_member.can_change_info,
@@ -52,6 +55,7 @@ def promote(bot: Bot, update: Update, args: List[str]) -> str:
                           can_restrict_members=bot_member.can_restrict_members,
                           can_pin_messages=bot_member.can_pin_messages,
                           can_promote_members=bot_member.can_promote_members)
+    invalidate_member_status(chat.id, user_id)
 
     message.reply_text("promoted🧡")
     return "<b>{}:</b>" \
@@ -100,6 +104,7 @@ def demote(bot: Bot, update: Update, args: List[str]) -> str:
                               can_restrict_members=False,
                               can_pin_messages=False,
                               can_promote_members=False)
+        invalidate_member_status(chat.id, user_id)
         message.reply_text("Successfully demoted!")
         return "<b>{}:</b>" \
                "\n#SENTRY #DEMOTED" \
@@ -177,7 +182,7 @@ def invite(bot: Bot, update: Update):
     if chat.username:
         update.effective_message.reply_text(chat.username)
     elif chat.type == chat.SUPERGROUP or chat.type == chat.CHANNEL:
-        bot_member = chat.get_member(bot.id)
+        bot_member = get_bot_member(chat, bot.id)
         if bot_member.can_invite_users:
             invitelink = bot.exportChatInviteLink(chat.id)
             update.effective_message.reply_text(invitelink)
@@ -190,6 +195,7 @@ def invite(bot: Bot, update: Update):
 @run_async
 def adminlist(bot: Bot, update: Update):
     administrators = update.effective_chat.get_administrators()
+    cache_admin_list(update.effective_chat.id, administrators)
     text = "Admins in *{}*:".format(update.effective_chat.title or "this chat")
     for admin in administrators:
         user = admin.user
@@ -211,6 +217,29 @@ def adminlist(bot: Bot, update: Update):
     update.effective_message.reply_text(text, parse_mode=ParseMode.MARKDOWN)
 
 
+@run_async
+@user_admin
+def refresh_admin_cache(bot: Bot, update: Update):
+    chat = update.effective_chat  # type: Optional[Chat]
+    invalidate_bot_member(chat.id)
+    cache_admin_list(chat.id, chat.get_administrators())
+    update.effective_message.reply_text("Admin list refreshed!")
+
+
+# NOT ASYNC - only touches the in-memory admin cache
+def member_changed(bot: Bot, update: Update):
+    chat = update.effective_chat  # type: Optional[Chat]
+    message = update.effective_message  # type: Optional[Message]
+    members = list(message.new_chat_members)
+    if message.left_chat_member:
+        members.append(message.left_chat_member)
+
+    for member in members:
+        invalidate_member_status(chat.id, member.id)
+        if member.id == bot.id:
+            invalidate_bot_member(chat.id)
+
+
 def __chat_settings__(chat_id, user_id):
     is_admin = dispatcher.bot.get_chat_member(chat_id, user_id).status in ("administrator", "creator")
     return """🛡️ *Admin Module*
@@ -238,6 +267,7 @@ __help__ = """
  - /invitelink: gets invitelink
  - /promote: promotes the user replied to
  - /demote: demotes the user replied to
+ - /admincache: refresh the admin list and my own rights, in case they were changed without using me
 """
 
 __mod_name__ = "Admin"
@@ -251,6 +281,9 @@ PROMOTE_HANDLER = CommandHandler("promote", promote, pass_args=True, filters=Fil
 DEMOTE_HANDLER = CommandHandler("demote", demote, pass_args=True, filters=Filters.group)
 
 ADMINLIST_HANDLER = DisableAbleCommandHandler("adminlist", adminlist, filters=Filters.group)
+ADMINCACHE_HANDLER = CommandHandler("admincache", refresh_admin_cache, filters=Filters.group)
+MEMBER_CHANGED_HANDLER = MessageHandler(Filters.status_update.new_chat_members
+                                       | Filters.status_update.left_chat_member, member_changed)
 
 dispatcher.add_handler(PIN_HANDLER)
 dispatcher.add_handler(UNPIN_HANDLER)
@@ -258,3 +291,5 @@ dispatcher.add_handler(INVITE_HANDLER)
 dispatcher.add_handler(PROMOTE_HANDLER)
 dispatcher.add_handler(DEMOTE_HANDLER)
 dispatcher.add_handler(ADMINLIST_HANDLER)
+dispatcher.add_handler(ADMINCACHE_HANDLER)
+dispatcher.add_handler(MEMBER_CHANGED_HANDLER, ADMIN_CACHE_GROUP)
@@ -3,20 +3,25 @@ from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, User
 from telegram.error import BadRequest
-from telegram.ext import Filters, MessageHandler, CommandHandler, run_async
+from telegram.ext import Filters, CommandHandler, run_async
 from telegram.utils.helpers import mention_html
 
 from utils import dispatcher
-from utils.modules.helper_funcs.chat_status import is_user_admin, user_admin, can_restrict
+from utils.modules.helper_funcs.capabilities import CAP_FLOOD
+from utils.modules.helper_funcs.chat_status import user_admin, can_restrict
+from utils.modules.helper_funcs.context import UpdateContext, get_context
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 from utils.modules.log_channel import loggable
 from utils.modules.sql import antiflood_sql as sql
 
 FLOOD_GROUP = 3
+MAX_FLOOD_WINDOW = 3600
 
 
-@run_async
+# NOT ASYNC - also the "antiflood" moderation pipeline stage
 @loggable
-def check_flood(bot: Bot, update: Update) -> str:
+def check_flood(bot: Bot, update: Update, context: UpdateContext = None) -> str:
     user = update.effective_user  # type: Optional[User]
     chat = update.effective_chat  # type: Optional[Chat]
     msg = update.effective_message  # type: Optional[Message]
@@ -25,7 +30,8 @@ def check_flood(bot: Bot, update: Update) -> str:
         return ""
 
     # ignore admins
-    if is_user_admin(chat, user.id):
+    context = context or get_context(update, bot)
+    if context.user_is_admin:
         sql.update_flood(chat.id, None)
         return ""
 
@@ -80,14 +86,27 @@ def set_flood(bot: Bot, update: Update, args: List[str]) -> str:
                 message.reply_text("Antiflood has to be either 0 (disabled), or a number bigger than 3!")
                 return ""
 
+            window = sql.DEF_WINDOW
+            if len(args) >= 2:
+                if not args[1].isdigit() or not 0 < int(args[1]) <= MAX_FLOOD_WINDOW:
+                    message.reply_text("The time window has to be a number of seconds between 1 and {}!".format(
+                        MAX_FLOOD_WINDOW))
+                    return ""
+                window = int(args[1])
+
+            sql.set_flood(chat.id, amount, window)
+            if window:
+                message.reply_text("Message control {} in {} seconds has been added to count ".format(amount,
+                                                                                                   window))
             else:
-                sql.set_flood(chat.id, amount)
                 message.reply_text("Message control {} has been added to count ".format(amount))
-                return "<b>{}:</b>" \
-                       "\n#SENTRY #SETFLOOD" \
-                       "\n<b>Admin:</b> {}" \
-                       "\nSet antiflood to <code>{}</code>.".format(html.escape(chat.title),
-                                                                    mention_html(user.id, user.first_name), amount)
+            return "<b>{}:</b>" \
+                   "\n#SENTRY #SETFLOOD" \
+                   "\n<b>Admin:</b> {}" \
+                   "\nSet antiflood to <code>{}</code>{}.".format(html.escape(chat.title),
+                                                                 mention_html(user.id, user.first_name), amount,
+                                                                 " in <code>{}s</code>".format(window) if window
+                                                                 else "")
 
         else:
             message.reply_text("I don't understand what you're saying .... Either use the number or use Yes-No")
@@ -99,9 +118,12 @@ def set_flood(bot: Bot, update: Update, args: List[str]) -> str:
 def flood(bot: Bot, update: Update):
     chat = update.effective_chat  # type: Optional[Chat]
 
-    limit = sql.get_flood_limit(chat.id)
+    limit, window = sql.get_flood_setting(chat.id)
     if limit == 0:
         update.effective_message.reply_text("I am not doing message control right now!")
+    elif window:
+        update.effective_message.reply_text(
+            "I'll leave the bun to the person who sends more than {} messages in {} seconds.".format(limit, window))
     else:
         update.effective_message.reply_text(
             " {} I'll leave the bun to the person who sends the message more at the same time.".format(limit))
@@ -112,9 +134,11 @@ def __migrate__(old_chat_id, new_chat_id):
 
 
 def __chat_settings__(chat_id, user_id):
-    limit = sql.get_flood_limit(chat_id)
+    limit, window = sql.get_flood_setting(chat_id)
     if limit == 0:
         status = "Disabled"
+    elif window:
+        status = f"Enabled ({limit} messages in {window} seconds)"
     else:
         status = f"Enabled ({limit} messages)"
     
@@ -133,15 +157,17 @@ __help__ = """
  - /flood: To know your current message control..
 
 *Admin only:*
- - /setflood <int/'no'/'off'>: enables or disables flood control
+ - /setflood <int/'no'/'off'> [seconds]: enables or disables flood control. With seconds, anyone sending more \
+than <int> messages in that many seconds is removed; without, it counts messages in a row.
 """
 
 __mod_name__ = "AntiFlood"
 
-FLOOD_BAN_HANDLER = MessageHandler(Filters.all & ~Filters.status_update & Filters.group, check_flood)
+FLOOD_BAN_HANDLER = CapabilityMessageHandler(Filters.all & ~Filters.status_update & Filters.group,
+                                             run_async(check_flood), CAP_FLOOD)
 SET_FLOOD_HANDLER = CommandHandler("setflood", set_flood, pass_args=True, filters=Filters.group)
 FLOOD_HANDLER = CommandHandler("flood", flood, filters=Filters.group)
 
-dispatcher.add_handler(FLOOD_BAN_HANDLER, FLOOD_GROUP)
+add_moderation_handler("antiflood", FLOOD_BAN_HANDLER, FLOOD_GROUP, stage=check_flood)
 dispatcher.add_handler(SET_FLOOD_HANDLER)
 dispatcher.add_handler(FLOOD_HANDLER)
@@ -9,9 +9,11 @@ from telegram.ext import CommandHandler, run_async
 from utils import dispatcher, LOGGER
 from utils.__main__ import DATA_IMPORT
 from utils.modules.helper_funcs.chat_status import user_admin
+from utils.modules.helper_funcs.executor import long_running
 
 
 @run_async
+@long_running
 @user_admin
 def import_data(bot: Bot, update):
     msg = update.effective_message  # type: Optional[Message]
@@ -60,6 +62,7 @@ def import_data(bot: Bot, update):
 
 
 @run_async
+@long_running
 @user_admin
 def export_data(bot: Bot, update: Update):
     msg = update.effective_message  # type: Optional[Message]
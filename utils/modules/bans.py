@@ -10,7 +10,7 @@ from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, User
 from utils import dispatcher, BAN_STICKER, LOGGER
 from utils.modules.disable import DisableAbleCommandHandler
 from utils.modules.helper_funcs.chat_status import bot_admin, user_admin, is_user_ban_protected, can_restrict, \
-    is_user_admin, is_user_in_chat, is_bot_admin
+    is_user_admin, is_user_in_chat, is_bot_admin, get_bot_member
 from utils.modules.helper_funcs.extraction import extract_user_and_text
 from utils.modules.helper_funcs.string_handling import extract_time
 from utils.modules.log_channel import loggable
@@ -335,7 +335,7 @@ def rban(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't restrict people there! Make sure I'm admin and can ban users.")
         return
 
@@ -402,7 +402,7 @@ def runban(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't unrestrict people there! Make sure I'm admin and can unban users.")
         return
 
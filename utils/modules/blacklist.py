@@ -1,17 +1,20 @@
 import html
-import re
 from typing import Optional, List
 
 from telegram import Message, Chat, Update, Bot, ParseMode
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, MessageHandler, Filters, run_async
+from telegram.ext import CommandHandler, Filters, run_async
 
 import utils.modules.sql.blacklist_sql as sql
 from utils import dispatcher, LOGGER
 from utils.modules.disable import DisableAbleCommandHandler
-from utils.modules.helper_funcs.chat_status import user_admin, user_not_admin
-from utils.modules.helper_funcs.extraction import extract_text
+from utils.modules.helper_funcs import aio, catchup
+from utils.modules.helper_funcs.capabilities import CAP_BLACKLIST
+from utils.modules.helper_funcs.chat_status import user_admin
+from utils.modules.helper_funcs.context import UpdateContext, get_context
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
 from utils.modules.helper_funcs.misc import split_message
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 
 BLACKLIST_GROUP = 11
 
@@ -107,27 +110,46 @@ def unblacklist(bot: Bot, update: Update):
         msg.reply_text("Tell me which words you would like to remove from the blacklist.")
 
 
-@run_async
-@user_not_admin
-def del_blacklist(bot: Bot, update: Update):
-    chat = update.effective_chat  # type: Optional[Chat]
-    message = update.effective_message  # type: Optional[Message]
-    to_match = extract_text(message)
+# NOT ASYNC - also the "blacklist" moderation pipeline stage
+def del_blacklist(bot: Bot, update: Update, context: UpdateContext = None) -> bool:
+    context = context or get_context(update, bot)
+    to_match = context.text
     if not to_match:
+        return False
+
+    if not sql.find_blacklisted(context.chat.id, to_match) or not context.user or context.user_is_admin:
+        return False
+
+    try:
+        context.message.delete()
+    except BadRequest as excp:
+        if excp.message == "Message to delete not found":
+            pass
+        else:
+            LOGGER.exception("Error while deleting blacklist message.")
+    return True
+
+
+# ASYNC_CORE version of del_blacklist: matching is in memory, so only the admin check leaves the event loop
+async def del_blacklist_async(client: aio.AsyncBotClient, update: Update):
+    if catchup.stale((update,)):
+        return  # catch-up runs the "blacklist" stage on it instead
+
+    context = get_context(update, dispatcher.bot)
+    to_match = context.text
+    if not to_match or not context.user or not sql.find_blacklisted(context.chat.id, to_match):
         return
 
-    chat_filters = sql.get_chat_blacklist(chat.id)
-    for trigger in chat_filters:
-        pattern = r"( |^|[^\w])" + re.escape(trigger) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            try:
-                message.delete()
-            except BadRequest as excp:
-                if excp.message == "Message to delete not found":
-                    pass
-                else:
-                    LOGGER.exception("Error while deleting blacklist message.")
-            break
+    if await aio.run_sync(lambda: context.user_is_admin):
+        return
+
+    try:
+        await client.delete_message(context.chat.id, context.message.message_id)
+    except BadRequest as excp:
+        if excp.message == "Message to delete not found":
+            pass
+        else:
+            LOGGER.exception("Error while deleting blacklist message.")
 
 
 def __migrate__(old_chat_id, new_chat_id):
@@ -176,10 +198,15 @@ BLACKLIST_HANDLER = DisableAbleCommandHandler("blacklist", blacklist, filters=Fi
                                               admin_ok=True)
 ADD_BLACKLIST_HANDLER = CommandHandler("addblacklist", add_blacklist, filters=Filters.group)
 UNBLACKLIST_HANDLER = CommandHandler(["unblacklist", "rmblacklist"], unblacklist, filters=Filters.group)
-BLACKLIST_DEL_HANDLER = MessageHandler(
-    (Filters.text | Filters.command | Filters.sticker | Filters.photo) & Filters.group, del_blacklist)
+BLACKLIST_FILTER = (Filters.text | Filters.command | Filters.sticker | Filters.photo) & Filters.group
+BLACKLIST_DEL_HANDLER = CapabilityMessageHandler(BLACKLIST_FILTER, run_async(del_blacklist), CAP_BLACKLIST)
 
 dispatcher.add_handler(BLACKLIST_HANDLER)
 dispatcher.add_handler(ADD_BLACKLIST_HANDLER)
 dispatcher.add_handler(UNBLACKLIST_HANDLER)
-dispatcher.add_handler(BLACKLIST_DEL_HANDLER, group=BLACKLIST_GROUP)
+if aio.ASYNC_ENABLED:
+    aio.add_async_handler(CapabilityMessageHandler(BLACKLIST_FILTER, del_blacklist_async, CAP_BLACKLIST),
+                          BLACKLIST_GROUP)
+    add_moderation_handler("blacklist", BLACKLIST_DEL_HANDLER, BLACKLIST_GROUP, stage=del_blacklist, register=False)
+else:
+    add_moderation_handler("blacklist", BLACKLIST_DEL_HANDLER, BLACKLIST_GROUP, stage=del_blacklist)
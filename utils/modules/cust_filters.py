@@ -1,19 +1,24 @@
-import re
+from collections import namedtuple
+from functools import lru_cache
 from typing import Optional
 
 import telegram
 from telegram import ParseMode, InlineKeyboardMarkup, Message, Chat
 from telegram import Update, Bot
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, MessageHandler, DispatcherHandlerStop, run_async
+from telegram.ext import CommandHandler, DispatcherHandlerStop, run_async
 from telegram.utils.helpers import escape_markdown
 
 from utils import dispatcher, LOGGER
 from utils.modules.disable import DisableAbleCommandHandler
+from utils.modules.helper_funcs.capabilities import CAP_FILTERS
 from utils.modules.helper_funcs.chat_status import user_admin
-from utils.modules.helper_funcs.extraction import extract_text
+from utils.modules.helper_funcs.context import UpdateContext, get_context
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
 from utils.modules.helper_funcs.misc import build_keyboard
+from utils.modules.helper_funcs.outbound import low_priority
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 from utils.modules.helper_funcs.string_handling import split_quotes, button_markdown_parser
 from utils.modules.sql import cust_filters_sql as sql
 
@@ -185,74 +190,89 @@ def stop_filter(bot: Bot, update: Update):
     update.effective_message.reply_text("That's not a current filter - run /filters for all active filters.")
 
 
-@run_async
-def reply_filter(bot: Bot, update: Update):
+FilterResponse = namedtuple("FilterResponse", ["method", "payload", "kwargs"])
+
+
+@lru_cache(maxsize=2048)
+def build_filter_response(filt: sql.FilterData) -> FilterResponse:
+    # keyed on the (immutable) filter data, so an edited filter simply misses and the old entry ages out
+    ad_filter = ""
+    keyboard = InlineKeyboardMarkup(build_keyboard(filt.buttons))
+    if filt.is_sticker:
+        return FilterResponse("reply_sticker", filt.reply, {})
+    elif filt.is_document:
+        return FilterResponse("reply_document", filt.reply, {})
+    elif filt.is_image:
+        if len(filt.buttons) > 0:
+            return FilterResponse("reply_photo", filt.reply, {"reply_markup": keyboard})
+        return FilterResponse("reply_photo", filt.reply, {})
+    elif filt.is_audio:
+        return FilterResponse("reply_audio", filt.reply, {})
+    elif filt.is_voice:
+        return FilterResponse("reply_voice", filt.reply, {})
+    elif filt.is_video:
+        return FilterResponse("reply_video", filt.reply, {})
+    elif filt.has_markdown:
+        should_preview_disabled = True
+        if "telegra.ph" in filt.reply or "youtu.be" in filt.reply:
+            should_preview_disabled = False
+
+        return FilterResponse("reply_text", ad_filter + "\n" + filt.reply,
+                              {"parse_mode": ParseMode.MARKDOWN,
+                               "disable_web_page_preview": should_preview_disabled,
+                               "reply_markup": keyboard})
+    else:
+        # LEGACY - all new filters will have has_markdown set to True.
+        return FilterResponse("reply_text", ad_filter + "\n" + filt.reply, {})
+
+
+# NOT ASYNC - also the "filters" moderation pipeline stage
+@low_priority
+def reply_filter(bot: Bot, update: Update, context: UpdateContext = None):
     chat = update.effective_chat  # type: Optional[Chat]
     message = update.effective_message  # type: Optional[Message]
-    to_match = extract_text(message)
+    if not sql.get_chat_triggers(chat.id):
+        return
+
+    to_match = (context or get_context(update, bot)).text
     if not to_match:
         return
 
     # my custom thing
     if message.reply_to_message:
         message = message.reply_to_message
-    ad_filter = ""
     # my custom thing
 
-    chat_filters = sql.get_chat_triggers(chat.id)
-    for keyword in chat_filters:
-        pattern = r"( |^|[^\w])" + re.escape(keyword) + r"( |$|[^\w])"
-        if re.search(pattern, to_match, flags=re.IGNORECASE):
-            filt = sql.get_filter(chat.id, keyword)
-            buttons = sql.get_buttons(chat.id, filt.keyword)
-            if filt.is_sticker:
-                message.reply_sticker(filt.reply)
-            elif filt.is_document:
-                message.reply_document(filt.reply)
-            elif filt.is_image:
-                if len(buttons) > 0:
-                    keyb = build_keyboard(buttons)
-                    keyboard = InlineKeyboardMarkup(keyb)
-                    message.reply_photo(filt.reply, reply_markup=keyboard)
-                else:
-                    message.reply_photo(filt.reply)
-            elif filt.is_audio:
-                message.reply_audio(filt.reply)
-            elif filt.is_voice:
-                message.reply_voice(filt.reply)
-            elif filt.is_video:
-                message.reply_video(filt.reply)
-            elif filt.has_markdown:
-                keyb = build_keyboard(buttons)
-                keyboard = InlineKeyboardMarkup(keyb)
-
-                should_preview_disabled = True
-                if "telegra.ph" in filt.reply or "youtu.be" in filt.reply:
-                    should_preview_disabled = False
-
-                try:
-                    message.reply_text(ad_filter + "\n" + filt.reply, parse_mode=ParseMode.MARKDOWN,
-                                       disable_web_page_preview=should_preview_disabled,
-                                       reply_markup=keyboard)
-                except BadRequest as excp:
-                    if excp.message == "Unsupported url protocol":
-                        message.reply_text("You seem to be trying to use an unsupported url protocol. Telegram "
-                                           "doesn't support buttons for some protocols, such as tg://. Please try "
-                                           "again, or ask in @MarieSupport for help.")
-                    elif excp.message == "Reply message not found":
-                        bot.send_message(chat.id, filt.reply, parse_mode=ParseMode.MARKDOWN,
-                                         disable_web_page_preview=True,
-                                         reply_markup=keyboard)
-                    else:
-                        message.reply_text("This note could not be sent, as it is incorrectly formatted. Ask in "
-                                           "@MarieSupport if you can't figure out why!")
-                        LOGGER.warning("Message %s could not be parsed", str(filt.reply))
-                        LOGGER.exception("Could not parse filter %s in chat %s", str(filt.keyword), str(chat.id))
-
-            else:
-                # LEGACY - all new filters will have has_markdown set to True.
-                message.reply_text(ad_filter + "\n" + filt.reply)
-            break
+    keyword = sql.match_filter(chat.id, to_match)
+    if not keyword:
+        return
+
+    filt = sql.get_filter_data(chat.id, keyword)
+    if not filt:
+        return
+
+    response = build_filter_response(filt)
+    send = getattr(message, response.method)
+    if not (response.method == "reply_text" and filt.has_markdown):
+        send(response.payload, **response.kwargs)
+        return
+
+    try:
+        send(response.payload, **response.kwargs)
+    except BadRequest as excp:
+        if excp.message == "Unsupported url protocol":
+            message.reply_text("You seem to be trying to use an unsupported url protocol. Telegram "
+                               "doesn't support buttons for some protocols, such as tg://. Please try "
+                               "again, or ask in @MarieSupport for help.")
+        elif excp.message == "Reply message not found":
+            bot.send_message(chat.id, filt.reply, parse_mode=ParseMode.MARKDOWN,
+                             disable_web_page_preview=True,
+                             reply_markup=response.kwargs["reply_markup"])
+        else:
+            message.reply_text("This note could not be sent, as it is incorrectly formatted. Ask in "
+                               "@MarieSupport if you can't figure out why!")
+            LOGGER.warning("Message %s could not be parsed", str(filt.reply))
+            LOGGER.exception("Could not parse filter %s in chat %s", str(filt.keyword), str(chat.id))
 
 
 def __stats__():
@@ -301,9 +321,10 @@ __mod_name__ = "Filters"
 FILTER_HANDLER = CommandHandler("filter", filters)
 STOP_HANDLER = CommandHandler("stop", stop_filter)
 LIST_HANDLER = DisableAbleCommandHandler("filters", list_handlers, admin_ok=True)
-CUST_FILTER_HANDLER = MessageHandler(CustomFilters.has_text, reply_filter, edited_updates=True)
+CUST_FILTER_HANDLER = CapabilityMessageHandler(CustomFilters.has_text, run_async(reply_filter), CAP_FILTERS,
+                                               edited_updates=True)
 
 dispatcher.add_handler(FILTER_HANDLER)
 dispatcher.add_handler(STOP_HANDLER)
 dispatcher.add_handler(LIST_HANDLER)
-dispatcher.add_handler(CUST_FILTER_HANDLER, HANDLER_GROUP)
+add_moderation_handler("filters", CUST_FILTER_HANDLER, HANDLER_GROUP, stage=reply_filter)
@@ -6,14 +6,14 @@ from telegram.ext import CommandHandler, RegexHandler, Filters
 from telegram.utils.helpers import escape_markdown
 
 from utils import dispatcher
-from utils.modules.helper_funcs.handlers import CMD_STARTERS
+from utils.modules.helper_funcs.context import CMD_STARTERS, get_context
 from utils.modules.helper_funcs.misc import is_module_loaded
 
 FILENAME = __name__.rsplit(".", 1)[-1]
 
 # If module is due to be loaded, then setup all the magical handlers
 if is_module_loaded(FILENAME):
-    from utils.modules.helper_funcs.chat_status import user_admin, is_user_admin
+    from utils.modules.helper_funcs.chat_status import user_admin
     from telegram.ext.dispatcher import run_async
 
     from utils.modules.sql import disable_sql as sql
@@ -37,22 +37,23 @@ if is_module_loaded(FILENAME):
 
         def check_update(self, update):
             chat = update.effective_chat  # type: Optional[Chat]
-            user = update.effective_user  # type: Optional[User]
-            if super().check_update(update):
+            result = super().check_update(update)
+            if result:
                 # Should be safe since check_update passed.
-                command = update.effective_message.text_html.split(None, 1)[0][1:].split('@')[0]
+                context = get_context(update)
+                command = context.command.name
 
                 # Skip disable check for private chats
                 if chat.type == "private":
-                    return True
+                    return result
 
                 # disabled, admincmd, user admin
                 if sql.is_command_disabled(chat.id, command):
-                    return command in ADMIN_CMDS and is_user_admin(chat, user.id)
+                    return command in ADMIN_CMDS and context.user_is_admin and result
 
                 # not disabled
                 else:
-                    return True
+                    return result
 
             return False
 
@@ -3,17 +3,23 @@ from io import BytesIO
 from typing import Optional, List
 
 from telegram import Message, Update, Bot, User, Chat, ParseMode
-from telegram.error import BadRequest, TelegramError
-from telegram.ext import run_async, CommandHandler, MessageHandler, Filters
+from telegram.error import BadRequest
+from telegram.ext import run_async, CommandHandler, Filters
 from telegram.utils.helpers import mention_html
 
 import utils.modules.sql.global_bans_sql as sql
-from utils import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, STRICT_GBAN
-from utils.modules.helper_funcs.chat_status import user_admin, is_user_admin
+from utils import dispatcher, SUDO_USERS, SUPPORT_USERS, STRICT_GBAN, TARGETED_GBAN
+from utils.modules.helper_funcs import fanout
+from utils.modules.helper_funcs.capabilities import CAP_GBAN
+from utils.modules.helper_funcs.chat_status import user_admin, get_bot_member
+from utils.modules.helper_funcs.context import UpdateContext, get_context
 from utils.modules.helper_funcs.extraction import extract_user, extract_user_and_text
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
 from utils.modules.helper_funcs.misc import send_to_list
-from utils.modules.sql.users_sql import get_all_chats
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
+from utils.modules.sql import fanout_sql
+from utils.modules.sql.users_sql import get_all_chats, get_user_chats
 
 GBAN_ENFORCE_GROUP = 6
 
@@ -43,6 +49,15 @@ UNGBAN_ERRORS = {
 }
 
 
+def gban_target_chats(user_id) -> List[str]:
+    if TARGETED_GBAN and STRICT_GBAN:
+        # the enforcer catches the user in chats we haven't seen them in, as soon as they join or talk
+        chat_ids = get_user_chats(user_id)
+    else:
+        chat_ids = [chat.chat_id for chat in get_all_chats()]
+    return [chat_id for chat_id in chat_ids if sql.does_chat_gban(chat_id)]
+
+
 @run_async
 def gban(bot: Bot, update: Update, args: List[str]):
     message = update.effective_message  # type: Optional[Message]
@@ -107,32 +122,11 @@ def gban(bot: Bot, update: Update, args: List[str]):
                 html=True)
 
     sql.gban_user(user_id, user_chat.username or user_chat.first_name, reason)
+    fanout.cancel_user_jobs("ungban", user_id)
 
-    chats = get_all_chats()
-    for chat in chats:
-        chat_id = chat.chat_id
-
-        # Check if this group has disabled gbans
-        if not sql.does_chat_gban(chat_id):
-            continue
-
-        try:
-            bot.kick_chat_member(chat_id, user_id)
-        except BadRequest as excp:
-            if excp.message in GBAN_ERRORS:
-                pass
-            else:
-                message.reply_text("Could not gban due to: {}".format(excp.message))
-                send_to_list(bot, SUDO_USERS + SUPPORT_USERS, "Could not gban due to: {}".format(excp.message))
-                sql.ungban_user(user_id)
-                return
-        except TelegramError:
-            pass
-
-    send_to_list(bot, SUDO_USERS + SUPPORT_USERS, 
-                  "{} has been successfully gbanned!".format(mention_html(user_chat.id, user_chat.first_name)),
-                html=True)
-    message.reply_text("Person has been gbanned.")
+    chats = gban_target_chats(user_id)
+    fanout.start_job(bot, "gban", user_id, chats, user_chat.first_name, banner.id)
+    message.reply_text("Person has been gbanned. Enforcing it in {} chats now.".format(len(chats)))
 
 
 @run_async
@@ -168,37 +162,44 @@ def ungban(bot: Bot, update: Update, args: List[str]):
                                                                     user_chat.id),
                  html=True)
 
-    chats = get_all_chats()
-    for chat in chats:
-        chat_id = chat.chat_id
-
-        # Check if this group has disabled gbans
-        if not sql.does_chat_gban(chat_id):
-            continue
-
-        try:
-            member = bot.get_chat_member(chat_id, user_id)
-            if member.status == 'kicked':
-                bot.unban_chat_member(chat_id, user_id)
-
-        except BadRequest as excp:
-            if excp.message in UNGBAN_ERRORS:
-                pass
-            else:
-                message.reply_text("Could not un-gban due to: {}".format(excp.message))
-                bot.send_message(OWNER_ID, "Could not un-gban due to: {}".format(excp.message))
-                return
-        except TelegramError:
-            pass
-
     sql.ungban_user(user_id)
+    fanout.cancel_user_jobs("gban", user_id)
+
+    chats = gban_target_chats(user_id)
+    fanout.start_job(bot, "ungban", user_id, chats, user_chat.first_name, banner.id)
+    message.reply_text("This person has been un-gbanned and pardon is granted! Lifting the bans in {} chats "
+                       "now.".format(len(chats)))
+
+
+# NOT ASYNC - runs on the fanout pool, once per chat
+def fanout_gban(bot: Bot, chat_id: str, job):
+    # the chat may have opted out, or the user been pardoned, since the job started
+    if sql.does_chat_gban(chat_id) and sql.is_user_gbanned(job.user_id):
+        bot.kick_chat_member(chat_id, job.user_id)
 
-    send_to_list(bot, SUDO_USERS + SUPPORT_USERS, 
-                  "{} has been pardoned from gban!".format(mention_html(user_chat.id, 
-                                                                         user_chat.first_name)),
-                  html=True)
 
-    message.reply_text("This person has been un-gbanned and pardon is granted!")
+# NOT ASYNC - see fanout_gban
+def fanout_ungban(bot: Bot, chat_id: str, job):
+    if sql.does_chat_gban(chat_id) and not sql.is_user_gbanned(job.user_id):
+        member = bot.get_chat_member(chat_id, job.user_id)
+        if member.status == 'kicked':
+            bot.unban_chat_member(chat_id, job.user_id)
+
+
+def finish_gban(bot: Bot, job):
+    if job.status == fanout_sql.JOB_DONE:
+        send_to_list(bot, SUDO_USERS + SUPPORT_USERS,
+                     "{} has been successfully gbanned! ({} chats, {} failed)".format(
+                         mention_html(job.user_id, job.user_name or str(job.user_id)), job.total, job.failed),
+                     html=True)
+
+
+def finish_ungban(bot: Bot, job):
+    if job.status == fanout_sql.JOB_DONE:
+        send_to_list(bot, SUDO_USERS + SUPPORT_USERS,
+                     "{} has been pardoned from gban! ({} chats, {} failed)".format(
+                         mention_html(job.user_id, job.user_name or str(job.user_id)), job.total, job.failed),
+                     html=True)
 
 
 @run_async
@@ -221,33 +222,39 @@ def gbanlist(bot: Bot, update: Update):
                                                 caption="Here is the list of currently gbanned users.")
 
 
-def check_and_ban(update, user_id, should_message=True):
+def check_and_ban(update, user_id, should_message=True) -> bool:
     if sql.is_user_gbanned(user_id):
         update.effective_chat.kick_member(user_id)
         if should_message:
             update.effective_message.reply_text("This is a bad person, they shouldn't be here!")
+        return True
+    return False
 
 
-@run_async
-def enforce_gban(bot: Bot, update: Update):
+# NOT ASYNC - also the "gban" moderation pipeline stage
+def enforce_gban(bot: Bot, update: Update, context: UpdateContext = None) -> bool:
     # Not using @restrict handler to avoid spamming - just ignore if cant gban.
-    if sql.does_chat_gban(update.effective_chat.id) and update.effective_chat.get_member(bot.id).can_restrict_members:
+    if sql.does_chat_gban(update.effective_chat.id) and get_bot_member(update.effective_chat, bot.id).can_restrict_members:
+        context = context or get_context(update, bot)
         user = update.effective_user  # type: Optional[User]
-        chat = update.effective_chat  # type: Optional[Chat]
         msg = update.effective_message  # type: Optional[Message]
+        banned = False
 
-        if user and not is_user_admin(chat, user.id):
-            check_and_ban(update, user.id)
+        if user and not context.is_admin(user.id):
+            banned |= check_and_ban(update, user.id)
 
         if msg.new_chat_members:
             new_members = update.effective_message.new_chat_members
             for mem in new_members:
-                check_and_ban(update, mem.id)
+                banned |= check_and_ban(update, mem.id)
 
         if msg.reply_to_message:
             user = msg.reply_to_message.from_user  # type: Optional[User]
-            if user and not is_user_admin(chat, user.id):
-                check_and_ban(update, user.id, should_message=False)
+            if user and not context.is_admin(user.id):
+                banned |= check_and_ban(update, user.id, should_message=False)
+
+        return banned
+    return False
 
 
 @run_async
@@ -330,7 +337,10 @@ GBAN_LIST = CommandHandler("gbanlist", gbanlist,
 
 GBAN_STATUS = CommandHandler("gbanstat", gbanstat, pass_args=True, filters=Filters.group)
 
-GBAN_ENFORCER = MessageHandler(Filters.all & Filters.group, enforce_gban)
+GBAN_ENFORCER = CapabilityMessageHandler(Filters.all & Filters.group, run_async(enforce_gban), CAP_GBAN)
+
+fanout.register_action("gban", fanout_gban, GBAN_ERRORS, finish_gban)
+fanout.register_action("ungban", fanout_ungban, UNGBAN_ERRORS, finish_ungban)
 
 dispatcher.add_handler(GBAN_HANDLER)
 dispatcher.add_handler(UNGBAN_HANDLER)
@@ -338,4 +348,4 @@ dispatcher.add_handler(GBAN_LIST)
 dispatcher.add_handler(GBAN_STATUS)
 
 if STRICT_GBAN:  # enforce GBANS if this is set
-    dispatcher.add_handler(GBAN_ENFORCER, GBAN_ENFORCE_GROUP)
+    add_moderation_handler("gban", GBAN_ENFORCER, GBAN_ENFORCE_GROUP, stage=enforce_gban)
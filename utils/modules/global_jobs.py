@@ -0,0 +1,55 @@
+import html
+import time
+from typing import List
+
+from telegram import Bot, Update, ParseMode
+from telegram.ext import run_async, CommandHandler
+from telegram.utils.helpers import mention_html
+
+from utils import dispatcher
+from utils.modules.helper_funcs import fanout
+from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.sql import fanout_sql as sql
+
+
+@run_async
+def gjobs(bot: Bot, update: Update, args: List[str]):
+    message = update.effective_message
+
+    if len(args) >= 2 and args[0].lower() == "cancel":
+        if not args[1].isdigit():
+            message.reply_text("Give me the number of the job to cancel.")
+        elif fanout.cancel_job(int(args[1])):
+            message.reply_text("Cancelling job #{}.".format(args[1]))
+        else:
+            message.reply_text("There's no running job #{}.".format(args[1]))
+        return
+
+    progress = fanout.get_progress()
+    if not progress:
+        message.reply_text("No global jobs running.")
+        return
+
+    text = "<b>Running global jobs:</b>"
+    for job, done, failed in progress:
+        elapsed = max(1, time.time() - job.started)
+        text += "\n#{} <code>{}</code> {}: {}/{} chats, {} failed, {:.1f}/s".format(
+            job.job_id, job.kind, mention_html(job.user_id, html.escape(job.user_name or str(job.user_id))),
+            done + failed, job.total, failed, (done + failed) / elapsed)
+    message.reply_text(text, parse_mode=ParseMode.HTML)
+
+
+def __startup__(bot: Bot):
+    fanout.resume_jobs(bot)
+
+
+def __stats__():
+    return "{} global jobs running.".format(sql.num_running_jobs())
+
+
+__mod_name__ = "Global Jobs"
+
+GJOBS_HANDLER = CommandHandler("gjobs", gjobs, pass_args=True,
+                               filters=CustomFilters.sudo_filter | CustomFilters.support_filter)
+
+dispatcher.add_handler(GJOBS_HANDLER)
@@ -6,10 +6,12 @@ from telegram.error import BadRequest, TelegramError
 from telegram.ext import run_async, CommandHandler, MessageHandler, Filters
 from telegram.utils.helpers import mention_html
 from utils import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, STRICT_GBAN
+from utils.modules.helper_funcs import fanout
 from utils.modules.helper_funcs.chat_status import user_admin, is_user_admin
 from utils.modules.helper_funcs.extraction import extract_user, extract_user_and_text
 from utils.modules.helper_funcs.filters import CustomFilters
 from utils.modules.helper_funcs.misc import send_to_list
+from utils.modules.sql import fanout_sql
 from utils.modules.sql.users_sql import get_all_chats
 
 GKICK_ERRORS = {
@@ -55,19 +57,25 @@ def gkick(bot: Bot, update: Update, args: List[str]):
     if int(user_id) == bot.id:
         message.reply_text("OHH... Let me kick myself.. No way... ")
         return
-    chats = get_all_chats()
+    chats = [chat.chat_id for chat in get_all_chats()]
     message.reply_text("Globally kicking user @{}".format(user_chat.username))
-    for chat in chats:
-        try:
-             bot.unban_chat_member(chat.chat_id, user_id)  # Unban_member = kick (and not ban)
-        except BadRequest as excp:
-            if excp.message in GKICK_ERRORS:
-                pass
-            else:
-                message.reply_text("User cannot be Globally kicked because: {}".format(excp.message))
-                return
-        except TelegramError:
-            pass
+    fanout.start_job(bot, "gkick", user_id, chats, user_chat.first_name, update.effective_user.id)
+
+
+# NOT ASYNC - runs on the fanout pool, once per chat
+def fanout_gkick(bot: Bot, chat_id: str, job):
+    bot.unban_chat_member(chat_id, job.user_id)  # Unban_member = kick (and not ban)
+
+
+def finish_gkick(bot: Bot, job):
+    if job.status == fanout_sql.JOB_DONE:
+        send_to_list(bot, SUDO_USERS + SUPPORT_USERS,
+                     "{} has been globally kicked. ({} chats, {} failed)".format(
+                         mention_html(job.user_id, job.user_name or str(job.user_id)), job.total, job.failed),
+                     html=True)
+
+
+fanout.register_action("gkick", fanout_gkick, GKICK_ERRORS, finish_gkick)
 
 GKICK_HANDLER = CommandHandler("gkick", gkick, pass_args=True,
                               filters=CustomFilters.sudo_filter | CustomFilters.support_filter)
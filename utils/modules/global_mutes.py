@@ -3,20 +3,60 @@ from io import BytesIO
 from typing import Optional, List
 
 from telegram import Message, Update, Bot, User, Chat
-from telegram.error import BadRequest, TelegramError
-from telegram.ext import run_async, CommandHandler, MessageHandler, Filters
+from telegram.error import BadRequest
+from telegram.ext import run_async, CommandHandler, Filters
 from telegram.utils.helpers import mention_html
 
 import utils.modules.sql.global_mutes_sql as sql
-from utils import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, STRICT_GMUTE
-from utils.modules.helper_funcs.chat_status import user_admin, is_user_admin
+from utils import dispatcher, SUDO_USERS, SUPPORT_USERS, STRICT_GMUTE, TARGETED_GBAN
+from utils.modules.helper_funcs import fanout
+from utils.modules.helper_funcs.capabilities import CAP_GMUTE
+from utils.modules.helper_funcs.chat_status import user_admin, get_bot_member
+from utils.modules.helper_funcs.context import UpdateContext, get_context
 from utils.modules.helper_funcs.extraction import extract_user, extract_user_and_text
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
 from utils.modules.helper_funcs.misc import send_to_list
-from utils.modules.sql.users_sql import get_all_chats
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
+from utils.modules.sql import fanout_sql
+from utils.modules.sql.users_sql import get_all_chats, get_user_chats
 
 GMUTE_ENFORCE_GROUP = 6
 
+GMUTE_ERRORS = {
+    "User is an administrator of the chat",
+    "Chat not found",
+    "Not enough rights to restrict/unrestrict chat member",
+    "User_not_participant",
+    "Peer_id_invalid",  # Suspect this happens when a group is suspended by telegram.
+    "Group chat was deactivated",
+    "Need to be inviter of a user to kick it from a basic group",
+    "Chat_admin_required",
+    "Only the creator of a basic group can kick group administrators",
+    "Method is available only for supergroups",
+    "Can't demote chat creator",
+}
+
+UNGMUTE_ERRORS = {
+    "User is an administrator of the chat",
+    "Chat not found",
+    "Not enough rights to restrict/unrestrict chat member",
+    "User_not_participant",
+    "Method is available for supergroup and channel chats only",
+    "Not in the chat",
+    "Channel_private",
+    "Chat_admin_required",
+}
+
+
+def gmute_target_chats(user_id) -> List[str]:
+    if TARGETED_GBAN and STRICT_GMUTE:
+        # the enforcer catches the user in chats we haven't seen them in, as soon as they join or talk
+        chat_ids = get_user_chats(user_id)
+    else:
+        chat_ids = [chat.chat_id for chat in get_all_chats()]
+    return [chat_id for chat_id in chat_ids if sql.does_chat_gmute(chat_id)]
+
 
 @run_async
 def gmute(bot: Bot, update: Update, args: List[str]):
@@ -74,50 +114,11 @@ def gmute(bot: Bot, update: Update, args: List[str]):
                  html=True)
 
     sql.gmute_user(user_id, user_chat.username or user_chat.first_name, reason)
+    fanout.cancel_user_jobs("ungmute", user_id)
 
-    chats = get_all_chats()
-    for chat in chats:
-        chat_id = chat.chat_id
-
-        # Check if this group has disabled gmutes
-        if not sql.does_chat_gmute(chat_id):
-            continue
-
-        try:
-            bot.restrict_chat_member(chat_id, user_id, can_send_messages=False)
-        except BadRequest as excp:
-            if excp.message == "User is an administrator of the chat":
-                pass
-            elif excp.message == "Chat not found":
-                pass
-            elif excp.message == "Not enough rights to restrict/unrestrict chat member":
-                pass
-            elif excp.message == "User_not_participant":
-                pass
-            elif excp.message == "Peer_id_invalid":  # Suspect this happens when a group is suspended by telegram.
-                pass
-            elif excp.message == "Group chat was deactivated":
-                pass
-            elif excp.message == "Need to be inviter of a user to kick it from a basic group":
-                pass
-            elif excp.message == "Chat_admin_required":
-                pass
-            elif excp.message == "Only the creator of a basic group can kick group administrators":
-                pass
-            elif excp.message == "Method is available only for supergroups":
-                pass
-            elif excp.message == "Can't demote chat creator":
-                pass
-            else:
-                message.reply_text("Could not gmute due to: {}".format(excp.message))
-                send_to_list(bot, SUDO_USERS + SUPPORT_USERS, "Could not gmute due to: {}".format(excp.message))
-                sql.ungmute_user(user_id)
-                return
-        except TelegramError:
-            pass
-
-    send_to_list(bot, SUDO_USERS + SUPPORT_USERS, "gmute complete!")
-    message.reply_text("Person has been gmuted.")
+    chats = gmute_target_chats(user_id)
+    fanout.start_job(bot, "gmute", user_id, chats, user_chat.first_name, muter.id)
+    message.reply_text("Person has been gmuted. Enforcing it in {} chats now.".format(len(chats)))
 
 
 @run_async
@@ -147,52 +148,43 @@ def ungmute(bot: Bot, update: Update, args: List[str]):
                                                    mention_html(user_chat.id, user_chat.first_name)),
                  html=True)
 
-    chats = get_all_chats()
-    for chat in chats:
-        chat_id = chat.chat_id
+    sql.ungmute_user(user_id)
+    fanout.cancel_user_jobs("gmute", user_id)
+
+    chats = gmute_target_chats(user_id)
+    fanout.start_job(bot, "ungmute", user_id, chats, user_chat.first_name, muter.id)
+    message.reply_text("Person has been un-gmuted. Lifting the mutes in {} chats now.".format(len(chats)))
+
+
+# NOT ASYNC - runs on the fanout pool, once per chat
+def fanout_gmute(bot: Bot, chat_id: str, job):
+    # the chat may have opted out, or the user been ungmuted, since the job started
+    if sql.does_chat_gmute(chat_id) and sql.is_user_gmuted(job.user_id):
+        bot.restrict_chat_member(chat_id, job.user_id, can_send_messages=False)
 
-        # Check if this group has disabled gmutes
-        if not sql.does_chat_gmute(chat_id):
-            continue
 
-        try:
-            member = bot.get_chat_member(chat_id, user_id)
-            if member.status == 'restricted':
-                bot.restrict_chat_member(chat_id, int(user_id),
+# NOT ASYNC - see fanout_gmute
+def fanout_ungmute(bot: Bot, chat_id: str, job):
+    if sql.does_chat_gmute(chat_id) and not sql.is_user_gmuted(job.user_id):
+        member = bot.get_chat_member(chat_id, job.user_id)
+        if member.status == 'restricted':
+            bot.restrict_chat_member(chat_id, int(job.user_id),
                                      can_send_messages=True,
                                      can_send_media_messages=True,
                                      can_send_other_messages=True,
                                      can_add_web_page_previews=True)
 
-        except BadRequest as excp:
-            if excp.message == "User is an administrator of the chat":
-                pass
-            elif excp.message == "Chat not found":
-                pass
-            elif excp.message == "Not enough rights to restrict/unrestrict chat member":
-                pass
-            elif excp.message == "User_not_participant":
-                pass
-            elif excp.message == "Method is available for supergroup and channel chats only":
-                pass
-            elif excp.message == "Not in the chat":
-                pass
-            elif excp.message == "Channel_private":
-                pass
-            elif excp.message == "Chat_admin_required":
-                pass
-            else:
-                message.reply_text("Could not un-gmute due to: {}".format(excp.message))
-                bot.send_message(OWNER_ID, "Could not un-gmute due to: {}".format(excp.message))
-                return
-        except TelegramError:
-            pass
 
-    sql.ungmute_user(user_id)
+def finish_gmute(bot: Bot, job):
+    if job.status == fanout_sql.JOB_DONE:
+        send_to_list(bot, SUDO_USERS + SUPPORT_USERS,
+                     "gmute complete! ({} chats, {} failed)".format(job.total, job.failed))
 
-    send_to_list(bot, SUDO_USERS + SUPPORT_USERS, "un-gmute complete!")
 
-    message.reply_text("Person has been un-gmuted.")
+def finish_ungmute(bot: Bot, job):
+    if job.status == fanout_sql.JOB_DONE:
+        send_to_list(bot, SUDO_USERS + SUPPORT_USERS,
+                     "un-gmute complete! ({} chats, {} failed)".format(job.total, job.failed))
 
 
 @run_async
@@ -215,31 +207,38 @@ def gmutelist(bot: Bot, update: Update):
                                                 caption="Here is the list of currently gmuted users.")
 
 
-def check_and_mute(bot, update, user_id, should_message=True):
+def check_and_mute(bot, update, user_id, should_message=True) -> bool:
     if sql.is_user_gmuted(user_id):
         bot.restrict_chat_member(update.effective_chat.id, user_id, can_send_messages=False)
         if should_message:
             update.effective_message.reply_text("This is a bad person, I'll silence them for you!")
+        return True
+    return False
 
 
-@run_async
-def enforce_gmute(bot: Bot, update: Update):
+# NOT ASYNC - also the "gmute" moderation pipeline stage
+def enforce_gmute(bot: Bot, update: Update, context: UpdateContext = None) -> bool:
     # Not using @restrict handler to avoid spamming - just ignore if cant gmute.
-    if sql.does_chat_gmute(update.effective_chat.id) and update.effective_chat.get_member(bot.id).can_restrict_members:
+    if sql.does_chat_gmute(update.effective_chat.id) and get_bot_member(update.effective_chat, bot.id).can_restrict_members:
+        context = context or get_context(update, bot)
         user = update.effective_user  # type: Optional[User]
-        chat = update.effective_chat  # type: Optional[Chat]
         msg = update.effective_message  # type: Optional[Message]
+        muted = False
 
-        if user and not is_user_admin(chat, user.id):
-            check_and_mute(bot, update, user.id, should_message=True)
+        if user and not context.is_admin(user.id):
+            muted |= check_and_mute(bot, update, user.id, should_message=True)
         if msg.new_chat_members:
             new_members = update.effective_message.new_chat_members
             for mem in new_members:
-                check_and_mute(bot, update, mem.id, should_message=True)
+                muted |= check_and_mute(bot, update, mem.id, should_message=True)
         if msg.reply_to_message:
             user = msg.reply_to_message.from_user  # type: Optional[User]
-            if user and not is_user_admin(chat, user.id):
-                check_and_mute(bot, update, user.id, should_message=True)
+            if user and not context.is_admin(user.id):
+                muted |= check_and_mute(bot, update, user.id, should_message=True)
+
+        return muted
+    return False
+
 
 @run_async
 @user_admin
@@ -319,7 +318,10 @@ GMUTE_LIST = CommandHandler("gmutelist", gmutelist,
 
 GMUTE_STATUS = CommandHandler("gmutestat", gmutestat, pass_args=True, filters=Filters.group)
 
-GMUTE_ENFORCER = MessageHandler(Filters.all & Filters.group, enforce_gmute)
+GMUTE_ENFORCER = CapabilityMessageHandler(Filters.all & Filters.group, run_async(enforce_gmute), CAP_GMUTE)
+
+fanout.register_action("gmute", fanout_gmute, GMUTE_ERRORS, finish_gmute)
+fanout.register_action("ungmute", fanout_ungmute, UNGMUTE_ERRORS, finish_ungmute)
 
 dispatcher.add_handler(GMUTE_HANDLER)
 dispatcher.add_handler(UNGMUTE_HANDLER)
@@ -327,4 +329,4 @@ dispatcher.add_handler(GMUTE_LIST)
 dispatcher.add_handler(GMUTE_STATUS)
 
 if STRICT_GMUTE:
-    dispatcher.add_handler(GMUTE_ENFORCER, GMUTE_ENFORCE_GROUP)
+    add_moderation_handler("gmute", GMUTE_ENFORCER, GMUTE_ENFORCE_GROUP, stage=enforce_gmute)
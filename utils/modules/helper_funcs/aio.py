@@ -0,0 +1,298 @@
+import asyncio
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from telegram import Update
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TimedOut, Unauthorized
+from telegram.ext import Dispatcher, DispatcherHandlerStop
+
+from utils import LOGGER, ASYNC_CORE, SHARD_PROCESSES
+from utils.modules.helper_funcs import metrics
+from utils.modules.helper_funcs.outbound import OutboundScheduler, UNTHROTTLED_METHODS, MAX_RETRIES, \
+    MAX_RETRY_WAIT, chat_limited
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+    web = None
+
+# modules register async versions of their handlers only when the core will actually run, which it never does
+# with SHARD_PROCESSES: neither the supervisor nor the workers start it
+ASYNC_ENABLED = bool(ASYNC_CORE) and aiohttp is not None and not SHARD_PROCESSES
+
+API_URL = "https://api.telegram.org/bot{}/"
+POLL_TIMEOUT = 15
+
+ASYNC_HANDLERS = {}  # group -> [handler], run on the event loop before the update reaches the sync dispatcher
+DB_EXECUTOR = None
+
+
+def add_async_handler(handler, group: int = 0):
+    """
+    Register a handler whose callback is `async def callback(client, update)`. It is matched with the handler's
+    usual check_update, and gets the AsyncBotClient instead of the sync Bot. Within a group the first match wins;
+    raising DispatcherHandlerStop keeps the update from going any further.
+    """
+    ASYNC_HANDLERS.setdefault(group, []).append(handler)
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking call (SQLAlchemy, or a sync Bot API call) on the bounded DB executor."""
+    return await asyncio.get_event_loop().run_in_executor(DB_EXECUTOR, partial(func, *args, **kwargs))
+
+
+class AsyncBotClient(object):
+    """A small Bot API client over one aiohttp session, so calls share kept-alive connections."""
+
+    def __init__(self, token: str, scheduler: OutboundScheduler = None, connections: int = 100):
+        self.base_url = API_URL.format(token)
+        self.scheduler = scheduler
+        self.connections = connections
+        self.session = None
+
+    async def start(self):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def _throttle(self, chat_id):
+        # shares the scheduler's buckets with the sync bot, but not its priority queue
+        wait = self.scheduler.bucket.reserve()
+        if chat_id is not None and self.scheduler.is_group(chat_id):
+            wait = max(wait, self.scheduler.chat_bucket(str(chat_id)).reserve())
+        if wait:
+            await asyncio.sleep(wait)
+
+    async def call(self, method: str, timeout: float = None, **params):
+        params = {key: value for key, value in params.items() if value is not None}
+        throttled = self.scheduler and not method.startswith("get") and method not in UNTHROTTLED_METHODS
+        chat_id = params.get("chat_id")
+        limited = chat_limited(method)
+
+        for attempt in range(MAX_RETRIES + 1):
+            if throttled:
+                await self._throttle(chat_id if limited else None)
+            try:
+                return await self._post(method, params, timeout)
+            except RetryAfter as excp:
+                if not self.scheduler:
+                    raise
+                self.scheduler.throttled(chat_id, excp.retry_after)
+                if attempt == MAX_RETRIES or excp.retry_after > MAX_RETRY_WAIT:
+                    raise
+                if not limited and self.scheduler.is_group(chat_id):
+                    await asyncio.sleep(excp.retry_after)
+
+    async def _post(self, method, params, timeout):
+        try:
+            async with self.session.post(self.base_url + method, json=params,
+                                         timeout=aiohttp.ClientTimeout(total=timeout)) as resp:
+                status = resp.status
+                try:
+                    data = await resp.json(content_type=None)
+                except ValueError:
+                    data = None
+        except asyncio.TimeoutError:
+            raise TimedOut()
+        except aiohttp.ClientError as excp:
+            raise NetworkError("aiohttp {}".format(excp))
+
+        if not isinstance(data, dict):  # e.g. an HTML error page from a proxy in between
+            raise NetworkError("Invalid server response ({})".format(status))
+        if data.get("ok"):
+            return data["result"]
+
+        # same mapping as telegram.utils.request.Request
+        description = data.get("description", "Unknown HTTPError")
+        parameters = data.get("parameters") or {}
+        if "migrate_to_chat_id" in parameters:
+            raise ChatMigrated(parameters["migrate_to_chat_id"])
+        if "retry_after" in parameters:
+            raise RetryAfter(parameters["retry_after"])
+        if status in (401, 403):
+            raise Unauthorized(description)
+        if status == 400:
+            raise BadRequest(description)
+        raise NetworkError("{} ({})".format(description, status))
+
+    async def get_updates(self, offset=None, timeout=POLL_TIMEOUT, allowed_updates=None):
+        # `timeout` is both the long-poll time and, with some slack, the HTTP timeout; hence not via call()
+        params = {"timeout": timeout}
+        if offset is not None:
+            params["offset"] = offset
+        if allowed_updates is not None:
+            params["allowed_updates"] = allowed_updates
+        return await self._post("getUpdates", params, timeout + 5)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        return await self.call("sendMessage", chat_id=chat_id, text=text, **kwargs)
+
+    async def delete_message(self, chat_id, message_id):
+        return await self.call("deleteMessage", chat_id=chat_id, message_id=message_id)
+
+
+class AsyncCore(object):
+    """
+    asyncio front end for the bot: long-polls or serves the webhook itself, runs the async handlers on the event
+    loop, and passes every update on to the normal threaded dispatcher, which keeps running the sync handlers.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, token: str, scheduler: OutboundScheduler = None, tasks: int = 64,
+                 db_workers: int = 8):
+        global DB_EXECUTOR
+        DB_EXECUTOR = ThreadPoolExecutor(max_workers=db_workers, thread_name_prefix="db")
+
+        self.dispatcher = dispatcher
+        self.token = token
+        self.client = AsyncBotClient(token, scheduler)
+        self.tasks = tasks
+        self.loop = None
+        self.queue = None
+        self._thread = None
+        self.allowed_updates = None
+        self._stopped = threading.Event()
+
+        self.received = metrics.counter("async.updates_received")
+        self.failed = metrics.counter("async.handler_errors")
+        self.invalid = metrics.counter("async.invalid_updates")
+        metrics.gauge("async.queued", lambda: self.queue.qsize() if self.queue else 0)
+
+    def start(self, webhook=False, listen="0.0.0.0", port=80, url=None, cert_path=None, allowed_updates=None):
+        """Start the dispatcher thread and the event loop thread; returns once the loop is up."""
+        self.allowed_updates = allowed_updates
+        self.dispatcher.job_queue.start()
+        threading.Thread(target=self.dispatcher.start, name="dispatcher").start()
+
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready, webhook, listen, port, url, cert_path),
+                                        name="asyncio-core", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready, webhook, listen, port, url, cert_path):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.queue = asyncio.Queue(maxsize=self.tasks * 16)
+        try:
+            self.loop.run_until_complete(self.client.start())
+            for _ in range(self.tasks):
+                self.loop.create_task(self._worker())
+            if webhook:
+                self.loop.run_until_complete(self._start_webhook(listen, port, url, cert_path))
+            else:
+                self.loop.create_task(self._poll())
+        except Exception:
+            LOGGER.exception("Couldn't start the asyncio core")
+            return
+        finally:
+            ready.set()
+
+        self.loop.run_forever()
+
+    async def _poll(self):
+        await self.client.call("deleteWebhook")
+        offset = None
+        backoff = 1
+        while True:
+            try:
+                updates = await self.client.get_updates(offset, POLL_TIMEOUT, self.allowed_updates)
+                backoff = 1
+            except (NetworkError, RetryAfter) as excp:
+                LOGGER.warning("getUpdates failed: %s; retrying in %ss", excp, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            for data in updates:
+                offset = data["update_id"] + 1
+                update = self._parse(data)
+                if update is not None:
+                    await self.queue.put(update)
+
+    async def _start_webhook(self, listen, port, url, cert_path):
+        app = web.Application()
+        app.router.add_post("/" + self.token, self._webhook)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+
+        if cert_path:  # certificate upload is multipart; leave it to the sync bot
+            with open(cert_path, 'rb') as certificate:
+                await run_sync(self.dispatcher.bot.set_webhook, url=url + self.token, certificate=certificate,
+                               allowed_updates=self.allowed_updates)
+        else:
+            await self.client.call("setWebhook", url=url + self.token, allowed_updates=self.allowed_updates)
+
+    async def _webhook(self, request):
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        update = self._parse(data)
+        if update is None:
+            # as WebhookServer.receive: a 500 would only have Telegram send it again
+            return web.Response(status=400)
+        await self.queue.put(update)
+        return web.Response()
+
+    def _parse(self, data):
+        """The Update in `data`, or None if it isn't one."""
+        try:
+            update = Update.de_json(data, self.dispatcher.bot) if isinstance(data, dict) else None
+        except Exception:
+            update = None
+        if update is None:
+            self.invalid.inc()
+        return update
+
+    async def _worker(self):
+        while True:
+            update = await self.queue.get()
+            self.received.inc()
+            try:
+                if await self._process(update):
+                    self.dispatcher.update_queue.put(update)
+            except Exception:
+                self.failed.inc()
+                LOGGER.exception("Error while handling update %s", update.update_id)
+
+    async def _process(self, update) -> bool:
+        """Run the async handlers; False if one of them stopped the update."""
+        for group in sorted(ASYNC_HANDLERS):
+            for handler in ASYNC_HANDLERS[group]:
+                if not handler.check_update(update):
+                    continue
+                try:
+                    await handler.callback(self.client, update)
+                except DispatcherHandlerStop:
+                    return False
+                break
+        return True
+
+    def stop(self):
+        if self.loop:
+            future = asyncio.run_coroutine_threadsafe(self.client.close(), self.loop)
+            future.result(timeout=5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.dispatcher.job_queue.stop()
+        self.dispatcher.stop()
+        DB_EXECUTOR.shutdown(wait=False)
+        self._stopped.set()
+
+    def idle(self):
+        """Block the main thread until SIGINT/SIGTERM, then shut down; the counterpart of Updater.idle()."""
+        def signal_handler(signum, frame):
+            LOGGER.info("Received signal %s, stopping", signum)
+            self.stop()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, signal_handler)
+        while not self._stopped.is_set():
+            time.sleep(1)
@@ -0,0 +1,90 @@
+import threading
+import time
+
+from utils import LOGGER
+from utils.modules import sql
+from utils.modules.helper_funcs import metrics
+from utils.modules.helper_funcs.executor import ScalableDispatcher
+
+INTERVAL = 5  # seconds between decisions
+GROW_UTILISATION = 0.75  # share of worker time spent in handlers above which a backlog means "too few workers"
+SHRINK_UTILISATION = 0.25
+SHRINK_AFTER = 6  # quiet intervals in a row before giving threads back
+MAX_API_WAIT_MS = 1000  # above this handlers are stuck behind the outbound limits, and more threads won't help
+
+
+class Autoscaler(object):
+    """
+    Grows the dispatcher's worker pool when updates back up while the workers are busy, and shrinks it after a
+    quiet spell, within [min_workers, max_workers]. The database connection pool follows the worker count.
+    """
+
+    def __init__(self, dispatcher: ScalableDispatcher, min_workers: int, max_workers: int):
+        self.dispatcher = dispatcher
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.workers = dispatcher.workers
+        self._quiet = 0
+        self._api_calls = metrics.counter("outbound.calls")
+        self._api_wait = metrics.counter("outbound.wait_ms")
+        self._last_api = (self._api_calls.value, self._api_wait.value)
+        self._thread = threading.Thread(target=self._run, name="autoscaler", daemon=True)
+
+        self.resizes = metrics.counter("autoscale.resizes")
+        metrics.gauge("autoscale.workers", lambda: self.workers)
+        metrics.gauge("autoscale.db_pool_size", sql.pool_size)
+        metrics.gauge("autoscale.update_queue", dispatcher.update_queue.qsize)
+
+    def start(self):
+        LOGGER.info("Autoscaling workers between %s and %s", self.min_workers, self.max_workers)
+        sql.resize_pool(self.workers)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(INTERVAL)
+            try:
+                self.tick()
+            except Exception:
+                LOGGER.exception("Autoscaler tick failed")
+
+    def _api_wait_ms(self) -> float:
+        calls, wait = self._api_calls.value, self._api_wait.value
+        last_calls, last_wait = self._last_api
+        self._last_api = (calls, wait)
+        return (wait - last_wait) / (calls - last_calls) if calls > last_calls else 0.0
+
+    def tick(self):
+        completed, busy_seconds, _ = self.dispatcher.take_stats()
+        backlog = self.dispatcher.queued() + self.dispatcher.update_queue.qsize()
+        utilisation = busy_seconds / (INTERVAL * self.workers)
+        latency_ms = busy_seconds * 1000 / completed if completed else 0.0
+        api_wait_ms = self._api_wait_ms()
+
+        target = self.workers
+        if backlog and (utilisation > GROW_UTILISATION or backlog > 2 * self.workers):
+            self._quiet = 0
+            if api_wait_ms > MAX_API_WAIT_MS:
+                LOGGER.info("Autoscaler: holding at %s workers, backlog %s is waiting on the Bot API (%.0fms)",
+                            self.workers, backlog, api_wait_ms)
+            else:
+                target = min(self.max_workers, self.workers + max(1, self.workers // 2))
+        elif not backlog and utilisation < SHRINK_UTILISATION:
+            self._quiet += 1
+            if self._quiet >= SHRINK_AFTER:
+                self._quiet = 0
+                target = max(self.min_workers, self.workers - max(1, self.workers // 4))
+        else:
+            self._quiet = 0
+
+        if target != self.workers:
+            LOGGER.info("Autoscaler: %s -> %s workers (backlog %s, utilisation %.0f%%, handler latency %.0fms, "
+                        "Bot API wait %.0fms)", self.workers, target, backlog, utilisation * 100, latency_ms,
+                        api_wait_ms)
+            self.resize(target)
+
+    def resize(self, workers: int):
+        self.dispatcher.resize(workers)
+        sql.resize_pool(workers)
+        self.workers = workers
+        self.resizes.inc()
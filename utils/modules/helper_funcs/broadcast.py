@@ -0,0 +1,292 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from telegram import Bot, ParseMode
+from telegram.error import ChatMigrated, RetryAfter, TelegramError, TimedOut
+
+from utils import LOGGER, MESSAGE_DUMP
+from utils.modules.helper_funcs.outbound import PRIORITY_BULK, outbound_priority
+from utils.modules.helper_funcs.rate_limit import AdaptiveRateLimiter
+from utils.modules.sql import broadcast_sql as sql
+from utils.modules.sql import users_sql
+
+BROADCAST_RATE = 25  # messages a second; Telegram allows about 30 across all chats
+PER_CHAT_RATE = 20 / 60  # ...and 20 a minute into any one group
+BROADCAST_WORKERS = 4
+PAGE_SIZE = 100  # chats read, sent to and checkpointed at a time
+PROGRESS_INTERVAL = 5  # seconds between edits of the MESSAGE_DUMP progress message
+STATUS_POLL_INTERVAL = 5  # seconds between status checks while paused, for a resume or cancel from another shard
+MAX_ATTEMPTS = 3
+MAX_FAILURE_REPORT = 50
+
+BROADCAST_LIMITER = AdaptiveRateLimiter(BROADCAST_RATE, PER_CHAT_RATE, per_key_capacity=1)
+
+CONTROL_STATUSES = {
+    "pause": sql.BROADCAST_PAUSED,
+    "resume": sql.BROADCAST_RUNNING,
+    "cancel": sql.BROADCAST_CANCELLED,
+}
+
+RUNNER = None  # the BroadcastRunner for the active broadcast, if any
+RUNNER_LOCK = threading.Lock()
+
+
+class BroadcastRunner(object):
+    """
+    Sends one broadcast, a page of chats at a time, saving the cursor after every page. A restart resends at
+    most the page that was in flight.
+    """
+
+    def __init__(self, bot: Bot, broadcast: sql.Broadcast):
+        self.bot = bot
+        self.broadcast = broadcast
+        self.sent = broadcast.sent
+        self.failed = broadcast.failed
+        self.failures = deque(maxlen=MAX_FAILURE_REPORT)  # (chat name, chat id, error)
+        self.cancelled = False
+        self._running = threading.Event()
+        if broadcast.status == sql.BROADCAST_RUNNING:
+            self._running.set()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=BROADCAST_WORKERS, thread_name_prefix="broadcast")
+        self._thread = threading.Thread(target=self._run, name="broadcast-{}".format(broadcast.broadcast_id),
+                                        daemon=True)
+
+    @property
+    def status(self) -> str:
+        if self.cancelled:
+            return sql.BROADCAST_CANCELLED
+        return sql.BROADCAST_RUNNING if self._running.is_set() else sql.BROADCAST_PAUSED
+
+    def start(self):
+        self._thread.start()
+
+    def pause(self):
+        self._running.clear()
+        sql.set_status(self.broadcast.broadcast_id, sql.BROADCAST_PAUSED)
+
+    def resume(self):
+        sql.set_status(self.broadcast.broadcast_id, sql.BROADCAST_RUNNING)
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()  # wake up anything waiting on a pause
+
+    def _sync_status(self):
+        """Pick up a pause, resume or cancel that /broadcast in another shard process wrote to the database."""
+        status = sql.get_status(self.broadcast.broadcast_id)
+        if status == sql.BROADCAST_CANCELLED:
+            self.cancel()
+        elif status == sql.BROADCAST_PAUSED:
+            self._running.clear()
+        elif status == sql.BROADCAST_RUNNING:
+            self._running.set()
+
+    def _wait_running(self):
+        while not self._running.wait(STATUS_POLL_INTERVAL):
+            self._sync_status()
+
+    def _run(self):
+        global RUNNER
+        broadcast = self.broadcast
+        cursor = broadcast.cursor
+        last_report = 0
+        try:
+            self._report()
+            while True:
+                self._sync_status()
+                self._wait_running()
+                if self.cancelled:
+                    break
+
+                page = users_sql.get_chats_page(cursor, PAGE_SIZE)
+                if not page:
+                    break
+
+                wait([self._pool.submit(self._send, chat.chat_id, chat.chat_name) for chat in page])
+                if self.cancelled:
+                    break
+
+                cursor = page[-1].chat_id
+                sql.save_progress(broadcast.broadcast_id, cursor, self.sent, self.failed)
+                if time.monotonic() - last_report > PROGRESS_INTERVAL:
+                    self._report()
+                    last_report = time.monotonic()
+
+            sql.save_progress(broadcast.broadcast_id, cursor, self.sent, self.failed)
+            self._sync_status()
+            sql.set_status(broadcast.broadcast_id, sql.BROADCAST_CANCELLED if self.cancelled else sql.BROADCAST_DONE)
+            self._report(final=True)
+
+        except Exception:
+            # stays active in the database, so the next start picks it up from the last checkpoint
+            LOGGER.exception("Broadcast %s stopped", broadcast.broadcast_id)
+
+        finally:
+            self._pool.shutdown(wait=False)
+            with RUNNER_LOCK:
+                if RUNNER is self:
+                    RUNNER = None
+
+    def _deliver(self, chat_id):
+        broadcast = self.broadcast
+        if broadcast.text is not None:
+            self.bot.send_message(int(chat_id), broadcast.text, parse_mode=ParseMode.HTML)
+        elif hasattr(self.bot, "copy_message"):
+            # copy preserves formatting and media without the "forwarded from" header
+            self.bot.copy_message(chat_id, broadcast.from_chat_id, broadcast.message_id)
+        else:
+            # Fallback for older python-telegram-bot versions
+            self.bot.forward_message(chat_id, broadcast.from_chat_id, broadcast.message_id)
+
+    def _send(self, chat_id, chat_name):
+        target = chat_id
+        error = "Gave up after {} attempts".format(MAX_ATTEMPTS)
+        for attempt in range(MAX_ATTEMPTS):
+            self._wait_running()
+            if self.cancelled:
+                return
+
+            BROADCAST_LIMITER.acquire(target)
+            try:
+                with outbound_priority(PRIORITY_BULK):
+                    self._deliver(target)
+                BROADCAST_LIMITER.succeeded()
+                with self._lock:
+                    self.sent += 1
+                return
+            except RetryAfter as excp:
+                BROADCAST_LIMITER.throttled(excp.retry_after)
+            except ChatMigrated as excp:
+                target = excp.new_chat_id
+            except TimedOut:
+                time.sleep(2 ** attempt)
+            except TelegramError as excp:
+                error = str(excp)
+                break
+
+        LOGGER.warning("Couldn't send broadcast to %s (ID: %s): %s", str(chat_name), str(chat_id), error)
+        with self._lock:
+            self.failed += 1
+            self.failures.append((chat_name, chat_id, error))
+
+    def progress_text(self) -> str:
+        return progress_text(self.broadcast, self.sent, self.failed,
+                             "{} ({:.1f} msg/s)".format(self.status, BROADCAST_LIMITER.rate))
+
+    def _report(self, final=False):
+        if not MESSAGE_DUMP:
+            return
+
+        broadcast = self.broadcast
+        if not final:
+            text = "📡 <b>Broadcast In Progress</b>\n\n" + self.progress_text()
+        else:
+            title = "✅ <b>Broadcast Complete</b>" if not self.cancelled else "🛑 <b>Broadcast Cancelled</b>"
+            text = (f"{title}\n\n"
+                    f"<b>Type:</b> {kind(broadcast)}\n"
+                    f"<b>Initiated by:</b> {broadcast.started_by_name} (<code>{broadcast.started_by}</code>)\n\n"
+                    f"📊 <b>Statistics:</b>\n"
+                    f"• Total groups: {broadcast.total}\n"
+                    f"• Successfully sent: {self.sent}\n"
+                    f"• Failed: {self.failed}\n")
+            if self.failed > 0:
+                text += f"\n⚠️ <i>{self.failed} groups failed to receive the message</i>"
+
+        try:
+            if broadcast.status_message_id:
+                self.bot.edit_message_text(text, MESSAGE_DUMP, broadcast.status_message_id, parse_mode=ParseMode.HTML)
+            else:
+                status_msg = self.bot.send_message(MESSAGE_DUMP, text, parse_mode=ParseMode.HTML)
+                broadcast.status_message_id = status_msg.message_id
+                sql.set_status_message(broadcast.broadcast_id, status_msg.message_id)
+        except TelegramError:
+            pass
+
+        # detailed failure report, if there are only a few
+        if final and self.failures and self.failed <= MAX_FAILURE_REPORT:
+            failure_report = "<b>📋 Failed Groups Report:</b>\n\n"
+            for name, chat_id, error in self.failures:
+                failure_report += f"• {name or 'Unknown'} (<code>{chat_id}</code>)\n  <i>Error: {error[:80]}</i>\n\n"
+            try:
+                self.bot.send_message(MESSAGE_DUMP, failure_report, parse_mode=ParseMode.HTML)
+            except TelegramError:
+                pass
+
+
+def kind(broadcast: sql.Broadcast) -> str:
+    return "text message" if broadcast.text is not None else "forwarded message"
+
+
+def progress_text(broadcast: sql.Broadcast, sent: int, failed: int, status: str) -> str:
+    return (f"<b>Type:</b> {kind(broadcast)}\n"
+            f"<b>Initiated by:</b> {broadcast.started_by_name} (<code>{broadcast.started_by}</code>)\n"
+            f"<b>Total groups:</b> {broadcast.total}\n"
+            f"<b>Progress:</b> {sent + failed}/{broadcast.total}\n"
+            f"<b>✅ Success:</b> {sent}\n"
+            f"<b>❌ Failed:</b> {failed}\n"
+            f"<b>Status:</b> {status}")
+
+
+def _start_runner(bot: Bot, broadcast: sql.Broadcast) -> BroadcastRunner:
+    global RUNNER
+    runner = BroadcastRunner(bot, broadcast)
+    RUNNER = runner
+    runner.start()
+    return runner
+
+
+def start_broadcast(bot: Bot, user, text=None, from_chat_id=None, message_id=None):
+    """Start a broadcast of `text`, or of message `message_id` in `from_chat_id`; None if one is already active."""
+    with RUNNER_LOCK:
+        if RUNNER or sql.get_active_broadcast():
+            return None
+
+        broadcast_id = sql.create_broadcast(user.id, user.first_name, users_sql.num_chats(), text, from_chat_id,
+                                            message_id)
+        return _start_runner(bot, sql.get_broadcast(broadcast_id))
+
+
+def resume_broadcast(bot: Bot):
+    """Pick up the broadcast a previous run left active, paused ones included."""
+    with RUNNER_LOCK:
+        broadcast = sql.get_active_broadcast()
+        if RUNNER or not broadcast:
+            return
+
+        LOGGER.info("Resuming broadcast %s (%s/%s done)", broadcast.broadcast_id, broadcast.sent + broadcast.failed,
+                    broadcast.total)
+        _start_runner(bot, broadcast)
+
+
+def get_runner():
+    return RUNNER
+
+
+def control_broadcast(action: str):
+    """
+    Apply a /broadcast status|pause|resume|cancel to the active broadcast, wherever it runs; returns it with its
+    progress text, or None if there isn't one. With SHARD_PROCESSES the runner may be in another process: the
+    change then goes through the database and takes effect after the page in flight, and the progress is as of
+    the last checkpoint.
+    """
+    runner = RUNNER
+    if runner:
+        if action == "pause":
+            runner.pause()
+        elif action == "resume":
+            runner.resume()
+        elif action == "cancel":
+            runner.cancel()
+        return runner.broadcast, runner.progress_text()
+
+    broadcast = sql.get_active_broadcast()
+    if not broadcast:
+        return None
+    status = CONTROL_STATUSES.get(action, broadcast.status)
+    if status != broadcast.status:
+        sql.set_status(broadcast.broadcast_id, status)
+    return broadcast, progress_text(broadcast, broadcast.sent, broadcast.failed, status)
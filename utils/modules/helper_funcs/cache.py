@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+from utils.modules.helper_funcs import metrics
+
+_MISSING = object()
+
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class TTLCache(object):
+    """Thread-safe LRU mapping whose entries expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            return entry[1]
+
+    def pop_matching(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ReadThroughCache(Generic[K, V]):
+    """
+    Bounded LRU in front of `loader(key)`, for the per-chat settings read on every event. Entries last until
+    invalidated, or `ttl` seconds if given; the module owning the table calls invalidate() from its setters and
+    migrate_chat, after committing. None is a value like any other, so "no row" is cached too. Hits and misses are
+    counted as cache.<name>.hits / cache.<name>.misses.
+    """
+
+    def __init__(self, name: str, loader: Callable[[K], V], maxsize: int, ttl: Optional[float] = None):
+        self.name = name
+        self.loader = loader
+        self._data = TTLCache(maxsize, ttl if ttl is not None else float("inf"))
+        self._generation = 0  # bumped by every invalidation, so a load racing one isn't cached
+        self.hits = metrics.counter("cache.{}.hits".format(name))
+        self.misses = metrics.counter("cache.{}.misses".format(name))
+        metrics.gauge("cache.{}.size".format(name), lambda: len(self._data))
+
+    def get(self, key: K) -> V:
+        value = self._data.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits.inc()
+            return value
+
+        self.misses.inc()
+        generation = self._generation
+        value = self.loader(key)
+        if generation == self._generation:
+            self._data.set(key, value)
+        return value
+
+    def invalidate(self, *keys: K):
+        self._generation += 1
+        for key in keys:
+            self._data.pop(key)
+
+    def invalidate_matching(self, predicate: Callable[[K], bool]):
+        self._generation += 1
+        self._data.pop_matching(predicate)
+
+    def clear(self):
+        self._generation += 1
+        self._data.clear()
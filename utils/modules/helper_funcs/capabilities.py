@@ -0,0 +1,53 @@
+import threading
+
+# What a chat has configured, as bits; handlers that only act on a configured feature skip chats without it.
+CAP_BLACKLIST = 1 << 0
+CAP_FILTERS = 1 << 1
+CAP_WARN_FILTERS = 1 << 2
+CAP_FLOOD = 1 << 3
+CAP_LOCKS = 1 << 4
+CAP_RESTRICTIONS = 1 << 5
+CAP_GBAN = 1 << 6
+CAP_GMUTE = 1 << 7
+
+CAPABILITY_PROVIDERS = {}  # cap -> predicate(str chat_id) -> bool, registered by the sql module owning the cache
+CHAT_CAPS = {}  # str chat_id -> bitmap, worked out on first use and dropped whenever a provider's cache changes
+
+CAPS_LOCK = threading.Lock()
+
+
+def register_capability(cap: int, predicate):
+    with CAPS_LOCK:
+        CAPABILITY_PROVIDERS[cap] = predicate
+        CHAT_CAPS.clear()
+
+
+def refresh_capabilities(*chat_ids):
+    """Call after changing a cache a provider reads, so the next lookup recomputes the chat's bitmap."""
+    with CAPS_LOCK:
+        for chat_id in chat_ids:
+            CHAT_CAPS.pop(str(chat_id), None)
+
+
+def reset_capabilities():
+    """Drop every chat's bitmap, after a provider's cache was reloaded wholesale."""
+    with CAPS_LOCK:
+        CHAT_CAPS.clear()
+
+
+def get_capabilities(chat_id) -> int:
+    chat_id = str(chat_id)
+    caps = CHAT_CAPS.get(chat_id)
+    if caps is None:
+        with CAPS_LOCK:
+            caps = 0
+            for cap, predicate in CAPABILITY_PROVIDERS.items():
+                if predicate(chat_id):
+                    caps |= cap
+            CHAT_CAPS[chat_id] = caps
+    return caps
+
+
+def has_capability(chat_id, caps: int) -> bool:
+    """True if the chat has any of the capability bits in `caps`."""
+    return bool(get_capabilities(chat_id) & caps)
@@ -0,0 +1,102 @@
+import time
+from datetime import datetime, timezone
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Dispatcher, DispatcherHandlerStop, Filters, TypeHandler
+
+from utils import LOGGER
+from utils.modules.helper_funcs import metrics
+
+CATCHUP_GROUP = -10  # ahead of every other handler group
+
+# stale service messages that still go through every handler: chat migrations have to move the chat's data,
+# and the left-member handler is how the bot finds out it was removed (the goodbye itself is @low_priority)
+PASSTHROUGH = Filters.status_update.migrate | Filters.status_update.left_chat_member
+
+CATCH_UP = None  # the CatchUp, once __main__ has installed one
+
+
+def update_lag(update: Update) -> Optional[float]:
+    """Seconds between Telegram receiving this update and now; None for updates without a date."""
+    message = update.message or update.edited_message or update.channel_post or update.edited_channel_post
+    if not message:
+        return None
+    date = message.edit_date or message.date
+    if not date:
+        return None
+    return (datetime.now(timezone.utc) - date).total_seconds()
+
+
+def stale(args) -> bool:
+    """True if the Update among a handler's `args` is one catch-up mode only enforces."""
+    if CATCH_UP is None:
+        return False
+    update = next((arg for arg in args if isinstance(arg, Update)), None)
+    return update is not None and CATCH_UP.is_stale(update)
+
+
+def skip_handler():
+    if CATCH_UP is not None:
+        CATCH_UP.skipped.inc()
+
+
+class CatchUp(object):
+    """
+    Catch-up mode for the backlog Telegram holds for us after downtime. Updates that arrive more than `max_lag`
+    seconds late only go through `enforce(bot, update)` (gbans, gmutes, locks, blacklists) on a worker thread, and
+    are kept from every other handler: no welcomes for people who joined an hour ago, no filter replies to old
+    questions, no flood counts for old bursts. Once updates are less than half of `max_lag` late again the bot is
+    back to normal.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, max_lag: float, enforce):
+        self.dispatcher = dispatcher
+        self.max_lag = max_lag
+        self.enforce = enforce
+        self.active = False
+        self._started = 0.0
+        self._seen = 0
+        self.lag = 0.0
+
+        self.stale = metrics.counter("catchup.stale_updates")
+        self.skipped = metrics.counter("catchup.handlers_skipped")
+        metrics.gauge("catchup.active", lambda: int(self.active))
+        metrics.gauge("catchup.lag_seconds", lambda: round(self.lag, 1))
+
+    def register(self):
+        handler = TypeHandler(Update, self.check_update)
+        handler.update_types = ()  # only holds back updates other handlers asked for; see update_types
+        self.dispatcher.add_handler(handler, CATCHUP_GROUP)
+
+    def is_stale(self, update: Update) -> bool:
+        lag = update_lag(update)
+        # half the threshold to leave, so the mode doesn't flap while the lag hovers around it
+        return lag is not None and lag > (self.max_lag / 2 if self.active else self.max_lag)
+
+    # runs on the dispatcher thread, for every update, before any other handler
+    def check_update(self, bot, update: Update):
+        lag = update_lag(update)
+        if lag is None:
+            return
+        self.lag = lag
+
+        if not self.is_stale(update):
+            if self.active:
+                self.active = False
+                LOGGER.info("Caught up: %s stale updates enforced in %.0fs, back to normal processing",
+                            self._seen, time.monotonic() - self._started)
+            return
+
+        if not self.active:
+            self.active = True
+            self._started = time.monotonic()
+            self._seen = 0
+            LOGGER.info("Updates are %.0fs behind; catching up with enforcement only", lag)
+
+        self._seen += 1
+        self.stale.inc()
+        if PASSTHROUGH(update):
+            return
+        self.dispatcher.run_async(self.enforce, bot, update)
+        raise DispatcherHandlerStop
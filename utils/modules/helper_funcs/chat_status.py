@@ -1,13 +1,63 @@
 from functools import wraps
-from typing import Optional
+from typing import Optional, List
 
 from telegram import User, Chat, ChatMember, Update, Bot
 
 from utils import DEL_CMDS, SUDO_USERS, WHITELIST_USERS
+from utils.modules.helper_funcs import context as update_context
+from utils.modules.helper_funcs.cache import TTLCache
+
+ADMIN_STATUSES = ('administrator', 'creator')
+
+# (chat_id, user_id) -> ChatMember.status. Promotions done outside the bot are picked up once the entry expires.
+ADMIN_CACHE_TTL = 5 * 60
+ADMIN_CACHE_SIZE = 20000
+ADMIN_CACHE = TTLCache(ADMIN_CACHE_SIZE, ADMIN_CACHE_TTL)
+
+
+# chat_id -> the bot's own ChatMember. Kept short-lived since rights changes don't reach us as updates.
+BOT_MEMBER_TTL = 60
+BOT_MEMBER_CACHE_SIZE = 5000
+BOT_MEMBER_CACHE = TTLCache(BOT_MEMBER_CACHE_SIZE, BOT_MEMBER_TTL)
+
+
+def get_member_status(chat: Chat, user_id: int, member: ChatMember = None) -> str:
+    key = (chat.id, user_id)
+    if member:
+        ADMIN_CACHE.set(key, member.status)
+        return member.status
+
+    status = ADMIN_CACHE.get(key)
+    if status is None:
+        status = chat.get_member(user_id).status
+        ADMIN_CACHE.set(key, status)
+    return status
+
+
+def cache_admin_list(chat_id: int, administrators: List[ChatMember]) -> None:
+    ADMIN_CACHE.pop_matching(lambda key: key[0] == chat_id)
+    for admin in administrators:
+        ADMIN_CACHE.set((chat_id, admin.user.id), admin.status)
+
+
+def invalidate_member_status(chat_id: int, user_id: int) -> None:
+    ADMIN_CACHE.pop((chat_id, user_id))
+
+
+def get_bot_member(chat: Chat, bot_id: int) -> ChatMember:
+    bot_member = BOT_MEMBER_CACHE.get(chat.id)
+    if bot_member is None:
+        bot_member = chat.get_member(bot_id)
+        BOT_MEMBER_CACHE.set(chat.id, bot_member)
+    return bot_member
+
+
+def invalidate_bot_member(chat_id: int) -> None:
+    BOT_MEMBER_CACHE.pop(chat_id)
 
 
 def can_delete(chat: Chat, bot_id: int) -> bool:
-    return chat.get_member(bot_id).can_delete_messages
+    return get_bot_member(chat, bot_id).can_delete_messages
 
 
 def is_user_ban_protected(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
@@ -17,9 +67,7 @@ def is_user_ban_protected(chat: Chat, user_id: int, member: ChatMember = None) -
             or chat.all_members_are_administrators:
         return True
 
-    if not member:
-        member = chat.get_member(user_id)
-    return member.status in ('administrator', 'creator')
+    return get_member_status(chat, user_id, member) in ADMIN_STATUSES
 
 
 def is_user_admin(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
@@ -28,9 +76,7 @@ def is_user_admin(chat: Chat, user_id: int, member: ChatMember = None) -> bool:
             or chat.all_members_are_administrators:
         return True
 
-    if not member:
-        member = chat.get_member(user_id)
-    return member.status in ('administrator', 'creator')
+    return get_member_status(chat, user_id, member) in ADMIN_STATUSES
 
 
 def is_bot_admin(chat: Chat, bot_id: int, bot_member: ChatMember = None) -> bool:
@@ -39,19 +85,20 @@ def is_bot_admin(chat: Chat, bot_id: int, bot_member: ChatMember = None) -> bool
         return True
 
     if not bot_member:
-        bot_member = chat.get_member(bot_id)
-    return bot_member.status in ('administrator', 'creator')
+        bot_member = get_bot_member(chat, bot_id)
+    return bot_member.status in ADMIN_STATUSES
 
 
 def is_user_in_chat(chat: Chat, user_id: int) -> bool:
     member = chat.get_member(user_id)
+    get_member_status(chat, user_id, member)
     return member.status not in ('left', 'kicked')
 
 
 def bot_can_delete(func):
     @wraps(func)
     def delete_rights(bot: Bot, update: Update, *args, **kwargs):
-        if can_delete(update.effective_chat, bot.id):
+        if update_context.get_context(update, bot).bot_member.can_delete_messages:
             return func(bot, update, *args, **kwargs)
         else:
             update.effective_message.reply_text("I can't delete messages here! "
@@ -63,7 +110,7 @@ def bot_can_delete(func):
 def can_pin(func):
     @wraps(func)
     def pin_rights(bot: Bot, update: Update, *args, **kwargs):
-        if update.effective_chat.get_member(bot.id).can_pin_messages:
+        if update_context.get_context(update, bot).bot_member.can_pin_messages:
             return func(bot, update, *args, **kwargs)
         else:
             update.effective_message.reply_text("I can't pin messages here! "
@@ -75,7 +122,7 @@ def can_pin(func):
 def can_promote(func):
     @wraps(func)
     def promote_rights(bot: Bot, update: Update, *args, **kwargs):
-        if update.effective_chat.get_member(bot.id).can_promote_members:
+        if update_context.get_context(update, bot).bot_member.can_promote_members:
             return func(bot, update, *args, **kwargs)
         else:
             update.effective_message.reply_text("I can't promote/demote people here! "
@@ -87,7 +134,7 @@ def can_promote(func):
 def can_restrict(func):
     @wraps(func)
     def promote_rights(bot: Bot, update: Update, *args, **kwargs):
-        if update.effective_chat.get_member(bot.id).can_restrict_members:
+        if update_context.get_context(update, bot).bot_member.can_restrict_members:
             return func(bot, update, *args, **kwargs)
         else:
             update.effective_message.reply_text("I can't restrict people here! "
@@ -99,7 +146,7 @@ def can_restrict(func):
 def bot_admin(func):
     @wraps(func)
     def is_admin(bot: Bot, update: Update, *args, **kwargs):
-        if is_bot_admin(update.effective_chat, bot.id):
+        if update_context.get_context(update, bot).bot_is_admin:
             return func(bot, update, *args, **kwargs)
         else:
             update.effective_message.reply_text("I'm not admin!")
@@ -111,7 +158,7 @@ def user_admin(func):
     @wraps(func)
     def is_admin(bot: Bot, update: Update, *args, **kwargs):
         user = update.effective_user  # type: Optional[User]
-        if user and is_user_admin(update.effective_chat, user.id):
+        if user and update_context.get_context(update, bot).user_is_admin:
             return func(bot, update, *args, **kwargs)
 
         elif not user:
@@ -125,6 +172,7 @@ def user_admin(func):
             update.effective_message.reply_text("Who dis non-admin telling me what to do?")
             return
 
+    is_admin.admin_command = True  # @wraps carries it up to the handler callback; see shedding.admin_commands
     return is_admin
 
 
@@ -132,7 +180,7 @@ def user_admin_no_reply(func):
     @wraps(func)
     def is_admin(bot: Bot, update: Update, *args, **kwargs):
         user = update.effective_user  # type: Optional[User]
-        if user and is_user_admin(update.effective_chat, user.id):
+        if user and update_context.get_context(update, bot).user_is_admin:
             return func(bot, update, *args, **kwargs)
 
         elif not user:
@@ -141,6 +189,7 @@ def user_admin_no_reply(func):
         elif DEL_CMDS and " " not in update.effective_message.text:
             update.effective_message.delete()
 
+    is_admin.admin_command = True
     return is_admin
 
 
@@ -148,7 +197,7 @@ def user_not_admin(func):
     @wraps(func)
     def is_not_admin(bot: Bot, update: Update, *args, **kwargs):
         user = update.effective_user  # type: Optional[User]
-        if user and not is_user_admin(update.effective_chat, user.id):
+        if user and not update_context.get_context(update, bot).user_is_admin:
             return func(bot, update, *args, **kwargs)
 
     return is_not_admin
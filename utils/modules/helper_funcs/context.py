@@ -0,0 +1,96 @@
+from collections import namedtuple
+from typing import Optional
+
+from telegram import Bot, Update, Chat, User, Message, ChatMember
+
+# module imports, not names: chat_status reads the context in its decorators
+from utils.modules.helper_funcs import capabilities, chat_status
+
+CMD_STARTERS = ('/', '!')
+
+_UNSET = object()
+
+# where the context lives on the Update; the leading underscore keeps it out of Update.to_dict()
+_ATTR = "_update_context"
+
+# "/warn@MyBot spam links" -> Command("warn", "mybot", ["spam", "links"])
+Command = namedtuple("Command", ["name", "bot", "args"])
+
+
+def extract_text(message) -> str:
+    return message.text or message.caption or (message.sticker.emoji if message.sticker else None)
+
+
+def get_context(update: Update, bot: Bot = None) -> "UpdateContext":
+    """The update's UpdateContext, made on first use; every handler that sees the update shares it."""
+    context = update.__dict__.get(_ATTR)
+    if context is None:
+        # setdefault, so two threads racing here still end up with the same one
+        context = update.__dict__.setdefault(_ATTR, UpdateContext(bot, update))
+    return context
+
+
+class UpdateContext(object):
+    """Per-update values several handlers need; each one is worked out once, on first use."""
+
+    def __init__(self, bot: Optional[Bot], update: Update):
+        self.update = update
+        self.chat = update.effective_chat  # type: Optional[Chat]
+        self.user = update.effective_user  # type: Optional[User]
+        self.message = update.effective_message  # type: Optional[Message]
+        # handlers' check_update() has no bot to hand; every message carries one
+        self.bot = bot or (self.message.bot if self.message else None)
+        self._text = _UNSET
+        self._command = _UNSET
+        self._admins = {}
+        self._bot_member = None
+        self._capabilities = None
+
+    @property
+    def text(self) -> Optional[str]:
+        """The text to match triggers against: the message text, caption or sticker emoji."""
+        if self._text is _UNSET:
+            self._text = extract_text(self.message) if self.message else None
+        return self._text
+
+    @property
+    def command(self) -> Optional[Command]:
+        """The command this message starts with, lowercased, or None."""
+        if self._command is _UNSET:
+            self._command = None
+            text = self.message.text if self.message else None
+            if text and len(text) > 1 and text.startswith(CMD_STARTERS):
+                words = text.split()
+                name, _, bot = words[0][1:].partition('@')
+                if name:
+                    self._command = Command(name.lower(), bot.lower() or None, words[1:])
+        return self._command
+
+    def is_admin(self, user_id: int) -> bool:
+        if user_id not in self._admins:
+            self._admins[user_id] = chat_status.is_user_admin(self.chat, user_id)
+        return self._admins[user_id]
+
+    @property
+    def user_is_admin(self) -> bool:
+        return bool(self.user) and self.is_admin(self.user.id)
+
+    @property
+    def bot_member(self) -> ChatMember:
+        """The bot's own member record in this chat, for its admin rights."""
+        if self._bot_member is None:
+            self._bot_member = chat_status.get_bot_member(self.chat, self.bot.id)
+        return self._bot_member
+
+    @property
+    def bot_is_admin(self) -> bool:
+        if self.chat.type == 'private' or self.chat.all_members_are_administrators:
+            return True
+        return chat_status.is_bot_admin(self.chat, self.bot.id, bot_member=self.bot_member)
+
+    @property
+    def capabilities(self) -> int:
+        """Snapshot of what the chat has configured, as capability bits."""
+        if self._capabilities is None:
+            self._capabilities = capabilities.get_capabilities(self.chat.id) if self.chat else 0
+        return self._capabilities
@@ -0,0 +1,209 @@
+from queue import Queue
+from threading import Lock, Thread, current_thread
+from time import monotonic
+
+from telegram import Update
+from telegram.ext import Dispatcher, DispatcherHandlerStop
+from telegram.utils.promise import Promise
+
+from utils import LOGGER
+from utils.modules.helper_funcs import metrics
+
+
+_RETIRE = object()  # queued by ScalableDispatcher.resize() to let one thread go
+
+
+def long_running(func):
+    """
+    Mark a handler as slow (purges, imports, outside HTTP calls) so a ShardedDispatcher runs it on its
+    long-running pool instead of holding up a chat lane. Goes below @run_async.
+    """
+    func.long_running = True
+    return func
+
+
+def _chat_key(args):
+    for arg in args:
+        if isinstance(arg, Update):
+            if arg.effective_chat:
+                return arg.effective_chat.id
+            if arg.effective_user:
+                return arg.effective_user.id
+            return arg.update_id
+    return None
+
+
+class PoolDispatcher(Dispatcher):
+    """
+    Base for Dispatchers that run @run_async work on their own threads and queues instead of the stock pool. Keeps
+    count of how busy those threads are, for the autoscaler.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._threads = []  # (thread, queue it reads from)
+        self._threads_lock = Lock()
+        self._retiring = 0  # _RETIREs queued that no thread has picked up yet
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._completed = 0
+
+    @classmethod
+    def _set_singleton(cls, val):
+        # run_async looks the instance up on Dispatcher itself, not on this subclass
+        Dispatcher._set_singleton(val)
+
+    def _start_thread(self, queue, name):
+        thread = Thread(target=self._worker, args=(queue,), name=name)
+        with self._threads_lock:
+            self._threads.append((thread, queue))
+        thread.start()
+
+    def _worker(self, queue):
+        while 1:
+            promise = queue.get()
+
+            if promise is _RETIRE:
+                with self._threads_lock:
+                    self._threads = [(thr, q) for thr, q in self._threads if thr is not current_thread()]
+                    self._retiring -= 1
+                break
+
+            # None is the stop signal from stop()
+            if not isinstance(promise, Promise):
+                self.logger.debug("Closing thread %s", current_thread().getName())
+                break
+
+            start = monotonic()
+            with self._threads_lock:
+                self._busy += 1
+            promise.run()
+            with self._threads_lock:
+                self._busy -= 1
+                self._busy_seconds += monotonic() - start
+                self._completed += 1
+
+            if isinstance(promise.exception, DispatcherHandlerStop):
+                self.logger.warning(
+                    'DispatcherHandlerStop is not supported with async functions; func: %s',
+                    promise.pooled_function.__name__)
+
+    def take_stats(self):
+        """(handlers completed, seconds spent in handlers, handlers running now) since the last call."""
+        with self._threads_lock:
+            stats = (self._completed, self._busy_seconds, self._busy)
+            self._completed, self._busy_seconds = 0, 0.0
+        return stats
+
+    def queued(self) -> int:
+        return 0
+
+    def stop(self):
+        super().stop()
+
+        with self._threads_lock:
+            threads, self._threads = self._threads, []
+        for _, queue in threads:
+            queue.put(None)
+        for thread, _ in threads:
+            thread.join()
+        LOGGER.debug("Stopped %s worker threads", len(threads))
+
+    @property
+    def has_running_threads(self):
+        return self.running or bool(self._threads)
+
+
+class ScalableDispatcher(PoolDispatcher):
+    """The stock single shared pool, except that it can be resized while running."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._queue = Queue()
+        self._base_name = ''
+        self._thread_num = 0
+
+        metrics.gauge("executor.workers", self._live_workers)
+        metrics.gauge("executor.queued", self._queue.qsize)
+
+    def _init_async_threads(self, base_name, workers):
+        self._base_name = '{}_'.format(base_name) if base_name else ''
+        self.resize(workers)
+
+    def _live_workers(self) -> int:
+        """Threads running, less the ones already told to retire."""
+        with self._threads_lock:
+            return len(self._threads) - self._retiring
+
+    def resize(self, workers: int):
+        """Start or retire threads until there are `workers`; busy ones finish their current handler first."""
+        with self._threads_lock:
+            current = len(self._threads) - self._retiring
+            retire = max(0, current - workers)
+            self._retiring += retire
+        for _ in range(workers - current):
+            self._thread_num += 1
+            self._start_thread(self._queue, 'Bot:{}:worker:{}{}'.format(self.bot.id, self._base_name,
+                                                                       self._thread_num))
+        for _ in range(retire):
+            self._queue.put(_RETIRE)
+        self.workers = workers
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def run_async(self, func, *args, **kwargs):
+        promise = Promise(func, args, kwargs)
+        self._queue.put(promise)
+        return promise
+
+
+class ShardedDispatcher(PoolDispatcher):
+    """
+    A Dispatcher whose @run_async work is hashed by chat_id onto `workers` lanes, each one thread with its own
+    queue. A chat's handlers run one at a time and in the order its updates arrived, while different chats run in
+    parallel. Handlers marked @long_running go to a separate pool of `long_workers` threads.
+    """
+
+    def __init__(self, *args, long_workers: int = 4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.long_workers = long_workers
+        self._lanes = []
+        self._long_queue = Queue()
+        self._next_lane = 0
+
+        metrics.gauge("executor.lanes", lambda: len(self._lanes))
+        metrics.gauge("executor.queued", self.queued)
+        metrics.gauge("executor.busiest_lane", lambda: max((lane.qsize() for lane in self._lanes), default=0))
+        metrics.gauge("executor.long_queued", self._long_queue.qsize)
+
+    def _init_async_threads(self, base_name, workers):
+        base_name = '{}_'.format(base_name) if base_name else ''
+
+        self._lanes = [Queue() for _ in range(workers)]
+        for i, lane in enumerate(self._lanes):
+            self._start_thread(lane, 'Bot:{}:lane:{}{}'.format(self.bot.id, base_name, i))
+        for i in range(self.long_workers):
+            self._start_thread(self._long_queue, 'Bot:{}:long:{}{}'.format(self.bot.id, base_name, i))
+
+    def queued(self) -> int:
+        return sum(lane.qsize() for lane in self._lanes)
+
+    def run_async(self, func, *args, **kwargs):
+        promise = Promise(func, args, kwargs)
+        if getattr(func, "long_running", False) or not self._lanes:
+            self._long_queue.put(promise)
+            return promise
+
+        key = _chat_key(args)
+        if key is None:  # jobs and the like; no ordering to keep
+            self._next_lane = (self._next_lane + 1) % len(self._lanes)
+            lane = self._next_lane
+        else:
+            lane = hash(key) % len(self._lanes)
+        self._lanes[lane].put(promise)
+        return promise
+
+    def stop(self):
+        super().stop()
+        self._lanes = []
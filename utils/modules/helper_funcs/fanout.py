@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram import Bot
+from telegram.error import BadRequest, ChatMigrated, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from utils import LOGGER, FANOUT_WORKERS, FANOUT_RATE
+from utils.modules.helper_funcs.outbound import PRIORITY_BULK, outbound_priority
+from utils.modules.helper_funcs.rate_limit import RateLimiter
+from utils.modules.sql import fanout_sql as sql
+
+PER_CHAT_RATE = 1  # calls per second into a single chat
+PER_CHAT_BURST = 3
+MAX_ATTEMPTS = 5
+PROGRESS_INTERVAL = 2  # seconds between progress writes
+PROGRESS_BATCH = 200  # ...or this many finished chats, whichever comes first
+
+# run(bot, chat_id, job) does the work for one chat. BadRequests whose message is in `ignored_errors` count as
+# done, anything else unexpected as failed. on_finish(bot, job) runs once the job is complete, or cancelled.
+FanoutAction = namedtuple("FanoutAction", ["run", "ignored_errors", "on_finish"])
+
+ACTIONS = {}
+RUNNERS = {}  # job_id -> FanoutRunner, for the jobs running in this process
+RUNNERS_LOCK = threading.Lock()
+
+FANOUT_LIMITER = RateLimiter(FANOUT_RATE, PER_CHAT_RATE, PER_CHAT_BURST)
+FANOUT_POOL = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+
+
+class FanoutRunner(object):
+    """Feeds one job's pending chats to the shared pool, FANOUT_WORKERS at a time, and checkpoints progress."""
+
+    def __init__(self, bot: Bot, job: sql.FanoutJob, action: FanoutAction):
+        self.bot = bot
+        self.job = job
+        self.action = action
+        self.done = job.done
+        self.failed = job.failed
+        self.cancelled = False
+        self._slots = threading.Semaphore(FANOUT_WORKERS)
+        self._lock = threading.Lock()
+        self._finished_done = []
+        self._finished_failed = []
+        self._thread = threading.Thread(target=self._run, name="fanout-job-{}".format(job.job_id), daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _run(self):
+        job = self.job
+        last_write = time.monotonic()
+        try:
+            for chat_id in sql.get_pending_targets(job.job_id):
+                if self.cancelled:
+                    break
+                self._slots.acquire()
+                FANOUT_POOL.submit(self._run_chat, chat_id)
+
+                if time.monotonic() - last_write > PROGRESS_INTERVAL \
+                        or len(self._finished_done) + len(self._finished_failed) >= PROGRESS_BATCH:
+                    self._write_progress()
+                    last_write = time.monotonic()
+                    # cancel_job() in another shard process can only reach us through the database
+                    if sql.get_job_status(job.job_id) != sql.JOB_RUNNING:
+                        self.cancel()
+
+            for _ in range(FANOUT_WORKERS):  # wait for the calls still in flight
+                self._slots.acquire()
+            self._write_progress()
+
+            if not sql.finish_job(job.job_id, sql.JOB_CANCELLED if self.cancelled else sql.JOB_DONE):
+                self.cancelled = True  # cancelled elsewhere after our last check
+            job.done, job.failed = self.done, self.failed
+            job.status = sql.JOB_CANCELLED if self.cancelled else sql.JOB_DONE
+            if self.action.on_finish:
+                self.action.on_finish(self.bot, job)
+
+        except Exception:
+            # the job stays "running" in the database, so it is picked up again on the next start
+            LOGGER.exception("Fanout job %s stopped", job.job_id)
+
+        finally:
+            with RUNNERS_LOCK:
+                RUNNERS.pop(job.job_id, None)
+
+    def _write_progress(self):
+        with self._lock:
+            done, failed = self._finished_done, self._finished_failed
+            self._finished_done, self._finished_failed = [], []
+        sql.mark_targets(self.job.job_id, done, failed)
+
+    def _run_chat(self, chat_id):
+        target = chat_id
+        ok = False
+        try:
+            for attempt in range(MAX_ATTEMPTS):
+                if self.cancelled:
+                    return
+
+                FANOUT_LIMITER.acquire(target)
+                try:
+                    with outbound_priority(PRIORITY_BULK):
+                        self.action.run(self.bot, target, self.job)
+                    ok = True
+                    break
+                except RetryAfter as excp:
+                    # Telegram wants everyone to slow down, not just this chat
+                    FANOUT_LIMITER.pause(excp.retry_after)
+                except ChatMigrated as excp:
+                    target = excp.new_chat_id
+                except BadRequest as excp:
+                    ok = excp.message in self.action.ignored_errors
+                    if not ok:
+                        LOGGER.warning("Fanout job %s: %s in %s failed: %s", self.job.job_id, self.job.kind,
+                                       target, excp.message)
+                    break
+                except (TimedOut, NetworkError):
+                    time.sleep(2 ** attempt)
+                except TelegramError:
+                    ok = True  # kicked from the chat and the like; nothing left to do there
+                    break
+            else:
+                LOGGER.warning("Fanout job %s: giving up on %s", self.job.job_id, target)
+
+        except Exception:
+            LOGGER.exception("Fanout job %s: error in %s", self.job.job_id, target)
+
+        finally:
+            with self._lock:
+                if ok:
+                    self.done += 1
+                    self._finished_done.append(chat_id)
+                elif not self.cancelled:
+                    self.failed += 1
+                    self._finished_failed.append(chat_id)
+            self._slots.release()
+
+
+def register_action(kind: str, run, ignored_errors=(), on_finish=None):
+    ACTIONS[kind] = FanoutAction(run, frozenset(ignored_errors), on_finish)
+
+
+def _start_runner(bot: Bot, job: sql.FanoutJob) -> FanoutRunner:
+    runner = FanoutRunner(bot, job, ACTIONS[job.kind])
+    with RUNNERS_LOCK:
+        RUNNERS[job.job_id] = runner
+    runner.start()
+    return runner
+
+
+def start_job(bot: Bot, kind: str, user_id: int, chat_ids, user_name=None, started_by=None) -> FanoutRunner:
+    """Persist a job over `chat_ids` and start running it in the background."""
+    if kind not in ACTIONS:
+        raise ValueError("Unknown fanout action: {}".format(kind))
+
+    job_id = sql.create_job(kind, user_id, chat_ids, user_name, started_by)
+    return _start_runner(bot, sql.get_job(job_id))
+
+
+def resume_jobs(bot: Bot):
+    """Restart the jobs a previous run left unfinished."""
+    for job in sql.get_running_jobs():
+        if job.kind not in ACTIONS:
+            continue
+        with RUNNERS_LOCK:
+            if job.job_id in RUNNERS:
+                continue
+        LOGGER.info("Resuming fanout job %s (%s of %s, %s/%s done)", job.job_id, job.kind, job.user_id,
+                    job.done + job.failed, job.total)
+        _start_runner(bot, job)
+
+
+def cancel_job(job_id: int) -> bool:
+    with RUNNERS_LOCK:
+        runner = RUNNERS.get(job_id)
+    if runner:
+        runner.cancel()
+        return True
+
+    # running in another shard process, which sees this on its next checkpoint, or left over from a previous run
+    # with no action to resume it
+    job = sql.get_job(job_id)
+    if job and job.status == sql.JOB_RUNNING:
+        sql.finish_job(job_id, sql.JOB_CANCELLED)
+        return True
+    return False
+
+
+def cancel_user_jobs(kind: str, user_id: int):
+    """Stop any running `kind` jobs for a user, e.g. the gban fanout when they get ungbanned."""
+    for job in sql.get_running_jobs():
+        if job.kind == kind and job.user_id == int(user_id):
+            cancel_job(job.job_id)
+
+
+def get_progress():
+    """(job, done, failed) for every unfinished job, with live counters for the ones running here."""
+    with RUNNERS_LOCK:
+        runners = dict(RUNNERS)
+    progress = []
+    for job in sql.get_running_jobs():
+        runner = runners.get(job.job_id)
+        if runner:
+            progress.append((job, runner.done, runner.failed))
+        else:
+            progress.append((job, job.done, job.failed))
+    return progress
@@ -0,0 +1,98 @@
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Stripe(object):
+    __slots__ = ("lock", "users", "streaks")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (chat_id, user_id) -> [expires_at, deque of timestamps], least recently active first
+        self.users = OrderedDict()
+        self.streaks = {}  # chat_id -> (user_id, count), for chats still on consecutive-message counting
+
+
+class FloodDetector(object):
+    """
+    Per-user flood detection: "more than `limit` messages in `window` seconds", one fixed-size ring buffer of
+    timestamps per (chat, user). A `window` of 0 keeps the old rule, `limit` consecutive messages from the same
+    user with nobody else talking in between.
+
+    State is split into stripes by chat, each with its own lock, so busy chats don't serialise each other.
+    Entries are dropped once their newest timestamp has left the window, and the least recently active ones go
+    first when a stripe holds more than its share of `max_entries`.
+    """
+
+    def __init__(self, stripes: int = 64, max_entries: int = 200000):
+        self._stripes = [_Stripe() for _ in range(stripes)]
+        self._stripe_max = max(1, max_entries // stripes)
+
+    def _stripe(self, chat_id) -> _Stripe:
+        return self._stripes[hash(chat_id) % len(self._stripes)]
+
+    def hit(self, chat_id, user_id, limit: int, window: int, now: float = None) -> bool:
+        """Record a message; True if it pushed the user over the limit. `user_id` None just breaks streaks."""
+        if limit <= 0:
+            return False
+
+        stripe = self._stripe(chat_id)
+        with stripe.lock:
+            if not window:
+                return self._hit_streak(stripe, chat_id, user_id, limit)
+
+            if user_id is None:
+                return False
+
+            now = time.monotonic() if now is None else now
+            self._evict(stripe, now)
+
+            key = (chat_id, user_id)
+            entry = stripe.users.get(key)
+            if entry is None or entry[1].maxlen != limit:
+                entry = stripe.users[key] = [0, deque(maxlen=limit)]
+            else:
+                stripe.users.move_to_end(key)
+
+            stamps = entry[1]
+            flooded = len(stamps) == limit and now - stamps[0] < window
+            if flooded:
+                del stripe.users[key]  # start over, so one flood means one action
+            else:
+                stamps.append(now)
+                entry[0] = now + window
+            return flooded
+
+    @staticmethod
+    def _hit_streak(stripe: _Stripe, chat_id, user_id, limit: int) -> bool:
+        curr_user_id, count = stripe.streaks.get(chat_id, (None, 0))
+        if user_id is None or user_id != curr_user_id:
+            stripe.streaks[chat_id] = (user_id, 0)
+            return False
+
+        count += 1
+        if count > limit:
+            stripe.streaks[chat_id] = (None, 0)
+            return True
+
+        stripe.streaks[chat_id] = (user_id, count)
+        return False
+
+    def _evict(self, stripe: _Stripe, now: float):
+        users = stripe.users
+        while users:
+            key, (expires_at, _) = next(iter(users.items()))
+            if expires_at > now and len(users) < self._stripe_max:
+                break
+            del users[key]
+
+    def reset_chat(self, chat_id):
+        """Forget all counters for a chat, e.g. after its settings changed."""
+        stripe = self._stripe(chat_id)
+        with stripe.lock:
+            stripe.streaks.pop(chat_id, None)
+            for key in [key for key in stripe.users if key[0] == chat_id]:
+                del stripe.users[key]
+
+    def __len__(self):
+        return sum(len(stripe.users) + len(stripe.streaks) for stripe in self._stripes)
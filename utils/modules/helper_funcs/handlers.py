@@ -1,7 +1,8 @@
 import telegram.ext as tg
 from telegram import Update
+from telegram.ext.commandhandler import CommandHandler  # the stock class; tg.CommandHandler gets swapped out
 
-CMD_STARTERS = ('/', '!')
+from utils.modules.helper_funcs.context import get_context
 
 
 class CustomCommandHandler(tg.CommandHandler):
@@ -11,24 +12,13 @@ class CustomCommandHandler(tg.CommandHandler):
         super().__init__(command, callback, **kwargs)
 
     def check_update(self, update):
-        if (isinstance(update, Update)
-                and (update.message or update.edited_message and self.allow_edited)):
-            message = update.message or update.edited_message
-
-            if message.text and len(message.text) > 1:
-                fst_word = message.text_html.split(None, 1)[0]
-                if len(fst_word) > 1 and any(fst_word.startswith(start) for start in CMD_STARTERS):
-                    command = fst_word[1:].split('@')
-                    command.append(message.bot.username)  # in case the command was sent without a username
-                    if self.filters is None:
-                        res = True
-                    elif isinstance(self.filters, list):
-                        res = any(func(message) for func in self.filters)
-                    else:
-                        res = self.filters(message)
-
-                    return res and (command[0].lower() in self.command
-                                    and command[1].lower() == message.bot.username.lower())
+        if isinstance(update, Update) and update.effective_message:
+            command = get_context(update).command
+            if command and command.name in self.command \
+                    and command.bot in (None, update.effective_message.bot.username.lower()):
+                filter_result = self.filters(update)
+                if filter_result:
+                    return command.args, filter_result
 
             return False
 
@@ -36,3 +26,68 @@ class CustomCommandHandler(tg.CommandHandler):
 class CustomRegexHandler(tg.RegexHandler):
     def __init__(self, pattern, callback, friendly="", **kwargs):
         super().__init__(pattern, callback, **kwargs)
+
+
+class CapabilityMessageHandler(tg.MessageHandler):
+    """
+    A MessageHandler that only matches in chats with one of `capabilities` (see helper_funcs.capabilities). The
+    check is a dict lookup done in check_update, so chats with nothing configured never get a run_async task.
+    """
+
+    def __init__(self, filters, callback, capabilities, **kwargs):
+        super().__init__(filters, callback, **kwargs)
+        self.capabilities = capabilities
+
+    def check_update(self, update):
+        if isinstance(update, Update) and update.effective_chat \
+                and not get_context(update).capabilities & self.capabilities:
+            return False
+        return super().check_update(update)
+
+
+class CommandRouter(tg.Handler):
+    """
+    Stands in for all the CommandHandlers of one handler group. The message's command is parsed once (see
+    UpdateContext.command) and looked up in a dict, so only the handlers for that command run their check_update,
+    filters and disable checks included. Messages that aren't commands are turned away after one prefix check.
+    """
+
+    def __init__(self, handlers):
+        super().__init__(None)
+        self.routes = {}  # command -> [handler], in registration order
+        for handler in handlers:
+            for command in handler.command:
+                self.routes.setdefault(command, []).append(handler)
+
+    def check_update(self, update):
+        if not isinstance(update, Update) or not update.effective_message:
+            return None
+
+        command = get_context(update).command
+        if not command:
+            return None
+
+        for handler in self.routes.get(command.name, ()):
+            check = handler.check_update(update)
+            if check is not None and check is not False:
+                return handler, check
+        return None
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        handler, check = check_result
+        return handler.handle_update(update, dispatcher, check, context)
+
+
+def route_commands(dispatcher: tg.Dispatcher):
+    """
+    Swap each handler group's CommandHandlers for one CommandRouter, where the first of them stood. Call it once
+    every module has registered its handlers.
+    """
+    for group, handlers in dispatcher.handlers.items():
+        commands = [handler for handler in handlers if isinstance(handler, CommandHandler)]
+        if len(commands) < 2:
+            continue
+
+        index = handlers.index(commands[0])
+        handlers[:] = [handler for handler in handlers if not isinstance(handler, CommandHandler)]
+        handlers.insert(index, CommandRouter(commands))
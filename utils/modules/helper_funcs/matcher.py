@@ -0,0 +1,157 @@
+import re
+import threading
+
+try:
+    from re._casefix import _EXTRA_CASES  # Python 3.11+
+except ImportError:
+    from sre_compile import _ignorecase_fixes as _EXTRA_CASES
+
+_WORD_CHAR = re.compile(r"\w")
+
+# re.IGNORECASE also treats these lowercase letters as equal (σ and ς, i and ı, s and ſ...); each maps to one
+# representative of its set
+_FOLD = {code: chr(min((code,) + others)) for code, others in _EXTRA_CASES.items()}
+
+
+def _is_word_char(char: str) -> bool:
+    return bool(_WORD_CHAR.match(char))
+
+
+def fold(text: str) -> str:
+    """
+    `text` with each character replaced by what re.IGNORECASE compares it as: its simple lowercase, then _FOLD.
+    One character in, one character out, so offsets into the result are offsets into `text`.
+    """
+    lowered = text.lower()
+    if len(lowered) != len(text):  # İ lowercases to two characters; its simple lowercase is just "i"
+        lowered = "".join(char.lower()[0] for char in text)
+    return lowered.translate(_FOLD)
+
+
+class KeywordMatcher(object):
+    """
+    Aho-Corasick automaton over a set of keywords, for single-pass, case-insensitive whole-word matching.
+
+    A keyword only counts when it isn't glued to a word character on either side, the same rule as
+    `( |^|[^\\w])keyword( |$|[^\\w])` with re.IGNORECASE, whose case rules fold() copies. Adding a keyword only
+    extends the trie; failure links are recomputed lazily on the next search.
+    """
+
+    def __init__(self, keywords=()):
+        self._lock = threading.Lock()
+        self._reset()
+        for keyword in keywords:
+            self.add(keyword)
+
+    def _reset(self):
+        # one entry per trie node; node 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        self._depth = [0]
+        self._keyword = [None]  # keyword ending at this node, if any
+        self._dict_link = [0]  # nearest node down the failure chain that ends a keyword
+        self._nodes = {}  # keyword -> node
+        self._dead = 0
+        self._dirty = False
+
+    def add(self, keyword: str):
+        keyword = fold(keyword)
+        if not keyword:
+            return
+
+        with self._lock:
+            if keyword in self._nodes:
+                return
+
+            self._insert(keyword)
+            self._dirty = True
+
+    def remove(self, keyword: str) -> bool:
+        keyword = fold(keyword)
+        with self._lock:
+            node = self._nodes.pop(keyword, None)
+            if node is None:
+                return False
+
+            self._keyword[node] = None
+            self._dead += 1
+            if self._dead > len(self._nodes):
+                # too many orphaned paths; start from a clean trie
+                keywords = list(self._nodes)
+                self._reset()
+                for kw in keywords:
+                    self._insert(kw)
+            self._dirty = True
+            return True
+
+    def _insert(self, keyword):
+        node = 0
+        for char in keyword:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._depth.append(self._depth[node] + 1)
+                self._keyword.append(None)
+                self._dict_link.append(0)
+                self._goto[node][char] = nxt
+            node = nxt
+        self._keyword[node] = keyword
+        self._nodes[keyword] = node
+
+    def _build_links(self):
+        goto, fail, keyword, dict_link = self._goto, self._fail, self._keyword, self._dict_link
+        queue = []
+        for child in goto[0].values():
+            fail[child] = 0
+            dict_link[child] = 0
+            queue.append(child)
+
+        for node in queue:  # BFS; the list grows while we walk it
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                dict_link[child] = fail[child] if keyword[fail[child]] else dict_link[fail[child]]
+                queue.append(child)
+
+        self._dirty = False
+
+    def search(self, text: str):
+        """Return the first keyword found in `text` on word boundaries, or None."""
+        if not text:
+            return None
+
+        folded = fold(text)
+        last = len(text) - 1
+        with self._lock:
+            if not self._nodes:
+                return None
+            if self._dirty:
+                self._build_links()
+
+            goto, fail, depth, keyword, dict_link = self._goto, self._fail, self._depth, self._keyword, \
+                self._dict_link
+            state = 0
+            for i, char in enumerate(folded):
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+
+                found = state if keyword[state] else dict_link[state]
+                while found:
+                    start = i - depth[found] + 1
+                    if (start == 0 or not _is_word_char(text[start - 1])) \
+                            and (i == last or not _is_word_char(text[i + 1])):
+                        return keyword[found]
+                    found = dict_link[found]
+
+        return None
+
+    def __contains__(self, keyword):
+        return fold(keyword) in self._nodes
+
+    def __len__(self):
+        return len(self._nodes)
@@ -0,0 +1,47 @@
+import threading
+
+COUNTERS = {}
+GAUGES = {}  # name -> callable returning the current value
+METRICS_LOCK = threading.Lock()
+
+
+class Counter(object):
+    """A thread-safe running total."""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def counter(name: str) -> Counter:
+    """The counter called `name`, created on first use."""
+    with METRICS_LOCK:
+        if name not in COUNTERS:
+            COUNTERS[name] = Counter()
+        return COUNTERS[name]
+
+
+def gauge(name: str, func):
+    """Report `func()` as `name`; it is only called when metrics are read."""
+    with METRICS_LOCK:
+        GAUGES[name] = func
+
+
+def snapshot(prefix: str = ""):
+    """Sorted (name, value) pairs for every metric starting with `prefix`."""
+    with METRICS_LOCK:
+        counters = dict(COUNTERS)
+        gauges = dict(GAUGES)
+
+    values = {name: cnt.value for name, cnt in counters.items() if name.startswith(prefix)}
+    for name, func in gauges.items():
+        if name.startswith(prefix):
+            try:
+                values[name] = func()
+            except Exception as excp:
+                values[name] = "error: {}".format(excp)
+    return sorted(values.items())
@@ -0,0 +1,234 @@
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from telegram.error import RetryAfter, TelegramError
+from telegram.utils.request import Request
+
+from utils import LOGGER
+from utils.modules.helper_funcs import catchup, metrics, shedding
+from utils.modules.helper_funcs.rate_limit import TokenBucket
+from utils.modules.helper_funcs.cache import TTLCache
+
+# priority classes, most urgent first
+PRIORITY_MODERATION = 0  # deletes, kicks, restricts
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # welcomes, fun replies
+PRIORITY_BULK = 3  # fanout jobs, broadcasts
+
+PRIORITY_NAMES = {
+    PRIORITY_MODERATION: "moderation",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_LOW: "low",
+    PRIORITY_BULK: "bulk",
+}
+
+MODERATION_METHODS = {
+    "deleteMessage", "kickChatMember", "unbanChatMember", "restrictChatMember", "promoteChatMember",
+    "setChatPermissions", "pinChatMessage", "unpinChatMessage", "leaveChat",
+}
+# reads and webhook/update plumbing don't count against the sending limits
+UNTHROTTLED_METHODS = {
+    "getUpdates", "setWebhook", "deleteWebhook", "answerCallbackQuery", "answerInlineQuery",
+}
+
+# only these count against a group's own limit; moderation calls are never held back by a busy group
+CHAT_LIMITED_PREFIXES = ("send", "edit", "forward", "copy")
+
+CHAT_RATE = 20 / 60  # Telegram allows about 20 messages a minute into one group
+CHAT_BURST = 5
+MAX_RETRIES = 2
+MAX_RETRY_WAIT = 30  # longer RetryAfters are passed on to the caller instead of waited out (event loop only)
+# handler threads are shared by every chat, so they wait only briefly, for a group's budget or a RetryAfter
+MAX_CHAT_WAIT = 1
+MAX_THREAD_RETRY_WAIT = 2
+
+_local = threading.local()
+
+
+class ChatThrottled(TelegramError):
+    """A low priority or bulk send into a group that has used up its budget; it is dropped, not waited for."""
+
+    def __init__(self, chat_id):
+        super().__init__("Send budget of chat {} used up".format(chat_id))
+        self.chat_id = chat_id
+
+
+def chat_limited(method: str) -> bool:
+    """True for calls that post into a chat, which Telegram limits per group."""
+    return method.startswith(CHAT_LIMITED_PREFIXES) and method not in MODERATION_METHODS
+
+
+def current_priority(default=PRIORITY_NORMAL) -> int:
+    return getattr(_local, "priority", default)
+
+
+@contextmanager
+def outbound_priority(priority: int):
+    """Send every Bot API call made by this thread inside the block with `priority`."""
+    previous = getattr(_local, "priority", None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _local.priority
+        else:
+            _local.priority = previous
+
+
+def low_priority(func):
+    """
+    Handler decorator for conversational replies that can wait behind moderation actions, and that are skipped
+    altogether while the bot is shedding load or catching up on stale updates.
+    """
+
+    @wraps(func)
+    def low_priority_func(*args, **kwargs):
+        if shedding.shedding():
+            shedding.shed_handler(func.__name__)
+            return None
+        if catchup.stale(args):
+            catchup.skip_handler()
+            return None
+        with outbound_priority(PRIORITY_LOW):
+            try:
+                return func(*args, **kwargs)
+            except ChatThrottled:
+                return None  # counted as outbound.dropped; the chat is busy enough without this reply
+
+    return low_priority_func
+
+
+class OutboundScheduler(object):
+    """
+    Hands out the global send budget in priority order. Sends and edits into a group (see chat_limited) first take
+    a token from that group's own bucket, waiting at most MAX_CHAT_WAIT for it: past that, low priority and bulk
+    sends are dropped with ChatThrottled, and anything more urgent goes ahead without one. Then callers queue for
+    a global token; a single grant thread gives each token to the most urgent caller waiting at that moment.
+    """
+
+    def __init__(self, rate: float, chat_rate: float = CHAT_RATE, chat_burst: float = CHAT_BURST):
+        self.bucket = TokenBucket(rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._chats = TTLCache(10000, 3600)
+        self._chats_lock = threading.Lock()
+        self._queue = []
+        self._queued = {priority: 0 for priority in PRIORITY_NAMES}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._thread = None
+
+        self.calls = metrics.counter("outbound.calls")
+        self.retry_after = metrics.counter("outbound.retry_after")
+        self.wait_ms = metrics.counter("outbound.wait_ms")
+        self.dropped = metrics.counter("outbound.dropped")
+        self.over_budget = metrics.counter("outbound.over_chat_budget")
+        metrics.gauge("outbound.queued", lambda: len(self._queue))
+        for priority, name in PRIORITY_NAMES.items():
+            metrics.gauge("outbound.queued." + name, lambda p=priority: self._queued[p])
+        metrics.gauge("outbound.avg_wait_ms", lambda: round(self.wait_ms.value / max(1, self.calls.value), 1))
+
+    def chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            with self._chats_lock:
+                bucket = self._chats.get(chat_id)
+                if bucket is None:
+                    bucket = TokenBucket(self.chat_rate, self.chat_burst)
+                    self._chats.set(chat_id, bucket)
+        return bucket
+
+    @staticmethod
+    def is_group(chat_id) -> bool:
+        return str(chat_id).startswith("-")
+
+    def acquire(self, chat_id=None, priority: int = PRIORITY_NORMAL):
+        start = time.monotonic()
+        if chat_id is not None and self.is_group(chat_id):
+            self._acquire_chat(str(chat_id), priority)
+
+        granted = threading.Event()
+        with self._cond:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._grant_loop, name="outbound-scheduler", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._queue, (priority, next(self._seq), granted))
+            self._queued[priority] += 1
+            self._cond.notify()
+        granted.wait()
+
+        self.calls.inc()
+        self.wait_ms.inc(int((time.monotonic() - start) * 1000))
+
+    def _acquire_chat(self, chat_id: str, priority: int):
+        # never parks a handler thread for long: one busy group would otherwise tie up the workers of every chat
+        bucket = self.chat_bucket(chat_id)
+        paused = bucket.paused_for()
+        if paused > MAX_THREAD_RETRY_WAIT:
+            raise RetryAfter(int(paused) + 1)  # Telegram told us to stay out of this group for now
+        if paused:
+            time.sleep(paused)
+
+        wait = bucket.try_reserve(MAX_CHAT_WAIT)
+        if wait is None:
+            if priority >= PRIORITY_LOW:
+                self.dropped.inc()
+                raise ChatThrottled(chat_id)
+            self.over_budget.inc()
+        elif wait:
+            time.sleep(wait)
+
+    def throttled(self, chat_id, retry_after: float):
+        """Telegram answered 429: hold back that group, or everything if it wasn't a group call."""
+        self.retry_after.inc()
+        if chat_id is not None and self.is_group(chat_id):
+            self.chat_bucket(str(chat_id)).pause(retry_after)
+        else:
+            self.bucket.pause(retry_after)
+
+    def _grant_loop(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            # wait for the token before choosing who gets it, so anything urgent queued meanwhile goes first
+            self.bucket.acquire()
+            with self._cond:
+                priority, _, granted = heapq.heappop(self._queue)
+                self._queued[priority] -= 1
+            granted.set()
+
+
+class ScheduledRequest(Request):
+    """A Request that sends every rate-limited Bot API call through an OutboundScheduler."""
+
+    def __init__(self, scheduler: OutboundScheduler, **kwargs):
+        super().__init__(**kwargs)
+        self.scheduler = scheduler
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit("/", 1)[-1]
+        if method.startswith("get") or method in UNTHROTTLED_METHODS:
+            return super().post(url, data, timeout=timeout)
+
+        chat_id = data.get("chat_id")
+        limited = chat_limited(method)
+        default = PRIORITY_MODERATION if method in MODERATION_METHODS else PRIORITY_NORMAL
+        priority = current_priority(default)
+        for attempt in range(MAX_RETRIES + 1):
+            self.scheduler.acquire(chat_id if limited else None, priority)
+            try:
+                # post() rewrites the dict it gets, so give every attempt its own copy
+                return super().post(url, dict(data), timeout=timeout)
+            except RetryAfter as excp:
+                self.scheduler.throttled(chat_id, excp.retry_after)
+                if attempt == MAX_RETRIES or excp.retry_after > MAX_THREAD_RETRY_WAIT:
+                    raise
+                LOGGER.info("Flood wait of %ss on %s in %s, retrying", excp.retry_after, method, chat_id)
+                if not limited and self.scheduler.is_group(chat_id):
+                    time.sleep(excp.retry_after)  # the group's bucket doesn't hold this call back; wait it out here
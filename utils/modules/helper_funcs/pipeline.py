@@ -0,0 +1,71 @@
+from collections import namedtuple
+
+from telegram import Bot, Update
+from telegram.ext import MessageHandler, Filters, Handler
+from telegram.ext.dispatcher import run_async
+
+from utils import dispatcher, LOGGER, MODERATION_PIPELINE
+from utils.modules.helper_funcs.context import get_context
+
+PIPELINE_GROUP = 1
+
+# The order stages run in. Only the first destructive stage (delete, kick, mute...) gets to act; the
+# `always` ones (user logging) run regardless.
+STAGE_ORDER = ("gban", "gmute", "restrictions", "locks", "blacklist", "antiflood", "warns", "filters", "log_user")
+# The stages that still run for stale updates in catch-up mode: the ones that keep a chat clean, and no replies.
+ENFORCEMENT_STAGES = ("gban", "gmute", "restrictions", "locks", "blacklist", "log_user")
+
+# `pipelined` is False for stages whose work is done elsewhere in normal operation, e.g. by an ASYNC_CORE handler;
+# they only run for callers naming them, like catch-up
+Stage = namedtuple("Stage", ["name", "handler", "callback", "always", "pipelined"])
+
+STAGES = []
+
+
+def run_stages(bot: Bot, update: Update, names=STAGE_ORDER, pipelined_only=False):
+    """Run the registered stages in `names` on this thread, with one shared UpdateContext."""
+    context = get_context(update, bot)
+    stopped = False
+    for stage in STAGES:
+        if stage.name not in names or (stopped and not stage.always) or (pipelined_only and not stage.pipelined):
+            continue
+
+        if not stage.handler.check_update(update):
+            continue
+
+        try:
+            if stage.callback(bot, update, context=context):
+                stopped = True
+        except Exception:
+            LOGGER.exception("Error in the %s pipeline stage", stage.name)
+
+
+@run_async
+def run_pipeline(bot: Bot, update: Update):
+    run_stages(bot, update, pipelined_only=True)
+
+
+PIPELINE_HANDLER = MessageHandler(Filters.all, run_pipeline)
+
+
+def add_moderation_handler(name: str, handler: Handler, group: int, stage=None, always: bool = False,
+                           register: bool = True):
+    """
+    Register a per-message moderation handler. With MODERATION_PIPELINE off this is just add_handler; with it on,
+    `stage(bot, update, context=...)` becomes a pipeline stage that runs whenever `handler` would have matched.
+    The stage should be synchronous and return something truthy when it took a destructive action. Either way
+    the stage is recorded, for run_stages(). With `register` off only that is done, for moderation that normally
+    happens elsewhere but that catch-up still has to run itself.
+    """
+    if name not in STAGE_ORDER:
+        raise ValueError("Unknown pipeline stage: {}".format(name))
+
+    if not register:
+        pass
+    elif not MODERATION_PIPELINE:
+        dispatcher.add_handler(handler, group)
+    elif not any(s.pipelined for s in STAGES):
+        dispatcher.add_handler(PIPELINE_HANDLER, PIPELINE_GROUP)
+
+    STAGES.append(Stage(name, handler, stage or handler.callback, always, register))
+    STAGES.sort(key=lambda s: STAGE_ORDER.index(s.name))
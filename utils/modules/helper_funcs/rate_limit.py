@@ -0,0 +1,133 @@
+import threading
+import time
+
+from utils.modules.helper_funcs.cache import TTLCache
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket: `rate` tokens a second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens: float = 1) -> float:
+        """Take `tokens` now, going into debt if needed; returns how long the caller has to wait before using them."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            wait = max(0.0, self._paused_until - now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def try_reserve(self, max_wait: float, tokens: float = 1):
+        """reserve(), but only if the wait would be at most `max_wait`; otherwise takes nothing and returns None."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+            if self._tokens < tokens:
+                wait = max(wait, (tokens - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= tokens
+            return wait
+
+    def paused_for(self) -> float:
+        """Seconds left of a pause(), or 0."""
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def acquire(self, tokens: float = 1):
+        wait = self.reserve(tokens)
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Hand out nothing for `seconds`, e.g. after a RetryAfter."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+
+class RateLimiter(object):
+    """A global bucket plus one bucket per key (chat), both of which have to allow a call."""
+
+    def __init__(self, rate: float, per_key_rate: float, per_key_capacity: float = None, max_keys: int = 10000):
+        self.bucket = TokenBucket(rate)
+        self.per_key_rate = per_key_rate
+        self.per_key_capacity = per_key_capacity
+        self._keys = TTLCache(max_keys, 3600)
+        self._keys_lock = threading.Lock()
+
+    def _key_bucket(self, key) -> TokenBucket:
+        bucket = self._keys.get(key)
+        if bucket is None:
+            with self._keys_lock:
+                bucket = self._keys.get(key)
+                if bucket is None:
+                    bucket = TokenBucket(self.per_key_rate, self.per_key_capacity)
+                    self._keys.set(key, bucket)
+        return bucket
+
+    def acquire(self, key=None):
+        wait = self.bucket.reserve()
+        if key is not None:
+            wait = max(wait, self._key_bucket(key).reserve())
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds: float, key=None):
+        if key is None:
+            self.bucket.pause(seconds)
+        else:
+            self._key_bucket(key).pause(seconds)
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    A RateLimiter whose global rate is cut every time Telegram answers with a RetryAfter, and creeps back up
+    towards the configured rate after every `recover_every` calls that went through.
+    """
+
+    def __init__(self, rate: float, per_key_rate: float, per_key_capacity: float = None, min_rate: float = 1,
+                 backoff: float = 0.5, recovery: float = 1.1, recover_every: int = 100):
+        super().__init__(rate, per_key_rate, per_key_capacity)
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.backoff = backoff
+        self.recovery = recovery
+        self.recover_every = recover_every
+        self._successes = 0
+        self._adapt_lock = threading.Lock()
+
+    def throttled(self, retry_after: float):
+        with self._adapt_lock:
+            self._successes = 0
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.backoff))
+        self.bucket.pause(retry_after)
+
+    def succeeded(self):
+        with self._adapt_lock:
+            self._successes += 1
+            if self._successes >= self.recover_every and self.bucket.rate < self.max_rate:
+                self._successes = 0
+                self.bucket.set_rate(min(self.max_rate, self.bucket.rate * self.recovery))
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
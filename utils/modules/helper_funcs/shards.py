@@ -0,0 +1,203 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from queue import Queue, Full
+
+from telegram import Update
+from telegram.ext import Updater
+
+from utils import LOGGER, SHARD_PROCESSES
+from utils.modules.helper_funcs import metrics
+
+WORKER_ENV = "SENTRY_SHARD"  # "<index> <count> <fd>", set by the supervisor on the workers it starts
+RESTART_DELAY = 5  # seconds before a worker that died is started again
+STOP_TIMEOUT = 30  # seconds workers get to finish their queue on shutdown
+OUTBOX_SIZE = 10000  # updates held for a worker that is behind, before they are dropped
+
+Shard = namedtuple("Shard", ["index", "count", "fd"])
+ShardProcess = namedtuple("ShardProcess", ["proc", "sock", "outbox", "sender"])
+
+
+def _worker_shard():
+    value = os.environ.get(WORKER_ENV)
+    return Shard(*map(int, value.split())) if value else None
+
+
+WORKER = _worker_shard()  # this process's Shard, if it is one of the supervisor's workers
+SUPERVISOR = bool(SHARD_PROCESSES) and WORKER is None
+
+ROUTER = None  # the ShardRouter, in the supervisor
+
+
+def shard_key(update: Update) -> int:
+    """What an update is sharded on: its chat, or the user for chatless updates like inline queries."""
+    if update.effective_chat:
+        return update.effective_chat.id
+    if update.effective_user:
+        return update.effective_user.id
+    return 0
+
+
+def shard_of(update: Update, count: int) -> int:
+    return shard_key(update) % count
+
+
+def runs_singletons() -> bool:
+    """True in the one process that does once-per-bot work, like resuming fanout jobs and the startup notice."""
+    return WORKER is None or WORKER.index == 0
+
+
+class ShardRouter(Queue):
+    """
+    Stands in for the supervisor's update queue: each update the Updater puts here goes straight on to the worker
+    process owning its chat, as a line of JSON over a local socket, so one chat's updates are always handled by the
+    same process and in order. The supervisor's own dispatcher never gets anything. Each worker has its own
+    bounded outbox and sender thread, so one that falls behind only delays its own chats; once its outbox is full,
+    its updates are dropped. Workers that exit are started again; updates for them are dropped until then.
+    """
+
+    def __init__(self, count: int):
+        super().__init__()
+        self.count = count
+        self._workers = [None] * count
+        self._stopping = False
+
+        self.routed = metrics.counter("shards.routed")
+        self.dropped = metrics.counter("shards.dropped")
+        self.restarts = metrics.counter("shards.restarts")
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+        threading.Thread(target=self._monitor, name="shard-monitor", daemon=True).start()
+
+    def _spawn(self, index: int):
+        ours, theirs = socket.socketpair()
+        env = dict(os.environ)
+        env[WORKER_ENV] = "{} {} {}".format(index, self.count, theirs.fileno())
+        # own session, so a ^C reaches the supervisor only and the workers are stopped in order
+        proc = subprocess.Popen([sys.executable, "-m", "utils"], env=env, pass_fds=(theirs.fileno(),),
+                                start_new_session=True)
+        theirs.close()
+        outbox = Queue(OUTBOX_SIZE)
+        sender = threading.Thread(target=self._send, args=(index, ours, outbox), name="shard-send-{}".format(index),
+                                  daemon=True)
+        self._workers[index] = ShardProcess(proc, ours, outbox, sender)
+        sender.start()
+        LOGGER.info("Started shard worker %s of %s (pid %s)", index, self.count, proc.pid)
+
+    def put(self, item, block=True, timeout=None):
+        if not isinstance(item, Update):
+            return
+
+        index = shard_of(item, self.count)
+        try:
+            self._workers[index].outbox.put_nowait(item.to_json().encode("utf-8") + b"\n")
+        except Full:
+            self.dropped.inc()
+            LOGGER.warning("Dropped update %s: shard worker %s is %s updates behind", item.update_id, index,
+                           OUTBOX_SIZE)
+
+    def _send(self, index: int, sock: socket.socket, outbox: Queue):
+        while True:
+            data = outbox.get()
+            if data is None:
+                return
+            try:
+                sock.sendall(data)  # blocks while the worker is behind; only its own outbox fills up meanwhile
+                self.routed.inc()
+            except OSError:
+                self.dropped.inc()
+                LOGGER.warning("Dropped an update: shard worker %s is down", index)
+
+    def _monitor(self):
+        while not self._stopping:
+            time.sleep(1)
+            for index, worker in enumerate(self._workers):
+                code = worker.proc.poll()
+                if code is None or self._stopping:
+                    continue
+                LOGGER.error("Shard worker %s exited with %s; restarting it in %ss", index, code, RESTART_DELAY)
+                worker.sock.close()
+                worker.outbox.put(None)  # its sender drops what's left and exits
+                time.sleep(RESTART_DELAY)
+                if not self._stopping:
+                    self.restarts.inc()
+                    self._spawn(index)
+
+    def stop(self):
+        """Let every worker finish what it was sent, then exit."""
+        self._stopping = True
+        for worker in self._workers:
+            worker.outbox.put(None)
+        for worker in self._workers:
+            worker.sender.join(STOP_TIMEOUT)
+            try:
+                worker.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+        for index, worker in enumerate(self._workers):
+            try:
+                worker.proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                LOGGER.warning("Shard worker %s didn't stop in %ss; terminating it", index, STOP_TIMEOUT)
+                worker.proc.terminate()
+
+
+class ShardWorker(object):
+    """Runs a worker's dispatcher on the updates the supervisor sends down its socket, instead of polling."""
+
+    def __init__(self, updater: Updater, shard: Shard):
+        self.updater = updater
+        self.dispatcher = updater.dispatcher
+        self.shard = shard
+        self.sock = socket.socket(fileno=shard.fd)
+        self._reader = threading.Thread(target=self._read, name="shard-reader", daemon=True)
+        self.received = metrics.counter("shards.received")
+
+    def start(self):
+        LOGGER.info("Shard worker %s of %s handling its chats' updates", self.shard.index, self.shard.count)
+        self.updater.job_queue.start()
+        threading.Thread(target=self.dispatcher.start, name="dispatcher", daemon=True).start()
+        self._reader.start()
+
+    def _read(self):
+        bot = self.dispatcher.bot
+        with self.sock.makefile("rb") as stream:
+            for line in stream:
+                try:
+                    update = Update.de_json(json.loads(line.decode("utf-8")), bot)
+                except Exception:
+                    LOGGER.exception("Couldn't decode an update from the supervisor")
+                    continue
+                self.received.inc()
+                # looked up every time: LOAD_SHEDDING swaps in its own queue
+                self.dispatcher.update_queue.put(update)
+
+    def idle(self):
+        """Block until the supervisor closes our socket (or goes away), then stop once the queue is done."""
+
+        def signal_handler(signum, frame):
+            # the supervisor normally stops us by closing the socket; a signal does the same from this end
+            try:
+                self.sock.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, signal_handler)
+
+        while self._reader.is_alive():
+            self._reader.join(1)
+
+        LOGGER.info("Shard worker %s stopping", self.shard.index)
+        while self.dispatcher.update_queue.qsize():
+            time.sleep(0.1)
+        self.dispatcher.stop()
+        self.updater.job_queue.stop()
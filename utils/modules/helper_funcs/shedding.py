@@ -0,0 +1,135 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from queue import Queue
+
+from telegram import Update
+from telegram.ext import CommandHandler, Dispatcher
+
+from utils import LOGGER
+from utils.modules.helper_funcs import metrics
+
+# update classes, most urgent first
+PRIORITY_ENFORCE = 0  # group messages and joins, which the moderation handlers have to see
+PRIORITY_ADMIN = 1  # admin and sudo commands
+PRIORITY_LOW = 2  # everything else: fun and info commands, button presses, PMs
+
+LOG_INTERVAL = 10  # seconds between "shed N updates" log lines
+
+UPDATE_QUEUE = None  # the PriorityUpdateQueue, once __main__ has installed one
+
+
+def shedding() -> bool:
+    """True while the backlog is deep enough that low-priority handlers should skip their work."""
+    return UPDATE_QUEUE is not None and UPDATE_QUEUE.shedding()
+
+
+def shed_handler(name: str):
+    if UPDATE_QUEUE is not None:
+        UPDATE_QUEUE.record_shed("handler " + name, metrics.counter("shed.handlers_skipped"))
+
+
+def admin_commands(dispatcher: Dispatcher) -> set:
+    """Every command whose callback goes through user_admin or user_admin_no_reply."""
+    commands = set()
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, CommandHandler) and getattr(handler.callback, "admin_command", False):
+                commands.update(handler.command)
+    return commands
+
+
+class PriorityUpdateQueue(Queue):
+    """
+    Drop-in replacement for the Updater's update queue that hands out enforcement updates first, then admin
+    commands, then the rest, FIFO within each class. Past `drop_backlog` queued updates (here and in the
+    dispatcher's worker queue) low-priority updates are dropped on arrival; past `defer_backlog`, handlers marked
+    @low_priority skip their work. With a `maxsize`, non-blocking puts into a full queue raise queue.Full.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, admin_cmds, sudo_users, defer_backlog: int, drop_backlog: int,
+                 prefixes=("/",), maxsize: int = 0):
+        self._seq = itertools.count()
+        super().__init__(maxsize)
+        self.dispatcher = dispatcher
+        self.admin_cmds = set(admin_cmds)
+        self.sudo_users = set(sudo_users)
+        self.defer_backlog = defer_backlog
+        self.drop_backlog = drop_backlog
+        self.prefixes = tuple(prefixes)
+
+        self._shed = Counter()
+        self._shed_lock = threading.Lock()
+        self._last_log = time.monotonic()
+        self.dropped = metrics.counter("shed.updates_dropped")
+        metrics.gauge("shed.backlog", self.backlog)
+        metrics.gauge("shed.shedding", lambda: int(self.shedding()))
+
+    # heap-backed storage, the same way queue.PriorityQueue does it
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        heapq.heappush(self.queue, item)
+
+    def _get(self):
+        return heapq.heappop(self.queue)[2]
+
+    def _command(self, text):
+        if not text or not text.startswith(self.prefixes):
+            return None
+        words = text[1:].split(None, 1)
+        return words[0].split("@", 1)[0].lower() if words else None
+
+    def classify(self, update):
+        """(priority, short description for the shed log) of an incoming update."""
+        if not isinstance(update, Update):  # errors and the like
+            return PRIORITY_ENFORCE, None
+
+        message = update.effective_message
+        if not message or update.callback_query:
+            return PRIORITY_LOW, "callback" if update.callback_query else "other"
+
+        command = self._command(message.text)
+        if command:
+            user = update.effective_user
+            if command in self.admin_cmds or (user and user.id in self.sudo_users):
+                return PRIORITY_ADMIN, None
+            return PRIORITY_LOW, "/" + command
+
+        if update.effective_chat.type == "private":
+            return PRIORITY_LOW, "private message"
+        return PRIORITY_ENFORCE, None
+
+    def backlog(self) -> int:
+        queued = getattr(self.dispatcher, "queued", None)
+        if queued:
+            return self.qsize() + queued()
+        # the stock Dispatcher keeps its run_async queue private
+        return self.qsize() + self.dispatcher._Dispatcher__async_queue.qsize()
+
+    def shedding(self) -> bool:
+        return self.backlog() >= self.defer_backlog
+
+    def put(self, item, block=True, timeout=None):
+        priority, kind = self.classify(item)
+        if priority == PRIORITY_LOW and self.backlog() >= self.drop_backlog:
+            self.record_shed(kind, self.dropped)
+            return
+        super().put((priority, next(self._seq), item), block, timeout)
+
+    def record_shed(self, kind: str, counter: metrics.Counter):
+        counter.inc()
+        with self._shed_lock:
+            self._shed[kind] += 1
+            if time.monotonic() - self._last_log < LOG_INTERVAL:
+                return
+            shed, self._shed = self._shed, Counter()
+            self._last_log = time.monotonic()
+        LOGGER.warning("Shedding load (backlog %s): %s", self.backlog(),
+                       ", ".join("{} x{}".format(kind, count) for kind, count in shed.most_common()))
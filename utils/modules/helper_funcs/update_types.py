@@ -0,0 +1,157 @@
+from typing import Optional, FrozenSet
+
+from telegram import Update
+from telegram.ext import Handler, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler, \
+    ChosenInlineResultHandler, ShippingQueryHandler, PreCheckoutQueryHandler, PollHandler, PollAnswerHandler, \
+    ConversationHandler, Filters
+from telegram.ext.filters import MergedFilter, InvertedFilter
+
+from utils import LOGGER
+from utils.modules.helper_funcs import metrics
+from utils.modules.helper_funcs.handlers import CommandRouter
+
+MONITOR_GROUP = -20  # ahead of catch-up, so every update is seen
+
+# the Update fields, in the Bot API's order; each update has exactly one of them set
+MESSAGE_TYPES = ("message", "edited_message", "channel_post", "edited_channel_post")
+UPDATE_TYPES = MESSAGE_TYPES + ("inline_query", "chosen_inline_result", "callback_query", "shipping_query",
+                                "pre_checkout_query", "poll", "poll_answer")
+
+HANDLER_TYPES = (
+    (CallbackQueryHandler, "callback_query"),
+    (InlineQueryHandler, "inline_query"),
+    (ChosenInlineResultHandler, "chosen_inline_result"),
+    (ShippingQueryHandler, "shipping_query"),
+    (PreCheckoutQueryHandler, "pre_checkout_query"),
+    (PollHandler, "poll"),
+    (PollAnswerHandler, "poll_answer"),
+)
+
+# filters that pass exactly these message types, whatever the message
+TYPE_FILTERS = {
+    Filters.update: frozenset(MESSAGE_TYPES),
+    Filters.update.message: frozenset(["message"]),
+    Filters.update.edited_message: frozenset(["edited_message"]),
+    Filters.update.messages: frozenset(["message", "edited_message"]),
+    Filters.update.channel_post: frozenset(["channel_post"]),
+    Filters.update.edited_channel_post: frozenset(["edited_channel_post"]),
+    Filters.update.channel_posts: frozenset(["channel_post", "edited_channel_post"]),
+}
+# filters that rule some message types out: channel posts are never in a group or a private chat
+CHAT_FILTERS = {
+    Filters.group: frozenset(["message", "edited_message"]),
+    Filters.private: frozenset(["message", "edited_message"]),
+}
+
+ALLOWED = None  # the update types asked of Telegram, once __main__ has worked them out
+
+
+def _is_type_filter(filt) -> bool:
+    if isinstance(filt, MergedFilter):
+        return _is_type_filter(filt.base_filter) and _is_type_filter(filt.and_filter or filt.or_filter)
+    if isinstance(filt, InvertedFilter):
+        return _is_type_filter(filt.f)
+    return filt in TYPE_FILTERS
+
+
+def filter_types(filt) -> FrozenSet[str]:
+    """The message update types `filt` could let through; any it can't rule out are included."""
+    if isinstance(filt, MergedFilter):
+        base = filter_types(filt.base_filter)
+        if filt.and_filter:
+            return base & filter_types(filt.and_filter)
+        return base | filter_types(filt.or_filter)
+    if isinstance(filt, InvertedFilter):
+        # ~Filters.text can still match any type; only the complement of a type filter is a type filter
+        if _is_type_filter(filt.f):
+            return frozenset(MESSAGE_TYPES) - filter_types(filt.f)
+        return frozenset(MESSAGE_TYPES)
+    return TYPE_FILTERS.get(filt) or CHAT_FILTERS.get(filt) or frozenset(MESSAGE_TYPES)
+
+
+def handler_types(handler: Handler) -> Optional[FrozenSet[str]]:
+    """
+    The update types `handler` can match, or None if there's no telling. A handler can say for itself with an
+    `update_types` attribute; an empty one is for handlers that only look at updates others want.
+    """
+    types = getattr(handler, "update_types", None)
+    if types is not None:
+        return frozenset(types)
+
+    if isinstance(handler, CommandRouter):
+        return _union(h for handlers in handler.routes.values() for h in handlers)
+    if isinstance(handler, ConversationHandler):
+        return _union(handler.entry_points + [h for hs in handler.states.values() for h in hs] + handler.fallbacks)
+    # both build their filters on Filters.update, with the message/edited/channel post flags folded in
+    if isinstance(handler, (CommandHandler, MessageHandler)):
+        return filter_types(handler.filters)
+    for handler_class, update_type in HANDLER_TYPES:
+        if isinstance(handler, handler_class):
+            return frozenset([update_type])
+    return None
+
+
+def _union(handlers) -> Optional[FrozenSet[str]]:
+    types = set()
+    for handler in handlers:
+        handler_set = handler_types(handler)
+        if handler_set is None:
+            return None
+        types |= handler_set
+    return frozenset(types)
+
+
+def allowed_updates(*handler_groups) -> list:
+    """
+    The update types some handler in `handler_groups` (dicts of group -> [handler], like Dispatcher.handlers)
+    can match, in the order of UPDATE_TYPES, and logs what each one is for. Telegram keeps the last list it was
+    given, so a handler we can't make sense of gets us every type rather than None.
+    """
+    wanted = {update_type: 0 for update_type in UPDATE_TYPES}
+    unknown = []
+    for handlers in handler_groups:
+        for group in handlers.values():
+            for handler in group:
+                types = handler_types(handler)
+                if types is None:
+                    unknown.append(type(handler).__name__)
+                    types = UPDATE_TYPES
+                for update_type in types:
+                    wanted[update_type] += 1
+
+    if unknown:
+        LOGGER.warning("Can't tell which update types %s handle; subscribing to all of them.",
+                       ", ".join(sorted(set(unknown))))
+
+    allowed = [update_type for update_type in UPDATE_TYPES if wanted[update_type]]
+    # with the number of handlers that want each one
+    LOGGER.info("Subscribed to updates: %s", ", ".join("{} ({})".format(update_type, wanted[update_type])
+                                                        for update_type in allowed))
+    LOGGER.info("Not subscribed to: %s", ", ".join(t for t in UPDATE_TYPES if not wanted[t]) or "nothing")
+    return allowed
+
+
+def update_type(update: Update) -> Optional[str]:
+    return next((name for name in UPDATE_TYPES if getattr(update, name) is not None), None)
+
+
+class UnsubscribedMonitor(Handler):
+    """
+    Counts the updates Telegram sends us of types we didn't ask for, as updates.unsubscribed.<type>: a webhook
+    set by another deployment, or allowed_updates falling out of step with the handlers. It never matches.
+    """
+    update_types = ()
+
+    def __init__(self, allowed):
+        super().__init__(None)
+        self.allowed = frozenset(allowed)
+
+    def register(self, dispatcher):
+        dispatcher.add_handler(self, MONITOR_GROUP)
+
+    def check_update(self, update):
+        if isinstance(update, Update):
+            received = update_type(update)
+            if received not in self.allowed:
+                metrics.counter("updates.unsubscribed.{}".format(received)).inc()
+        return None
@@ -0,0 +1,162 @@
+import json
+import socket
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from queue import Full
+
+from telegram import Update
+from telegram.ext import Updater
+
+from utils import LOGGER
+from utils.modules.helper_funcs import metrics
+
+try:
+    import orjson
+
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+DEDUP_WINDOW = 10000  # update_ids remembered, to recognise Telegram redelivering an update we already have
+MAX_BODY = 1 << 20  # updates are a few KB; anything this big isn't one
+REQUEST_TIMEOUT = 10  # seconds a listener waits on a slow client before dropping it
+
+
+class UpdateWindow(object):
+    """The last `size` update_ids received, for dropping Telegram's retries of updates already queued."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, update_id: int) -> bool:
+        """True if `update_id` is already in the window; otherwise it is added."""
+        with self._lock:
+            if update_id in self._ids:
+                return True
+            self._ids[update_id] = None
+            if len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+            return False
+
+    def forget(self, update_id: int):
+        """Take back an update that couldn't be queued, so Telegram's retry of it gets in."""
+        with self._lock:
+            self._ids.pop(update_id, None)
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    server_version = "Sentry"
+    timeout = REQUEST_TIMEOUT
+
+    def do_POST(self):
+        webhook = self.server.webhook
+        if self.path != webhook.path:
+            return self._reply(404)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if not 0 < length <= MAX_BODY:
+            webhook.invalid.inc()
+            return self._reply(400)
+        self._reply(webhook.receive(self.rfile.read(length)))
+
+    def _reply(self, status: int):
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass  # a line per update is too much; see the webhook.* metrics instead
+
+
+class _Listener(HTTPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address, webhook: "WebhookServer"):
+        self.webhook = webhook
+        super().__init__(address, _WebhookHandler)
+
+    def server_bind(self):
+        # every listener binds the same port; the kernel spreads connections over them
+        if hasattr(socket, "SO_REUSEPORT"):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        super().server_bind()
+
+
+class WebhookServer(object):
+    """
+    Receives Telegram's webhook POSTs on `threads` listener threads and answers each one as soon as its update is
+    queued: 200 once it's in (or if it's a redelivery of one that already is), 503 when `update_queue` is full, so
+    Telegram holds on to it and tries again later instead of us buffering without limit.
+    """
+
+    def __init__(self, bot, update_queue, listen: str, port: int, url_path: str, threads: int = 4,
+                 window: int = DEDUP_WINDOW):
+        self.bot = bot
+        self.update_queue = update_queue
+        self.address = (listen, port)
+        self.path = "/" + url_path
+        self.threads = threads
+        if threads > 1 and not hasattr(socket, "SO_REUSEPORT"):
+            LOGGER.warning("No SO_REUSEPORT on this platform; the webhook server runs a single listener.")
+            self.threads = 1
+        self.window = UpdateWindow(window)
+        self._listeners = []
+
+        self.received = metrics.counter("webhook.received")
+        self.duplicates = metrics.counter("webhook.duplicates")
+        self.rejected = metrics.counter("webhook.rejected")  # queue full, answered 503
+        self.invalid = metrics.counter("webhook.invalid")
+        metrics.gauge("webhook.queued", update_queue.qsize)
+        if update_queue.maxsize:
+            metrics.gauge("webhook.queue_fill_pct",
+                          lambda: round(100 * update_queue.qsize() / update_queue.maxsize))
+
+    def receive(self, body: bytes) -> int:
+        """Queue one POSTed update; returns the HTTP status to answer with."""
+        try:
+            update = Update.de_json(loads(body), self.bot)
+            update_id = update.update_id
+        except Exception:
+            # anything de_json chokes on is as bad as invalid JSON, and shouldn't get into the window
+            self.invalid.inc()
+            return 400
+
+        self.received.inc()
+        if self.window.seen(update_id):
+            self.duplicates.inc()
+            return 200
+
+        try:
+            self.update_queue.put(update, block=False)
+        except Full:
+            self.window.forget(update_id)
+            self.rejected.inc()
+            return 503
+        return 200
+
+    def start(self):
+        for index in range(self.threads):
+            listener = _Listener(self.address, self)
+            self._listeners.append(listener)
+            threading.Thread(target=listener.serve_forever, name="webhook-{}".format(index), daemon=True).start()
+        LOGGER.info("Webhook server listening on %s:%s with %s threads", self.address[0], self.address[1],
+                    self.threads)
+
+    def shutdown(self):
+        for listener in self._listeners:
+            listener.shutdown()
+            listener.server_close()
+
+
+def start_webhook(updater: Updater, listen: str, port: int, url_path: str, threads: int) -> WebhookServer:
+    """Updater.start_webhook() with a WebhookServer in place of the tornado one; Updater.stop() stops both."""
+    server = WebhookServer(updater.bot, updater.update_queue, listen, port, url_path, threads=threads)
+    updater.httpd = server
+    updater.running = True
+    updater.job_queue.start()
+    updater._init_thread(updater.dispatcher.start, "dispatcher")
+    server.start()
+    return server
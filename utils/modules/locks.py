@@ -5,16 +5,20 @@ import telegram.ext as tg
 from telegram import Message, Chat, Update, Bot, ParseMode, User, MessageEntity
 from telegram import TelegramError
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, MessageHandler, Filters
+from telegram.ext import CommandHandler, Filters
 from telegram.ext.dispatcher import run_async
 from telegram.utils.helpers import mention_html
 
 import utils.modules.sql.locks_sql as sql
 from utils import dispatcher, SUDO_USERS, LOGGER
 from utils.modules.disable import DisableAbleCommandHandler
-from utils.modules.helper_funcs.chat_status import can_delete, is_user_admin, user_not_admin, user_admin, \
+from utils.modules.helper_funcs.chat_status import can_delete, is_user_admin, user_admin, \
     bot_can_delete, is_bot_admin
+from utils.modules.helper_funcs.capabilities import CAP_LOCKS, CAP_RESTRICTIONS
+from utils.modules.helper_funcs.context import UpdateContext, get_context
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 from utils.modules.log_channel import loggable
 from utils.modules.sql import users_sql
 
@@ -62,8 +66,7 @@ class CustomCommandHandler(tg.CommandHandler):
         # If messages are locked and user is not admin → block command
         if (
             sql.is_restr_locked(update.effective_chat.id, 'messages')
-            and not is_user_admin(update.effective_chat,
-                                  update.effective_user.id)
+            and not get_context(update).user_is_admin
         ):
             return False
     
@@ -200,52 +203,68 @@ def unlock(bot: Bot, update: Update, args: List[str]) -> str:
     return ""
 
 
-@run_async
-@user_not_admin
-def del_lockables(bot: Bot, update: Update):
+# NOT ASYNC - also the "locks" moderation pipeline stage
+def check_locks(bot: Bot, update: Update, context: UpdateContext = None) -> bool:
     chat = update.effective_chat  # type: Optional[Chat]
     message = update.effective_message  # type: Optional[Message]
-
-    for lockable, filter in LOCK_TYPES.items():
-        if filter(message) and sql.is_locked(chat.id, lockable) and can_delete(chat, bot.id):
-            if lockable == "bots":
-                new_members = update.effective_message.new_chat_members
-                for new_mem in new_members:
-                    if new_mem.is_bot:
-                        if not is_bot_admin(chat, bot.id):
-                            message.reply_text("I see a bot, and I've been told to stop them joining... "
-                                               "but I'm not admin!")
-                            return
-
-                        chat.kick_member(new_mem.id)
-                        message.reply_text("Only admins are allowed to add bots to this chat! Get outta here.")
+    mask = sql.get_lock_mask(chat.id)
+    if not mask:
+        return False
+
+    lockable = next((lockable for lockable, filter in LOCK_TYPES.items()
+                     if mask & sql.LOCK_BITS[lockable] and filter(message)), None)
+    if not lockable:
+        return False
+
+    context = context or get_context(update, bot)
+    if not context.user or context.user_is_admin or not context.bot_member.can_delete_messages:
+        return False
+
+    if lockable == "bots":
+        new_members = update.effective_message.new_chat_members
+        for new_mem in new_members:
+            if new_mem.is_bot:
+                if not is_bot_admin(chat, bot.id):
+                    message.reply_text("I see a bot, and I've been told to stop them joining... "
+                                       "but I'm not admin!")
+                    return False
+
+                chat.kick_member(new_mem.id)
+                message.reply_text("Only admins are allowed to add bots to this chat! Get outta here.")
+    else:
+        try:
+            message.delete()
+        except BadRequest as excp:
+            if excp.message == "Message to delete not found":
+                pass
             else:
-                try:
-                    message.delete()
-                except BadRequest as excp:
-                    if excp.message == "Message to delete not found":
-                        pass
-                    else:
-                        LOGGER.exception("ERROR in lockables")
-
-            break
+                LOGGER.exception("ERROR in lockables")
+    return True
 
 
-@run_async
-@user_not_admin
-def rest_handler(bot: Bot, update: Update):
+# NOT ASYNC - also the "restrictions" moderation pipeline stage
+def check_restrictions(bot: Bot, update: Update, context: UpdateContext = None) -> bool:
     msg = update.effective_message  # type: Optional[Message]
     chat = update.effective_chat  # type: Optional[Chat]
-    for restriction, filter in RESTRICTION_TYPES.items():
-        if filter(msg) and sql.is_restr_locked(chat.id, restriction) and can_delete(chat, bot.id):
-            try:
-                msg.delete()
-            except BadRequest as excp:
-                if excp.message == "Message to delete not found":
-                    pass
-                else:
-                    LOGGER.exception("ERROR in restrictions")
-            break
+    if not sql.get_restr_mask(chat.id):
+        return False
+
+    if not any(sql.is_restr_locked(chat.id, restriction) and filter(msg)
+               for restriction, filter in RESTRICTION_TYPES.items()):
+        return False
+
+    context = context or get_context(update, bot)
+    if not context.user or context.user_is_admin or not context.bot_member.can_delete_messages:
+        return False
+
+    try:
+        msg.delete()
+    except BadRequest as excp:
+        if excp.message == "Message to delete not found":
+            pass
+        else:
+            LOGGER.exception("ERROR in restrictions")
+    return True
 
 
 def build_lock_message(chat_id):
@@ -356,5 +375,9 @@ dispatcher.add_handler(UNLOCK_HANDLER)
 dispatcher.add_handler(LOCKTYPES_HANDLER)
 dispatcher.add_handler(LOCKED_HANDLER)
 
-dispatcher.add_handler(MessageHandler(Filters.all & Filters.group, del_lockables), PERM_GROUP)
-dispatcher.add_handler(MessageHandler(Filters.all & Filters.group, rest_handler), REST_GROUP)
+LOCKABLES_HANDLER = CapabilityMessageHandler(Filters.all & Filters.group, run_async(check_locks), CAP_LOCKS)
+RESTRICTIONS_HANDLER = CapabilityMessageHandler(Filters.all & Filters.group, run_async(check_restrictions),
+                                                CAP_RESTRICTIONS)
+
+add_moderation_handler("locks", LOCKABLES_HANDLER, PERM_GROUP, stage=check_locks)
+add_moderation_handler("restrictions", RESTRICTIONS_HANDLER, REST_GROUP, stage=check_restrictions)
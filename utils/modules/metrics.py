@@ -0,0 +1,28 @@
+import html
+from typing import List
+
+from telegram import Bot, Update, ParseMode
+from telegram.ext import run_async, CommandHandler
+
+from utils import dispatcher
+from utils.modules.helper_funcs import metrics
+from utils.modules.helper_funcs.filters import CustomFilters
+
+
+@run_async
+def show_metrics(bot: Bot, update: Update, args: List[str]):
+    values = metrics.snapshot(args[0] if args else "")
+    if not values:
+        update.effective_message.reply_text("No metrics to show.")
+        return
+
+    text = "\n".join("{}: {}".format(name, value) for name, value in values)
+    update.effective_message.reply_text("<code>{}</code>".format(html.escape(text)), parse_mode=ParseMode.HTML)
+
+
+__mod_name__ = "Metrics"
+
+METRICS_HANDLER = CommandHandler("metrics", show_metrics, pass_args=True,
+                                 filters=CustomFilters.sudo_filter | CustomFilters.support_filter)
+
+dispatcher.add_handler(METRICS_HANDLER)
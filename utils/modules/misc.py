@@ -13,8 +13,10 @@ from telegram.utils.helpers import escape_markdown, mention_html
 from utils import dispatcher, OWNER_ID, SUDO_USERS, SUPPORT_USERS, WHITELIST_USERS, BAN_STICKER
 from utils.__main__ import STATS, USER_INFO
 from utils.modules.disable import DisableAbleCommandHandler
+from utils.modules.helper_funcs.executor import long_running
 from utils.modules.helper_funcs.extraction import extract_user
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.outbound import low_priority
 
 RUN_STRINGS = (
     "Where do you think you're going?",
@@ -134,11 +136,13 @@ GMAPS_TIME = "https://maps.googleapis.com/maps/api/timezone/json"
 
 
 @run_async
+@low_priority
 def runs(bot: Bot, update: Update):
     update.effective_message.reply_text(random.choice(RUN_STRINGS))
 
 
 @run_async
+@low_priority
 def slap(bot: Bot, update: Update, args: List[str]):
     msg = update.effective_message  # type: Optional[Message]
 
@@ -177,6 +181,7 @@ def slap(bot: Bot, update: Update, args: List[str]):
 
 
 @run_async
+@long_running
 def get_bot_ip(bot: Bot, update: Update):
     """ Sends the bot's IP address, so as to be able to ssh in if necessary.
         OWNER ONLY.
@@ -270,6 +275,7 @@ def info(bot: Bot, update: Update, args: List[str]):
 
 
 @run_async
+@long_running
 def get_time(bot: Bot, update: Update, args: List[str]):
     location = " ".join(args)
     if location.lower() == bot.first_name.lower():
@@ -9,10 +9,12 @@ from telegram.utils.helpers import mention_html
 
 from utils import dispatcher, LOGGER
 from utils.modules.helper_funcs.chat_status import user_admin, can_delete
+from utils.modules.helper_funcs.executor import long_running
 from utils.modules.log_channel import loggable
 
 
 @run_async
+@long_running
 @user_admin
 @loggable
 def purge(bot: Bot, update: Update, args: List[str]) -> str:
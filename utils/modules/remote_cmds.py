@@ -8,7 +8,7 @@ from telegram.utils.helpers import mention_html
 
 from utils import dispatcher
 from utils.modules.helper_funcs.chat_status import bot_admin, user_admin, is_user_ban_protected, can_restrict, \
-    is_user_admin, is_user_in_chat, is_bot_admin
+    is_user_admin, is_user_in_chat, is_bot_admin, get_bot_member
 from utils.modules.helper_funcs.extraction import extract_user_and_text
 from utils.modules.helper_funcs.string_handling import extract_time
 from utils.modules.helper_funcs.filters import CustomFilters
@@ -114,7 +114,7 @@ def rban(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't restrict people there! Make sure I'm admin and can ban users.")
         return
 
@@ -181,7 +181,7 @@ def runban(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't unrestrict people there! Make sure I'm admin and can unban users.")
         return
 
@@ -248,7 +248,7 @@ def rkick(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't restrict people there! Make sure I'm admin and can kick users.")
         return
 
@@ -315,7 +315,7 @@ def rmute(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't restrict people there! Make sure I'm admin and can mute users.")
         return
 
@@ -382,7 +382,7 @@ def runmute(bot: Bot, update: Update, args: List[str]):
         message.reply_text("I'm sorry, but that's a private chat!")
         return
 
-    if not is_bot_admin(chat, bot.id) or not chat.get_member(bot.id).can_restrict_members:
+    if not is_bot_admin(chat, bot.id) or not get_bot_member(chat, bot.id).can_restrict_members:
         message.reply_text("I can't unrestrict people there! Make sure I'm admin and can unban users.")
         return
 
@@ -7,7 +7,7 @@ from telegram.ext import CommandHandler, RegexHandler, run_async, Filters
 from telegram.utils.helpers import mention_html
 
 from utils import dispatcher, LOGGER
-from utils.modules.helper_funcs.chat_status import user_not_admin, user_admin
+from utils.modules.helper_funcs.chat_status import user_not_admin, user_admin, cache_admin_list
 from utils.modules.log_channel import loggable
 from utils.modules.sql import reporting_sql as sql
 
@@ -60,6 +60,7 @@ def report(bot: Bot, update: Update) -> str:
         reported_user = message.reply_to_message.from_user  # type: Optional[User]
         chat_name = chat.title or chat.first or chat.username
         admin_list = chat.get_administrators()
+        cache_admin_list(chat.id, admin_list)
 
         if chat.username and chat.type == Chat.SUPERGROUP:
             msg = "<b>{}:</b>" \
@@ -1,6 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 
 from utils import DB_URI
 
@@ -14,3 +15,25 @@ def start() -> scoped_session:
 
 BASE = declarative_base()
 SESSION = start()
+
+
+def resize_pool(size: int):
+    """
+    Swap in a connection pool keeping `size` connections (same overflow and settings as before), and close the
+    old pool's idle ones. Connections still checked out finish their work on the old pool.
+    """
+    engine = BASE.metadata.bind
+    old = engine.pool
+    if not isinstance(old, QueuePool) or old.size() == size:
+        return
+
+    # QueuePool.recreate(), with a new size
+    engine.pool = QueuePool(old._creator, pool_size=size, max_overflow=old._max_overflow, pre_ping=old._pre_ping,
+                            timeout=old._timeout, recycle=old._recycle, reset_on_return=old._reset_on_return,
+                            _dispatch=old.dispatch, dialect=old._dialect)
+    old.dispose()
+
+
+def pool_size() -> int:
+    pool = BASE.metadata.bind.pool
+    return pool.size() if isinstance(pool, QueuePool) else 0
@@ -1,12 +1,16 @@
 import threading
 
-from sqlalchemy import String, Column, Integer
+from sqlalchemy import String, Column, Integer, inspect, text
 
+from utils.modules.helper_funcs.capabilities import CAP_FLOOD, register_capability, refresh_capabilities
+from utils.modules.helper_funcs.flood import FloodDetector
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe
 
 DEF_COUNT = 0
 DEF_LIMIT = 0
-DEF_OBJ = (None, DEF_COUNT, DEF_LIMIT)
+DEF_WINDOW = 0  # seconds; 0 counts consecutive messages instead
+DEF_OBJ = (DEF_LIMIT, DEF_WINDOW)
 
 class FloodControl(BASE):
     __tablename__ = "antiflood"
@@ -14,6 +18,7 @@ class FloodControl(BASE):
     user_id = Column(Integer)
     count = Column(Integer, default=DEF_COUNT)
     limit = Column(Integer, default=DEF_LIMIT)
+    window_seconds = Column(Integer, default=DEF_WINDOW)
 
     def __init__(self, chat_id):
         self.chat_id = str(chat_id)  # ensure string
@@ -26,10 +31,11 @@ FloodControl.__table__.create(checkfirst=True)
 
 INSERTION_LOCK = threading.RLock()
 
-CHAT_FLOOD = {}
+CHAT_FLOOD = {}  # str(chat_id) -> (limit, window)
+FLOOD_DETECTOR = FloodDetector()
 
 
-def set_flood(chat_id, amount):
+def set_flood(chat_id, amount, window=DEF_WINDOW):
     with INSERTION_LOCK:
         flood = SESSION.query(FloodControl).get(str(chat_id))
         if not flood:
@@ -37,56 +43,79 @@ def set_flood(chat_id, amount):
 
         flood.user_id = None
         flood.limit = amount
+        flood.window_seconds = window
 
-        CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, amount)
+        CHAT_FLOOD[str(chat_id)] = (amount, window)
+        FLOOD_DETECTOR.reset_chat(str(chat_id))
+        refresh_capabilities(chat_id)
 
         SESSION.add(flood)
         SESSION.commit()
+    publish("flood", chat_id)
 
 
 def update_flood(chat_id: str, user_id) -> bool:
-    if str(chat_id) in CHAT_FLOOD:
-        curr_user_id, count, limit = CHAT_FLOOD.get(str(chat_id), DEF_OBJ)
+    limit, window = CHAT_FLOOD.get(str(chat_id), DEF_OBJ)
+    return FLOOD_DETECTOR.hit(str(chat_id), user_id, limit, window)
 
-        if limit == 0:  # no antiflood
-            return False
 
-        if user_id != curr_user_id or user_id is None:  # other user
-            CHAT_FLOOD[str(chat_id)] = (user_id, DEF_COUNT, limit)
-            return False
-
-        count += 1
-        if count > limit:  # too many msgs, kick
-            CHAT_FLOOD[str(chat_id)] = (None, DEF_COUNT, limit)
-            return True
-
-        # default -> update
-        CHAT_FLOOD[str(chat_id)] = (user_id, count, limit)
-        return False
+def get_flood_limit(chat_id):
+    return CHAT_FLOOD.get(str(chat_id), DEF_OBJ)[0]
 
 
-def get_flood_limit(chat_id):
-    return CHAT_FLOOD.get(str(chat_id), DEF_OBJ)[2]
+def get_flood_setting(chat_id):
+    return CHAT_FLOOD.get(str(chat_id), DEF_OBJ)
 
 
 def migrate_chat(old_chat_id, new_chat_id):
     with INSERTION_LOCK:
         flood = SESSION.query(FloodControl).get(str(old_chat_id))
         if flood:
-            CHAT_FLOOD[str(new_chat_id)] = CHAT_FLOOD.get(str(old_chat_id), DEF_OBJ)
+            CHAT_FLOOD[str(new_chat_id)] = CHAT_FLOOD.pop(str(old_chat_id), DEF_OBJ)
+            FLOOD_DETECTOR.reset_chat(str(old_chat_id))
             flood.chat_id = str(new_chat_id)
             SESSION.commit()
+            refresh_capabilities(old_chat_id, new_chat_id)
 
         SESSION.close()
+    publish("flood", old_chat_id, new_chat_id)
+
+
+def __add_window_column():
+    # tables created before window_seconds existed
+    columns = {column["name"] for column in inspect(SESSION.get_bind()).get_columns(FloodControl.__tablename__)}
+    if "window_seconds" not in columns:
+        SESSION.execute(text("ALTER TABLE antiflood ADD COLUMN window_seconds INTEGER DEFAULT 0"))
+        SESSION.commit()
 
 
 def __load_flood_settings():
     global CHAT_FLOOD
     try:
         all_chats = SESSION.query(FloodControl).all()
-        CHAT_FLOOD = {chat.chat_id: (None, DEF_COUNT, chat.limit) for chat in all_chats}
+        CHAT_FLOOD = {chat.chat_id: (chat.limit, chat.window_seconds or DEF_WINDOW) for chat in all_chats}
     finally:
         SESSION.close()
 
 
+def __reload_flood_setting(chat_id):
+    """Reread one chat's flood setting, after another process changed it."""
+    with INSERTION_LOCK:
+        try:
+            flood = SESSION.query(FloodControl).get(str(chat_id))
+            setting = (flood.limit, flood.window_seconds or DEF_WINDOW) if flood else None
+        finally:
+            SESSION.close()
+
+        if setting:
+            CHAT_FLOOD[str(chat_id)] = setting
+        else:
+            CHAT_FLOOD.pop(str(chat_id), None)
+        FLOOD_DETECTOR.reset_chat(str(chat_id))
+        refresh_capabilities(chat_id)
+
+
+__add_window_column()
 __load_flood_settings()
+subscribe("flood", __reload_flood_setting, __load_flood_settings)
+register_capability(CAP_FLOOD, lambda chat_id: CHAT_FLOOD.get(chat_id, DEF_OBJ)[0] > 0)
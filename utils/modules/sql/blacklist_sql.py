@@ -2,7 +2,10 @@ import threading
 
 from sqlalchemy import func, distinct, Column, String, UnicodeText
 
+from utils.modules.helper_funcs.capabilities import CAP_BLACKLIST, register_capability, refresh_capabilities
+from utils.modules.helper_funcs.matcher import KeywordMatcher
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class BlackListFilters(BASE):
@@ -28,6 +31,7 @@ BlackListFilters.__table__.create(checkfirst=True)
 BLACKLIST_FILTER_INSERTION_LOCK = threading.RLock()
 
 CHAT_BLACKLISTS = {}
+CHAT_MATCHERS = {}  # chat_id -> KeywordMatcher over that chat's triggers
 
 
 def add_to_blacklist(chat_id, trigger):
@@ -37,6 +41,9 @@ def add_to_blacklist(chat_id, trigger):
         SESSION.merge(blacklist_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
         CHAT_BLACKLISTS.setdefault(str(chat_id), set()).add(trigger)
+        CHAT_MATCHERS.setdefault(str(chat_id), KeywordMatcher()).add(trigger)
+        refresh_capabilities(chat_id)
+    publish("blacklist", chat_id)
 
 
 def rm_from_blacklist(chat_id, trigger):
@@ -45,9 +52,13 @@ def rm_from_blacklist(chat_id, trigger):
         if blacklist_filt:
             if trigger in CHAT_BLACKLISTS.get(str(chat_id), set()):  # sanity check
                 CHAT_BLACKLISTS.get(str(chat_id), set()).remove(trigger)
+            if str(chat_id) in CHAT_MATCHERS:
+                CHAT_MATCHERS[str(chat_id)].remove(trigger)
+            refresh_capabilities(chat_id)
 
             SESSION.delete(blacklist_filt)
             SESSION.commit()
+            publish("blacklist", chat_id)
             return True
 
         SESSION.close()
@@ -58,6 +69,14 @@ def get_chat_blacklist(chat_id):
     return CHAT_BLACKLISTS.get(str(chat_id), set())
 
 
+def find_blacklisted(chat_id, text):
+    """Return a blacklisted trigger that appears in `text` as a whole word, or None."""
+    matcher = CHAT_MATCHERS.get(str(chat_id))
+    if not matcher:
+        return None
+    return matcher.search(text)
+
+
 def num_blacklist_filters():
     try:
         return SESSION.query(BlackListFilters).count()
@@ -91,11 +110,50 @@ def __load_chat_blacklists():
             CHAT_BLACKLISTS[x.chat_id] += [x.trigger]
 
         CHAT_BLACKLISTS = {x: set(y) for x, y in CHAT_BLACKLISTS.items()}
+        for chat_id, triggers in CHAT_BLACKLISTS.items():
+            CHAT_MATCHERS[chat_id] = KeywordMatcher(triggers)
 
     finally:
         SESSION.close()
 
 
+def __reload_chat_blacklist(chat_id):
+    """Reread one chat's triggers, after another process changed them."""
+    with BLACKLIST_FILTER_INSERTION_LOCK:
+        try:
+            triggers = {trigger for (trigger,) in
+                        SESSION.query(BlackListFilters.trigger).filter(BlackListFilters.chat_id == str(chat_id))}
+        finally:
+            SESSION.close()
+
+        if triggers:
+            CHAT_BLACKLISTS[str(chat_id)] = triggers
+            CHAT_MATCHERS[str(chat_id)] = KeywordMatcher(triggers)
+        else:
+            CHAT_BLACKLISTS.pop(str(chat_id), None)
+            CHAT_MATCHERS.pop(str(chat_id), None)
+        refresh_capabilities(chat_id)
+
+
+def __reload_chat_blacklists():
+    """Reread every chat's triggers, rebuilding only the matchers that changed."""
+    with BLACKLIST_FILTER_INSERTION_LOCK:
+        blacklists = {}
+        try:
+            for x in SESSION.query(BlackListFilters).all():
+                blacklists.setdefault(x.chat_id, set()).add(x.trigger)
+        finally:
+            SESSION.close()
+
+        for chat_id in set(CHAT_BLACKLISTS) - set(blacklists):
+            CHAT_BLACKLISTS.pop(chat_id, None)
+            CHAT_MATCHERS.pop(chat_id, None)
+        for chat_id, triggers in blacklists.items():
+            if CHAT_BLACKLISTS.get(chat_id) != triggers:
+                CHAT_BLACKLISTS[chat_id] = triggers
+                CHAT_MATCHERS[chat_id] = KeywordMatcher(triggers)
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with BLACKLIST_FILTER_INSERTION_LOCK:
         chat_filters = SESSION.query(BlackListFilters).filter(BlackListFilters.chat_id == str(old_chat_id)).all()
@@ -103,5 +161,14 @@ def migrate_chat(old_chat_id, new_chat_id):
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
 
+        if str(old_chat_id) in CHAT_BLACKLISTS:
+            CHAT_BLACKLISTS[str(new_chat_id)] = CHAT_BLACKLISTS.pop(str(old_chat_id))
+        if str(old_chat_id) in CHAT_MATCHERS:
+            CHAT_MATCHERS[str(new_chat_id)] = CHAT_MATCHERS.pop(str(old_chat_id))
+        refresh_capabilities(old_chat_id, new_chat_id)
+    publish("blacklist", old_chat_id, new_chat_id)
+
 
 __load_chat_blacklists()
+subscribe("blacklist", __reload_chat_blacklist, __reload_chat_blacklists)
+register_capability(CAP_BLACKLIST, lambda chat_id: bool(CHAT_BLACKLISTS.get(chat_id)))
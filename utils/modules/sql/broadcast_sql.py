@@ -0,0 +1,123 @@
+import threading
+import time
+
+from sqlalchemy import Column, BigInteger, Integer, String, UnicodeText, Float
+
+from utils.modules.sql import BASE, SESSION
+
+BROADCAST_RUNNING = "running"
+BROADCAST_PAUSED = "paused"
+BROADCAST_CANCELLED = "cancelled"
+BROADCAST_DONE = "done"
+
+ACTIVE_STATUSES = (BROADCAST_RUNNING, BROADCAST_PAUSED)
+
+
+class Broadcast(BASE):
+    __tablename__ = "broadcasts"
+    broadcast_id = Column(Integer, primary_key=True, autoincrement=True)
+    started_by = Column(BigInteger, nullable=False)
+    started_by_name = Column(UnicodeText)
+    text = Column(UnicodeText)  # for text broadcasts
+    from_chat_id = Column(String(14))  # for forwarded ones
+    message_id = Column(BigInteger)
+    status = Column(String(10), nullable=False, default=BROADCAST_RUNNING)
+    cursor = Column(String(14))  # last chat_id done; chats are walked in chat_id order
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    status_message_id = Column(BigInteger)  # progress message in MESSAGE_DUMP
+    started = Column(Float, nullable=False)
+
+    def __init__(self, started_by, started_by_name, total, text=None, from_chat_id=None, message_id=None):
+        self.started_by = started_by
+        self.started_by_name = started_by_name
+        self.total = total
+        self.text = text
+        self.from_chat_id = str(from_chat_id) if from_chat_id else None
+        self.message_id = message_id
+        self.status = BROADCAST_RUNNING
+        self.sent = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def __repr__(self):
+        return "<Broadcast {} ({}, {}/{})>".format(self.broadcast_id, self.status, self.sent + self.failed,
+                                                   self.total)
+
+
+Broadcast.__table__.create(checkfirst=True)
+
+BROADCAST_LOCK = threading.RLock()
+
+
+def create_broadcast(started_by, started_by_name, total, text=None, from_chat_id=None, message_id=None) -> int:
+    with BROADCAST_LOCK:
+        try:
+            broadcast = Broadcast(started_by, started_by_name, total, text, from_chat_id, message_id)
+            SESSION.add(broadcast)
+            SESSION.commit()
+            return broadcast.broadcast_id
+        finally:
+            SESSION.close()
+
+
+def get_broadcast(broadcast_id):
+    try:
+        broadcast = SESSION.query(Broadcast).get(broadcast_id)
+        if broadcast:
+            SESSION.expunge(broadcast)
+        return broadcast
+    finally:
+        SESSION.close()
+
+
+def get_active_broadcast():
+    try:
+        broadcast = SESSION.query(Broadcast).filter(Broadcast.status.in_(ACTIVE_STATUSES)) \
+            .order_by(Broadcast.broadcast_id).first()
+        if broadcast:
+            SESSION.expunge(broadcast)
+        return broadcast
+    finally:
+        SESSION.close()
+
+
+def get_status(broadcast_id):
+    try:
+        row = SESSION.query(Broadcast.status).filter(Broadcast.broadcast_id == broadcast_id).first()
+        return row[0] if row else None
+    finally:
+        SESSION.close()
+
+
+def save_progress(broadcast_id, cursor, sent, failed):
+    """Checkpoint a broadcast; everything up to and including `cursor` has been sent."""
+    with BROADCAST_LOCK:
+        try:
+            SESSION.query(Broadcast).filter(Broadcast.broadcast_id == broadcast_id).update(
+                {Broadcast.cursor: cursor, Broadcast.sent: sent, Broadcast.failed: failed},
+                synchronize_session=False)
+            SESSION.commit()
+        finally:
+            SESSION.close()
+
+
+def set_status(broadcast_id, status):
+    with BROADCAST_LOCK:
+        try:
+            SESSION.query(Broadcast).filter(Broadcast.broadcast_id == broadcast_id).update(
+                {Broadcast.status: status}, synchronize_session=False)
+            SESSION.commit()
+        finally:
+            SESSION.close()
+
+
+def set_status_message(broadcast_id, message_id):
+    with BROADCAST_LOCK:
+        try:
+            SESSION.query(Broadcast).filter(Broadcast.broadcast_id == broadcast_id).update(
+                {Broadcast.status_message_id: message_id}, synchronize_session=False)
+            SESSION.commit()
+        finally:
+            SESSION.close()
@@ -0,0 +1,129 @@
+import select
+import threading
+import time
+import uuid
+
+from sqlalchemy import text
+
+from utils import LOGGER, CACHE_BUS
+from utils.modules.helper_funcs import metrics
+from utils.modules.helper_funcs.capabilities import reset_capabilities
+from utils.modules.sql import BASE
+
+CHANNEL = "sentry_cache"
+INSTANCE = uuid.uuid4().hex[:8]  # so a process can skip the events it sent itself
+PING_INTERVAL = 30  # seconds of quiet before checking the listening connection is still alive
+
+HANDLERS = {}  # topic -> (on_change(key: str), on_reset())
+
+# only Postgres has NOTIFY; anywhere else every process is on its own, as before
+ENABLED = bool(CACHE_BUS) and BASE.metadata.bind.dialect.name == "postgresql"
+
+PUBLISHED = metrics.counter("cache_bus.published")
+RECEIVED = metrics.counter("cache_bus.received")
+RECONNECTS = metrics.counter("cache_bus.reconnects")
+
+
+def subscribe(topic: str, on_change, on_reset=None):
+    """
+    Have other processes' changes to `topic` applied here: `on_change(key)` reloads one key (a chat or user id, as
+    a string) into the module's caches, `on_reset()` reloads them all after events may have been missed.
+    """
+    HANDLERS[topic] = (on_change, on_reset)
+
+
+def subscribe_cache(cache, key_type=str):
+    """Drop a ReadThroughCache's entries as other processes change them; the cache's name is the topic."""
+    subscribe(cache.name, lambda key: cache.invalidate(key_type(key)), cache.clear)
+
+
+def publish(topic: str, *keys):
+    """Tell the other processes that `topic`'s rows for `keys` changed. Call after committing the change."""
+    if not ENABLED:
+        return
+
+    try:
+        with BASE.metadata.bind.begin() as conn:
+            for key in keys:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"),
+                             {"channel": CHANNEL, "payload": "{} {} {}".format(INSTANCE, topic, key)})
+        PUBLISHED.inc(len(keys))
+    except Exception:
+        LOGGER.exception("Couldn't publish a %s cache change", topic)
+
+
+def apply(payload: str):
+    instance, topic, key = payload.split(" ", 2)
+    if instance == INSTANCE:
+        return
+
+    handler = HANDLERS.get(topic)
+    if not handler:
+        return
+    RECEIVED.inc()
+    try:
+        handler[0](key)
+    except Exception:
+        LOGGER.exception("Couldn't apply a %s cache change for %s", topic, key)
+
+
+def reset_all():
+    for topic, (_, on_reset) in HANDLERS.items():
+        if on_reset:
+            try:
+                on_reset()
+            except Exception:
+                LOGGER.exception("Couldn't reload the %s cache", topic)
+    reset_capabilities()
+
+
+class CacheListener(object):
+    """LISTENs on its own connection, outside the pool, and applies other processes' changes as they come in."""
+
+    def __init__(self):
+        self.engine = BASE.metadata.bind
+        self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+
+    def start(self):
+        LOGGER.info("Listening for cache changes from other processes as %s", INSTANCE)
+        self._thread.start()
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        conn = self.engine.dialect.connect(*cargs, **cparams)
+        conn.autocommit = True
+        conn.cursor().execute("LISTEN {}".format(CHANNEL))
+        return conn
+
+    def _run(self):
+        backoff = 1
+        connected_before = False
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                if connected_before:
+                    # anything sent while we were away is lost; start over from the tables
+                    RECONNECTS.inc()
+                    reset_all()
+                connected_before = True
+                backoff = 1
+                self._listen(conn)
+            except Exception as excp:
+                LOGGER.warning("Cache bus connection lost (%s); reconnecting in %ss", excp, backoff)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _listen(self, conn):
+        while True:
+            if select.select([conn], [], [], PING_INTERVAL) == ([], [], []):
+                conn.cursor().execute("SELECT 1")  # raises if the server went away
+            conn.poll()
+            while conn.notifies:
+                apply(conn.notifies.pop(0).payload)
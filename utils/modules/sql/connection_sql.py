@@ -1,10 +1,13 @@
 import threading
+from collections import namedtuple
 from typing import Union
 
 from sqlalchemy import Column, String, Boolean, UnicodeText, BigInteger, func, distinct
 
+from utils.modules.helper_funcs.cache import ReadThroughCache
 from utils.modules.helper_funcs.msg_types import Types
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe_cache
 
 
 class ChatAccessConnectionSettings(BASE):
@@ -96,16 +99,32 @@ def connect(user_id, chat_id):
         connect_to_chat = Connection(int(user_id), chat_id)
         SESSION.add(connect_to_chat)
         SESSION.commit()
+        CONNECTION_CACHE.invalidate(int(user_id))
+        publish("connections", int(user_id))
         return True
 
 
-def get_connected_chat(user_id):
+# what get_connected_chat hands out instead of the ORM row, so the cached copy can be shared between threads
+ConnectedChat = namedtuple("ConnectedChat", ["user_id", "chat_id"])
+
+
+def _load_connection(user_id):
     try:
-        return SESSION.query(Connection).get((int(user_id)))
+        conn = SESSION.query(Connection).get(user_id)
+        return ConnectedChat(conn.user_id, conn.chat_id) if conn else None
     finally:
         SESSION.close()
 
 
+# user_id -> ConnectedChat, or None; looked up by every command sent in PM
+CONNECTION_CACHE = ReadThroughCache("connections", _load_connection, maxsize=20000)
+subscribe_cache(CONNECTION_CACHE, int)
+
+
+def get_connected_chat(user_id):
+    return CONNECTION_CACHE.get(int(user_id))
+
+
 def curr_connection(chat_id):
     try:
         return SESSION.query(Connection).get((str(chat_id)))
@@ -120,6 +139,8 @@ def disconnect(user_id):
         if disconnect:
             SESSION.delete(disconnect)
             SESSION.commit()
+            CONNECTION_CACHE.invalidate(int(user_id))
+            publish("connections", int(user_id))
             return True
         else:
             SESSION.close()
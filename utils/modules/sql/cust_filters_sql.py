@@ -1,8 +1,13 @@
+import re
 import threading
+from collections import namedtuple
 
 from sqlalchemy import Column, String, UnicodeText, Boolean, Integer, distinct, func
 
+from utils.modules.helper_funcs.cache import ReadThroughCache
+from utils.modules.helper_funcs.capabilities import CAP_FILTERS, register_capability, refresh_capabilities
 from utils.modules.sql import BASE, SESSION
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class CustomFilters(BASE):
@@ -67,6 +72,36 @@ Buttons.__table__.create(checkfirst=True)
 CUST_FILT_LOCK = threading.RLock()
 BUTTON_LOCK = threading.RLock()
 CHAT_FILTERS = {}
+# chat_id -> (compiled regex over all the chat's triggers, triggers, {trigger: rank}); dropped whenever
+# CHAT_FILTERS[chat_id] changes
+CHAT_FILTER_PATTERNS = {}
+
+# Detached, hashable copies of filters (and their buttons) so replying doesn't touch the DB.
+FilterButton = namedtuple("FilterButton", ["name", "url", "same_line"])
+FilterData = namedtuple("FilterData", ["keyword", "reply", "is_sticker", "is_document", "is_image", "is_audio",
+                                       "is_voice", "is_video", "has_markdown", "buttons"])
+FILTER_DATA_CACHE_TTL = 60 * 60
+FILTER_DATA_CACHE_SIZE = 5000
+
+
+def _load_filter_data(key):
+    chat_id, keyword = key
+    try:
+        filt = SESSION.query(CustomFilters).get(key)
+        if not filt:
+            return None
+
+        buttons = SESSION.query(Buttons).filter(Buttons.chat_id == chat_id,
+                                                Buttons.keyword == keyword).order_by(Buttons.id).all()
+        return FilterData(filt.keyword, filt.reply, filt.is_sticker, filt.is_document, filt.is_image,
+                          filt.is_audio, filt.is_voice, filt.is_video, filt.has_markdown,
+                          tuple(FilterButton(btn.name, btn.url, btn.same_line) for btn in buttons))
+    finally:
+        SESSION.close()
+
+
+# (chat_id, keyword) -> FilterData
+FILTER_DATA_CACHE = ReadThroughCache("filter_data", _load_filter_data, FILTER_DATA_CACHE_SIZE, FILTER_DATA_CACHE_TTL)
 
 
 def get_all_filters():
@@ -102,10 +137,15 @@ def add_filter(chat_id, keyword, reply, is_sticker=False, is_document=False, is_
 
         SESSION.add(filt)
         SESSION.commit()
+        CHAT_FILTER_PATTERNS.pop(str(chat_id), None)
+        refresh_capabilities(chat_id)
 
     for b_name, url, same_line in buttons:
         add_note_button_to_db(chat_id, keyword, b_name, url, same_line)
 
+    FILTER_DATA_CACHE.invalidate((str(chat_id), keyword))
+    publish("filters", chat_id)
+
 
 def remove_filter(chat_id, keyword):
     global CHAT_FILTERS
@@ -123,6 +163,10 @@ def remove_filter(chat_id, keyword):
 
             SESSION.delete(filt)
             SESSION.commit()
+            CHAT_FILTER_PATTERNS.pop(str(chat_id), None)
+            FILTER_DATA_CACHE.invalidate((str(chat_id), keyword))
+            refresh_capabilities(chat_id)
+            publish("filters", chat_id)
             return True
 
         SESSION.close()
@@ -133,6 +177,50 @@ def get_chat_triggers(chat_id):
     return CHAT_FILTERS.get(str(chat_id), set())
 
 
+def get_chat_trigger_pattern(chat_id):
+    chat_id = str(chat_id)
+    compiled = CHAT_FILTER_PATTERNS.get(chat_id)
+    if compiled is None:
+        triggers = tuple(CHAT_FILTERS.get(chat_id, ()))
+        if not triggers:
+            return None
+
+        # Zero-width so finditer tries every position; triggers are longest-first, so each hit is the best
+        # trigger starting there. Same word boundaries as the old per-keyword ( |^|[^\w])kw( |$|[^\w]).
+        pattern = re.compile(r"(?<!\w)(?=(" + "|".join(re.escape(kw) for kw in triggers) + r")(?!\w))",
+                             flags=re.IGNORECASE)
+        compiled = (pattern, triggers, {kw: rank for rank, kw in enumerate(triggers)})
+        CHAT_FILTER_PATTERNS[chat_id] = compiled
+    return compiled
+
+
+def match_filter(chat_id, text):
+    """Return the first of the chat's triggers (longest-first) that appears in `text`, or None."""
+    compiled = get_chat_trigger_pattern(chat_id)
+    if compiled is None:
+        return None
+
+    pattern, triggers, ranks = compiled
+    best = None
+    for match in pattern.finditer(text):
+        rank = ranks.get(match.group(1).lower())
+        if rank is None:  # case folding that .lower() doesn't undo; find the trigger the regex used
+            rank = next((i for i, kw in enumerate(triggers)
+                         if re.fullmatch(re.escape(kw), match.group(1), flags=re.IGNORECASE)), None)
+            if rank is None:
+                continue
+        if best is None or rank < best:
+            best = rank
+            if best == 0:
+                break
+
+    return triggers[best] if best is not None else None
+
+
+def get_filter_data(chat_id, keyword):
+    return FILTER_DATA_CACHE.get((str(chat_id), keyword))
+
+
 def get_chat_filters(chat_id):
     try:
         return SESSION.query(CustomFilters).filter(CustomFilters.chat_id == str(chat_id)).order_by(
@@ -194,6 +282,41 @@ def __load_chat_filters():
         SESSION.close()
 
 
+def __reload_chat_filters(chat_id):
+    """Reread one chat's triggers, after another process changed them."""
+    with CUST_FILT_LOCK:
+        try:
+            keywords = {keyword for (keyword,) in
+                        SESSION.query(CustomFilters.keyword).filter(CustomFilters.chat_id == str(chat_id))}
+        finally:
+            SESSION.close()
+
+        if keywords:
+            CHAT_FILTERS[str(chat_id)] = sorted(keywords, key=lambda x: (-len(x), x))
+        else:
+            CHAT_FILTERS.pop(str(chat_id), None)
+        CHAT_FILTER_PATTERNS.pop(str(chat_id), None)
+        FILTER_DATA_CACHE.invalidate_matching(lambda key: key[0] == str(chat_id))
+        refresh_capabilities(chat_id)
+
+
+def __reload_all_filters():
+    with CUST_FILT_LOCK:
+        filters = {}
+        try:
+            for (chat_id, keyword) in SESSION.query(CustomFilters.chat_id, CustomFilters.keyword):
+                filters.setdefault(chat_id, set()).add(keyword)
+        finally:
+            SESSION.close()
+
+        for chat_id in set(CHAT_FILTERS) - set(filters):
+            CHAT_FILTERS.pop(chat_id, None)
+        for chat_id, keywords in filters.items():
+            CHAT_FILTERS[chat_id] = sorted(keywords, key=lambda x: (-len(x), x))
+        CHAT_FILTER_PATTERNS.clear()
+        FILTER_DATA_CACHE.clear()
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with CUST_FILT_LOCK:
         chat_filters = SESSION.query(CustomFilters).filter(CustomFilters.chat_id == str(old_chat_id)).all()
@@ -201,14 +324,20 @@ def migrate_chat(old_chat_id, new_chat_id):
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
         if str(old_chat_id) in CHAT_FILTERS:
-            CHAT_FILTERS[str(new_chat_id)] = CHAT_FILTERS[str(old_chat_id)]
-        del CHAT_FILTERS[str(old_chat_id)]
+            CHAT_FILTERS[str(new_chat_id)] = CHAT_FILTERS.pop(str(old_chat_id))
+        CHAT_FILTER_PATTERNS.pop(str(old_chat_id), None)
+        CHAT_FILTER_PATTERNS.pop(str(new_chat_id), None)
+        FILTER_DATA_CACHE.invalidate_matching(lambda key: key[0] == str(old_chat_id))
+        refresh_capabilities(old_chat_id, new_chat_id)
 
         with BUTTON_LOCK:
             chat_buttons = SESSION.query(Buttons).filter(Buttons.chat_id == str(old_chat_id)).all()
             for btn in chat_buttons:
                 btn.chat_id = str(new_chat_id)
             SESSION.commit()
+    publish("filters", old_chat_id, new_chat_id)
 
 
 __load_chat_filters()
+subscribe("filters", __reload_chat_filters, __reload_all_filters)
+register_capability(CAP_FILTERS, lambda chat_id: bool(CHAT_FILTERS.get(chat_id)))
@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import Column, String, UnicodeText, func, distinct
 
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class Disable(BASE):
@@ -34,6 +35,7 @@ def disable_command(chat_id, disable):
             disabled = Disable(str(chat_id), disable)
             SESSION.add(disabled)
             SESSION.commit()
+            publish("disabled", chat_id)
             return True
 
         SESSION.close()
@@ -50,6 +52,7 @@ def enable_command(chat_id, enable):
 
             SESSION.delete(disabled)
             SESSION.commit()
+            publish("disabled", chat_id)
             return True
 
         SESSION.close()
@@ -89,6 +92,7 @@ def migrate_chat(old_chat_id, new_chat_id):
             DISABLED[str(new_chat_id)] = DISABLED.get(str(old_chat_id), set())
 
         SESSION.commit()
+    publish("disabled", old_chat_id, new_chat_id)
 
 
 def __load_disabled_commands():
@@ -102,4 +106,34 @@ def __load_disabled_commands():
         SESSION.close()
 
 
+def __reload_chat_disabled(chat_id):
+    """Reread one chat's disabled commands, after another process changed them."""
+    with DISABLE_INSERTION_LOCK:
+        try:
+            commands = {command for (command,) in
+                        SESSION.query(Disable.command).filter(Disable.chat_id == str(chat_id))}
+        finally:
+            SESSION.close()
+
+        if commands:
+            DISABLED[str(chat_id)] = commands
+        else:
+            DISABLED.pop(str(chat_id), None)
+
+
+def __reload_all_disabled():
+    with DISABLE_INSERTION_LOCK:
+        disabled = {}
+        try:
+            for chat in SESSION.query(Disable).all():
+                disabled.setdefault(chat.chat_id, set()).add(chat.command)
+        finally:
+            SESSION.close()
+
+        for chat_id in set(DISABLED) - set(disabled):
+            DISABLED.pop(chat_id, None)
+        DISABLED.update(disabled)
+
+
 __load_disabled_commands()
+subscribe("disabled", __reload_chat_disabled, __reload_all_disabled)
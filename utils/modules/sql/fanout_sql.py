@@ -0,0 +1,171 @@
+import threading
+import time
+
+from sqlalchemy import Column, BigInteger, Integer, SmallInteger, String, UnicodeText, Float, func
+
+from utils.modules.sql import BASE, SESSION
+
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_CANCELLED = "cancelled"
+
+TARGET_PENDING = 0
+TARGET_DONE = 1
+TARGET_FAILED = 2
+
+TARGET_CHUNK = 1000  # rows per INSERT/UPDATE
+
+
+class FanoutJob(BASE):
+    __tablename__ = "fanout_jobs"
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    kind = Column(String(16), nullable=False)
+    user_id = Column(BigInteger, nullable=False)
+    started_by = Column(BigInteger)
+    user_name = Column(UnicodeText)
+    status = Column(String(10), nullable=False, default=JOB_RUNNING)
+    total = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    started = Column(Float, nullable=False)
+
+    def __init__(self, kind, user_id, user_name=None, started_by=None):
+        self.kind = kind
+        self.user_id = user_id
+        self.user_name = user_name
+        self.started_by = started_by
+        self.status = JOB_RUNNING
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.started = time.time()
+
+    def __repr__(self):
+        return "<Fanout job {} ({} {}, {})>".format(self.job_id, self.kind, self.user_id, self.status)
+
+
+class FanoutTarget(BASE):
+    __tablename__ = "fanout_targets"
+    job_id = Column(Integer, primary_key=True)
+    chat_id = Column(String(14), primary_key=True)
+    state = Column(SmallInteger, nullable=False, default=TARGET_PENDING)
+
+    def __repr__(self):
+        return "<Fanout target {} of job {}>".format(self.chat_id, self.job_id)
+
+
+FanoutJob.__table__.create(checkfirst=True)
+FanoutTarget.__table__.create(checkfirst=True)
+
+FANOUT_LOCK = threading.RLock()
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), TARGET_CHUNK):
+        yield rows[i:i + TARGET_CHUNK]
+
+
+def create_job(kind, user_id, chat_ids, user_name=None, started_by=None) -> int:
+    with FANOUT_LOCK:
+        try:
+            job = FanoutJob(kind, user_id, user_name, started_by)
+            chat_ids = list(dict.fromkeys(str(chat_id) for chat_id in chat_ids))
+            job.total = len(chat_ids)
+            SESSION.add(job)
+            SESSION.flush()
+
+            rows = [{"job_id": job.job_id, "chat_id": chat_id, "state": TARGET_PENDING} for chat_id in chat_ids]
+            for chunk in _chunks(rows):
+                SESSION.execute(FanoutTarget.__table__.insert(), chunk)
+            SESSION.commit()
+            return job.job_id
+        except Exception:
+            SESSION.rollback()
+            raise
+        finally:
+            SESSION.close()
+
+
+def get_job(job_id):
+    try:
+        job = SESSION.query(FanoutJob).get(job_id)
+        if job:
+            SESSION.expunge(job)
+        return job
+    finally:
+        SESSION.close()
+
+
+def get_job_status(job_id):
+    try:
+        row = SESSION.query(FanoutJob.status).filter(FanoutJob.job_id == job_id).first()
+        return row[0] if row else None
+    finally:
+        SESSION.close()
+
+
+def get_running_jobs():
+    try:
+        jobs = SESSION.query(FanoutJob).filter(FanoutJob.status == JOB_RUNNING).order_by(FanoutJob.job_id).all()
+        for job in jobs:
+            SESSION.expunge(job)
+        return jobs
+    finally:
+        SESSION.close()
+
+
+def get_pending_targets(job_id):
+    try:
+        return [chat_id for (chat_id,) in SESSION.query(FanoutTarget.chat_id).filter(
+            FanoutTarget.job_id == job_id, FanoutTarget.state == TARGET_PENDING)]
+    finally:
+        SESSION.close()
+
+
+def mark_targets(job_id, done=(), failed=()):
+    """Record finished chats for a job, and bump its counters to match."""
+    if not (done or failed):
+        return
+
+    with FANOUT_LOCK:
+        try:
+            for state, chat_ids in ((TARGET_DONE, list(done)), (TARGET_FAILED, list(failed))):
+                for chunk in _chunks(chat_ids):
+                    SESSION.query(FanoutTarget).filter(FanoutTarget.job_id == job_id,
+                                                       FanoutTarget.chat_id.in_(chunk)) \
+                        .update({FanoutTarget.state: state}, synchronize_session=False)
+
+            SESSION.query(FanoutJob).filter(FanoutJob.job_id == job_id).update(
+                {FanoutJob.done: FanoutJob.done + len(done), FanoutJob.failed: FanoutJob.failed + len(failed)},
+                synchronize_session=False)
+            SESSION.commit()
+        except Exception:
+            SESSION.rollback()
+            raise
+        finally:
+            SESSION.close()
+
+
+def finish_job(job_id, status=JOB_DONE) -> bool:
+    """
+    Close a job and drop its per-chat rows; the job row keeps the totals. False if it was already closed, e.g.
+    cancelled from another process while it ran, in which case its status is left as it was.
+    """
+    with FANOUT_LOCK:
+        try:
+            closed = SESSION.query(FanoutJob).filter(FanoutJob.job_id == job_id,
+                                                     FanoutJob.status == JOB_RUNNING).update(
+                {FanoutJob.status: status}, synchronize_session=False)
+            SESSION.query(FanoutTarget).filter(FanoutTarget.job_id == job_id).delete(synchronize_session=False)
+            SESSION.commit()
+            return bool(closed)
+        finally:
+            SESSION.close()
+
+
+def num_running_jobs():
+    try:
+        return SESSION.query(func.count(FanoutJob.job_id)).filter(FanoutJob.status == JOB_RUNNING).scalar()
+    finally:
+        SESSION.close()
+
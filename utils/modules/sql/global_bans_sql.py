@@ -2,7 +2,9 @@ import threading
 
 from sqlalchemy import Column, UnicodeText, BigInteger, String, Boolean
 
+from utils.modules.helper_funcs.capabilities import CAP_GBAN, register_capability, refresh_capabilities
 from utils.modules.sql import BASE, SESSION
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class GloballyBannedUsers(BASE):
@@ -58,7 +60,8 @@ def gban_user(user_id, name, reason=None):
 
         SESSION.merge(user)
         SESSION.commit()
-        __load_gbanned_userid_list()
+        __reload_gbanned_user(user_id)
+    publish("gban", user_id)
 
 
 def update_gban_reason(user_id, name, reason=None):
@@ -82,7 +85,8 @@ def ungban_user(user_id):
             SESSION.delete(user)
 
         SESSION.commit()
-        __load_gbanned_userid_list()
+        __reload_gbanned_user(user_id)
+    publish("gban", user_id)
 
 
 def is_user_gbanned(user_id):
@@ -114,6 +118,8 @@ def enable_gbans(chat_id):
         SESSION.commit()
         if str(chat_id) in GBANSTAT_LIST:
             GBANSTAT_LIST.remove(str(chat_id))
+        refresh_capabilities(chat_id)
+    publish("gbanstat", chat_id)
 
 
 def disable_gbans(chat_id):
@@ -126,6 +132,8 @@ def disable_gbans(chat_id):
         SESSION.add(chat)
         SESSION.commit()
         GBANSTAT_LIST.add(str(chat_id))
+        refresh_capabilities(chat_id)
+    publish("gbanstat", chat_id)
 
 
 def does_chat_gban(chat_id):
@@ -152,6 +160,36 @@ def __load_gban_stat_list():
         SESSION.close()
 
 
+def __reload_gbanned_user(user_id):
+    """Reread whether one user is gbanned, rather than the whole list."""
+    with GBANNED_USERS_LOCK:
+        try:
+            gbanned = SESSION.query(GloballyBannedUsers).get(int(user_id))
+        finally:
+            SESSION.close()
+
+        if gbanned:
+            GBANNED_LIST.add(int(user_id))
+        else:
+            GBANNED_LIST.discard(int(user_id))
+
+
+def __reload_gban_stat(chat_id):
+    """Reread one chat's gban setting, after another process changed it."""
+    with GBAN_SETTING_LOCK:
+        try:
+            chat = SESSION.query(GbanSettings).get(str(chat_id))
+            enabled = not chat or chat.setting
+        finally:
+            SESSION.close()
+
+        if enabled:
+            GBANSTAT_LIST.discard(str(chat_id))
+        else:
+            GBANSTAT_LIST.add(str(chat_id))
+        refresh_capabilities(chat_id)
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with GBAN_SETTING_LOCK:
         chat = SESSION.query(GbanSettings).get(str(old_chat_id))
@@ -160,8 +198,16 @@ def migrate_chat(old_chat_id, new_chat_id):
             SESSION.add(chat)
 
         SESSION.commit()
+        if str(old_chat_id) in GBANSTAT_LIST:
+            GBANSTAT_LIST.remove(str(old_chat_id))
+            GBANSTAT_LIST.add(str(new_chat_id))
+        refresh_capabilities(old_chat_id, new_chat_id)
+    publish("gbanstat", old_chat_id, new_chat_id)
 
 
 # Create in memory userid to avoid disk access
 __load_gbanned_userid_list()
 __load_gban_stat_list()
+subscribe("gban", __reload_gbanned_user, __load_gbanned_userid_list)
+subscribe("gbanstat", __reload_gban_stat, __load_gban_stat_list)
+register_capability(CAP_GBAN, lambda chat_id: chat_id not in GBANSTAT_LIST)
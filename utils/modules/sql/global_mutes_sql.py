@@ -2,7 +2,9 @@ import threading
 
 from sqlalchemy import Column, UnicodeText, BigInteger, String, Boolean
 
+from utils.modules.helper_funcs.capabilities import CAP_GMUTE, register_capability, refresh_capabilities
 from utils.modules.sql import BASE, SESSION
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class GloballyMutedUsers(BASE):
@@ -58,7 +60,8 @@ def gmute_user(user_id, name, reason=None):
 
         SESSION.merge(user)
         SESSION.commit()
-        __load_gmuted_userid_list()
+        __reload_gmuted_user(user_id)
+    publish("gmute", user_id)
 
 
 def update_gmute_reason(user_id, name, reason=None):
@@ -81,7 +84,8 @@ def ungmute_user(user_id):
             SESSION.delete(user)
 
         SESSION.commit()
-        __load_gmuted_userid_list()
+        __reload_gmuted_user(user_id)
+    publish("gmute", user_id)
 
 
 def is_user_gmuted(user_id):
@@ -113,6 +117,8 @@ def enable_gmutes(chat_id):
         SESSION.commit()
         if str(chat_id) in GMUTESTAT_LIST:
             GMUTESTAT_LIST.remove(str(chat_id))
+        refresh_capabilities(chat_id)
+    publish("gmutestat", chat_id)
 
 
 def disable_gmutes(chat_id):
@@ -125,6 +131,8 @@ def disable_gmutes(chat_id):
         SESSION.add(chat)
         SESSION.commit()
         GMUTESTAT_LIST.add(str(chat_id))
+        refresh_capabilities(chat_id)
+    publish("gmutestat", chat_id)
 
 
 def does_chat_gmute(chat_id):
@@ -151,6 +159,36 @@ def __load_gmute_stat_list():
         SESSION.close()
 
 
+def __reload_gmuted_user(user_id):
+    """Reread whether one user is gmuted, rather than the whole list."""
+    with GMUTED_USERS_LOCK:
+        try:
+            gmuted = SESSION.query(GloballyMutedUsers).get(int(user_id))
+        finally:
+            SESSION.close()
+
+        if gmuted:
+            GMUTED_LIST.add(int(user_id))
+        else:
+            GMUTED_LIST.discard(int(user_id))
+
+
+def __reload_gmute_stat(chat_id):
+    """Reread one chat's gmute setting, after another process changed it."""
+    with GMUTE_SETTING_LOCK:
+        try:
+            chat = SESSION.query(GmuteSettings).get(str(chat_id))
+            enabled = not chat or chat.setting
+        finally:
+            SESSION.close()
+
+        if enabled:
+            GMUTESTAT_LIST.discard(str(chat_id))
+        else:
+            GMUTESTAT_LIST.add(str(chat_id))
+        refresh_capabilities(chat_id)
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with GMUTE_SETTING_LOCK:
         chat = SESSION.query(GmuteSettings).get(str(old_chat_id))
@@ -159,8 +197,16 @@ def migrate_chat(old_chat_id, new_chat_id):
             SESSION.add(chat)
 
         SESSION.commit()
+        if str(old_chat_id) in GMUTESTAT_LIST:
+            GMUTESTAT_LIST.remove(str(old_chat_id))
+            GMUTESTAT_LIST.add(str(new_chat_id))
+        refresh_capabilities(old_chat_id, new_chat_id)
+    publish("gmutestat", old_chat_id, new_chat_id)
 
 
 # Create in memory userid to avoid disk access
 __load_gmuted_userid_list()
 __load_gmute_stat_list()
+subscribe("gmute", __reload_gmuted_user, __load_gmuted_userid_list)
+subscribe("gmutestat", __reload_gmute_stat, __load_gmute_stat_list)
+register_capability(CAP_GMUTE, lambda chat_id: chat_id not in GMUTESTAT_LIST)
@@ -3,7 +3,10 @@ import threading
 
 from sqlalchemy import Column, String, Boolean
 
+from utils.modules.helper_funcs.capabilities import CAP_LOCKS, CAP_RESTRICTIONS, register_capability, \
+    refresh_capabilities
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class Permissions(BASE):
@@ -71,6 +74,35 @@ Restrictions.__table__.create(checkfirst=True)
 PERM_LOCK = threading.RLock()
 RESTR_LOCK = threading.RLock()
 
+# Bit per lock type, in the order the locks module checks them.
+LOCK_BITS = {name: 1 << i for i, name in enumerate(('sticker', 'audio', 'voice', 'document', 'video', 'contact',
+                                                      'photo', 'gif', 'url', 'bots', 'forward', 'game',
+                                                      'location'))}
+# "previews" is stored in the `preview` column; "all" means every restriction bit is set.
+RESTR_BITS = {'messages': 1 << 0, 'media': 1 << 1, 'other': 1 << 2, 'previews': 1 << 3}
+RESTR_ALL = sum(RESTR_BITS.values())
+
+# str(chat_id) -> bitmask; chats without any lock/restriction are absent
+CHAT_LOCKS = {}
+CHAT_RESTR = {}
+
+
+def _perm_mask(perm):
+    return sum(bit for name, bit in LOCK_BITS.items() if getattr(perm, name))
+
+
+def _restr_mask(restr):
+    return sum(bit for name, bit in RESTR_BITS.items()
+               if getattr(restr, 'preview' if name == 'previews' else name))
+
+
+def _set_mask(cache, chat_id, mask):
+    if mask:
+        cache[chat_id] = mask
+    else:
+        cache.pop(chat_id, None)
+    refresh_capabilities(chat_id)
+
 
 def init_permissions(chat_id, reset=False):
     curr_perm = SESSION.query(Permissions).get(str(chat_id))
@@ -80,6 +112,8 @@ def init_permissions(chat_id, reset=False):
     perm = Permissions(str(chat_id))
     SESSION.add(perm)
     SESSION.commit()
+    _set_mask(CHAT_LOCKS, str(chat_id), 0)
+    publish("locks", chat_id)
     return perm
 
 
@@ -91,44 +125,28 @@ def init_restrictions(chat_id, reset=False):
     restr = Restrictions(str(chat_id))
     SESSION.add(restr)
     SESSION.commit()
+    _set_mask(CHAT_RESTR, str(chat_id), 0)
+    publish("locks", chat_id)
     return restr
 
 
 def update_lock(chat_id, lock_type, locked):
+    if lock_type not in LOCK_BITS:
+        return
+
     with PERM_LOCK:
         curr_perm = SESSION.query(Permissions).get(str(chat_id))
         if not curr_perm:
             curr_perm = init_permissions(chat_id)
 
-        if lock_type == "audio":
-            curr_perm.audio = locked
-        elif lock_type == "voice":
-            curr_perm.voice = locked
-        elif lock_type == "contact":
-            curr_perm.contact = locked
-        elif lock_type == "video":
-            curr_perm.video = locked
-        elif lock_type == "document":
-            curr_perm.document = locked
-        elif lock_type == "photo":
-            curr_perm.photo = locked
-        elif lock_type == "sticker":
-            curr_perm.sticker = locked
-        elif lock_type == "gif":
-            curr_perm.gif = locked
-        elif lock_type == 'url':
-            curr_perm.url = locked
-        elif lock_type == 'bots':
-            curr_perm.bots = locked
-        elif lock_type == 'forward':
-            curr_perm.forward = locked
-        elif lock_type == 'game':
-            curr_perm.game = locked
-        elif lock_type == 'location':
-            curr_perm.location = locked
+        setattr(curr_perm, lock_type, locked)
 
         SESSION.add(curr_perm)
+        mask = _perm_mask(curr_perm)
         SESSION.commit()
+        _set_mask(CHAT_LOCKS, str(chat_id), mask)
+        SESSION.close()
+    publish("locks", chat_id)
 
 
 def update_restriction(chat_id, restr_type, locked):
@@ -151,61 +169,30 @@ def update_restriction(chat_id, restr_type, locked):
             curr_restr.other = locked
             curr_restr.preview = locked
         SESSION.add(curr_restr)
+        mask = _restr_mask(curr_restr)
         SESSION.commit()
+        _set_mask(CHAT_RESTR, str(chat_id), mask)
+        SESSION.close()
+    publish("locks", chat_id)
 
 
-def is_locked(chat_id, lock_type):
-    curr_perm = SESSION.query(Permissions).get(str(chat_id))
-    SESSION.close()
-
-    if not curr_perm:
-        return False
-
-    elif lock_type == "sticker":
-        return curr_perm.sticker
-    elif lock_type == "photo":
-        return curr_perm.photo
-    elif lock_type == "audio":
-        return curr_perm.audio
-    elif lock_type == "voice":
-        return curr_perm.voice
-    elif lock_type == "contact":
-        return curr_perm.contact
-    elif lock_type == "video":
-        return curr_perm.video
-    elif lock_type == "document":
-        return curr_perm.document
-    elif lock_type == "gif":
-        return curr_perm.gif
-    elif lock_type == "url":
-        return curr_perm.url
-    elif lock_type == "bots":
-        return curr_perm.bots
-    elif lock_type == "forward":
-        return curr_perm.forward
-    elif lock_type == "game":
-        return curr_perm.game
-    elif lock_type == "location":
-        return curr_perm.location
+def get_lock_mask(chat_id):
+    return CHAT_LOCKS.get(str(chat_id), 0)
 
 
-def is_restr_locked(chat_id, lock_type):
-    curr_restr = SESSION.query(Restrictions).get(str(chat_id))
-    SESSION.close()
+def get_restr_mask(chat_id):
+    return CHAT_RESTR.get(str(chat_id), 0)
 
-    if not curr_restr:
-        return False
 
-    if lock_type == "messages":
-        return curr_restr.messages
-    elif lock_type == "media":
-        return curr_restr.media
-    elif lock_type == "other":
-        return curr_restr.other
-    elif lock_type == "previews":
-        return curr_restr.preview
-    elif lock_type == "all":
-        return curr_restr.messages and curr_restr.media and curr_restr.other and curr_restr.preview
+def is_locked(chat_id, lock_type):
+    return bool(get_lock_mask(chat_id) & LOCK_BITS.get(lock_type, 0))
+
+
+def is_restr_locked(chat_id, lock_type):
+    mask = get_restr_mask(chat_id)
+    if lock_type == "all":
+        return mask == RESTR_ALL
+    return bool(mask & RESTR_BITS.get(lock_type, 0))
 
 
 def get_locks(chat_id):
@@ -222,15 +209,62 @@ def get_restr(chat_id):
         SESSION.close()
 
 
+def __load_lock_masks():
+    try:
+        for perm in SESSION.query(Permissions).all():
+            _set_mask(CHAT_LOCKS, perm.chat_id, _perm_mask(perm))
+
+        for restr in SESSION.query(Restrictions).all():
+            _set_mask(CHAT_RESTR, restr.chat_id, _restr_mask(restr))
+
+    finally:
+        SESSION.close()
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with PERM_LOCK:
         perms = SESSION.query(Permissions).get(str(old_chat_id))
         if perms:
             perms.chat_id = str(new_chat_id)
         SESSION.commit()
+        _set_mask(CHAT_LOCKS, str(new_chat_id), CHAT_LOCKS.pop(str(old_chat_id), 0))
+        refresh_capabilities(old_chat_id)
 
     with RESTR_LOCK:
         rest = SESSION.query(Restrictions).get(str(old_chat_id))
         if rest:
             rest.chat_id = str(new_chat_id)
         SESSION.commit()
+        _set_mask(CHAT_RESTR, str(new_chat_id), CHAT_RESTR.pop(str(old_chat_id), 0))
+    publish("locks", old_chat_id, new_chat_id)
+
+
+def __reload_chat_locks(chat_id):
+    """Reread one chat's lock and restriction masks, after another process changed them."""
+    with PERM_LOCK, RESTR_LOCK:
+        try:
+            perm = SESSION.query(Permissions).get(str(chat_id))
+            restr = SESSION.query(Restrictions).get(str(chat_id))
+            _set_mask(CHAT_LOCKS, str(chat_id), _perm_mask(perm) if perm else 0)
+            _set_mask(CHAT_RESTR, str(chat_id), _restr_mask(restr) if restr else 0)
+        finally:
+            SESSION.close()
+
+
+def __reload_all_locks():
+    with PERM_LOCK, RESTR_LOCK:
+        try:
+            locks = {perm.chat_id: _perm_mask(perm) for perm in SESSION.query(Permissions).all()}
+            restrs = {restr.chat_id: _restr_mask(restr) for restr in SESSION.query(Restrictions).all()}
+        finally:
+            SESSION.close()
+
+        for cache, masks in ((CHAT_LOCKS, locks), (CHAT_RESTR, restrs)):
+            for chat_id in set(cache) | set(masks):
+                _set_mask(cache, chat_id, masks.get(chat_id, 0))
+
+
+__load_lock_masks()
+subscribe("locks", __reload_chat_locks, __reload_all_locks)
+register_capability(CAP_LOCKS, lambda chat_id: chat_id in CHAT_LOCKS)
+register_capability(CAP_RESTRICTIONS, lambda chat_id: chat_id in CHAT_RESTR)
@@ -3,6 +3,7 @@ import threading
 from sqlalchemy import Column, String, func, distinct
 
 from utils.modules.sql import BASE, SESSION
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class GroupLogs(BASE):
@@ -33,6 +34,7 @@ def set_chat_log_channel(chat_id, log_channel):
 
         CHANNELS[str(chat_id)] = log_channel
         SESSION.commit()
+    publish("log_channel", chat_id)
 
 
 def get_chat_log_channel(chat_id):
@@ -49,6 +51,7 @@ def stop_chat_logging(chat_id):
             log_channel = res.log_channel
             SESSION.delete(res)
             SESSION.commit()
+            publish("log_channel", chat_id)
             return log_channel
 
 
@@ -76,6 +79,7 @@ def migrate_chat(old_chat_id, new_chat_id):
                 CHANNELS[str(new_chat_id)] = CHANNELS.get(str(old_chat_id))
 
         SESSION.commit()
+    publish("log_channel", old_chat_id, new_chat_id)
 
 
 def __load_log_channels():
@@ -87,4 +91,20 @@ def __load_log_channels():
         SESSION.close()
 
 
+def __reload_log_channel(chat_id):
+    """Reread one chat's log channel, after another process changed it."""
+    with LOGS_INSERTION_LOCK:
+        try:
+            chat = SESSION.query(GroupLogs).get(str(chat_id))
+            log_channel = chat.log_channel if chat else None
+        finally:
+            SESSION.close()
+
+        if log_channel:
+            CHANNELS[str(chat_id)] = log_channel
+        else:
+            CHANNELS.pop(str(chat_id), None)
+
+
 __load_log_channels()
+subscribe("log_channel", __reload_log_channel, __load_log_channels)
@@ -3,7 +3,9 @@ from typing import Union
 
 from sqlalchemy import Column, BigInteger, String, Boolean
 
+from utils.modules.helper_funcs.cache import ReadThroughCache
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe_cache
 
 
 class ReportingUserSettings(BASE):
@@ -37,9 +39,9 @@ CHAT_LOCK = threading.RLock()
 USER_LOCK = threading.RLock()
 
 
-def chat_should_report(chat_id: Union[str, int]) -> bool:
+def _load_chat_setting(chat_id: str) -> bool:
     try:
-        chat_setting = SESSION.query(ReportingChatSettings).get(str(chat_id))
+        chat_setting = SESSION.query(ReportingChatSettings).get(chat_id)
         if chat_setting:
             return chat_setting.should_report
         return False
@@ -47,7 +49,7 @@ def chat_should_report(chat_id: Union[str, int]) -> bool:
         SESSION.close()
 
 
-def user_should_report(user_id: int) -> bool:
+def _load_user_setting(user_id: int) -> bool:
     try:
         user_setting = SESSION.query(ReportingUserSettings).get(user_id)
         if user_setting:
@@ -57,6 +59,21 @@ def user_should_report(user_id: int) -> bool:
         SESSION.close()
 
 
+# both read on every @admin
+CHAT_CACHE = ReadThroughCache("reporting_chats", _load_chat_setting, maxsize=20000)
+subscribe_cache(CHAT_CACHE)
+USER_CACHE = ReadThroughCache("reporting_users", _load_user_setting, maxsize=50000)
+subscribe_cache(USER_CACHE, int)
+
+
+def chat_should_report(chat_id: Union[str, int]) -> bool:
+    return CHAT_CACHE.get(str(chat_id))
+
+
+def user_should_report(user_id: int) -> bool:
+    return USER_CACHE.get(int(user_id))
+
+
 def set_chat_setting(chat_id: Union[int, str], setting: bool):
     with CHAT_LOCK:
         chat_setting = SESSION.query(ReportingChatSettings).get(str(chat_id))
@@ -66,6 +83,8 @@ def set_chat_setting(chat_id: Union[int, str], setting: bool):
         chat_setting.should_report = setting
         SESSION.add(chat_setting)
         SESSION.commit()
+        CHAT_CACHE.invalidate(str(chat_id))
+        publish("reporting_chats", str(chat_id))
 
 
 def set_user_setting(user_id: int, setting: bool):
@@ -77,6 +96,8 @@ def set_user_setting(user_id: int, setting: bool):
         user_setting.should_report = setting
         SESSION.add(user_setting)
         SESSION.commit()
+        USER_CACHE.invalidate(int(user_id))
+        publish("reporting_users", int(user_id))
 
 
 def migrate_chat(old_chat_id, new_chat_id):
@@ -86,3 +107,5 @@ def migrate_chat(old_chat_id, new_chat_id):
         for note in chat_notes:
             note.chat_id = str(new_chat_id)
         SESSION.commit()
+        CHAT_CACHE.invalidate(str(old_chat_id), str(new_chat_id))
+        publish("reporting_chats", str(old_chat_id), str(new_chat_id))
@@ -2,7 +2,9 @@ import threading
 
 from sqlalchemy import Column, String, UnicodeText, func, distinct
 
+from utils.modules.helper_funcs.cache import ReadThroughCache
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe_cache
 
 
 class Rules(BASE):
@@ -31,10 +33,12 @@ def set_rules(chat_id, rules_text):
 
         SESSION.add(rules)
         SESSION.commit()
+        RULES_CACHE.invalidate(str(chat_id))
+        publish("rules", str(chat_id))
 
 
-def get_rules(chat_id):
-    rules = SESSION.query(Rules).get(str(chat_id))
+def _load_rules(chat_id):
+    rules = SESSION.query(Rules).get(chat_id)
     ret = ""
     if rules:
         ret = rules.rules
@@ -43,6 +47,14 @@ def get_rules(chat_id):
     return ret
 
 
+RULES_CACHE = ReadThroughCache("rules", _load_rules, maxsize=10000)
+subscribe_cache(RULES_CACHE)
+
+
+def get_rules(chat_id):
+    return RULES_CACHE.get(str(chat_id))
+
+
 def num_chats():
     try:
         return SESSION.query(func.count(distinct(Rules.chat_id))).scalar()
@@ -56,3 +68,5 @@ def migrate_chat(old_chat_id, new_chat_id):
         if chat:
             chat.chat_id = str(new_chat_id)
         SESSION.commit()
+        RULES_CACHE.invalidate(str(old_chat_id), str(new_chat_id))
+        publish("rules", str(old_chat_id), str(new_chat_id))
@@ -1,8 +1,12 @@
+import atexit
 import threading
 
 from sqlalchemy import Column, BigInteger, UnicodeText, String, ForeignKey, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
 
-from utils import dispatcher
+from utils import dispatcher, LOGGER
+from utils.modules.helper_funcs.cache import TTLCache
 from utils.modules.sql import BASE, SESSION
 
 
@@ -45,7 +49,8 @@ class ChatMembers(BASE):
                   ForeignKey("users.user_id",
                              onupdate="CASCADE",
                              ondelete="CASCADE"),
-                  nullable=False)
+                  nullable=False,
+                  index=True)
     __table_args__ = (UniqueConstraint('chat', 'user', name='_chat_members_uc'),)
 
     def __init__(self, chat, user):
@@ -60,9 +65,35 @@ class ChatMembers(BASE):
 Users.__table__.create(checkfirst=True)
 Chats.__table__.create(checkfirst=True)
 ChatMembers.__table__.create(checkfirst=True)
+# tables created before chat_members.user was indexed
+for index in ChatMembers.__table__.indexes:
+    index.create(checkfirst=True)
 
 INSERTION_LOCK = threading.RLock()
 
+# Write-behind buffer for queue_user (log_user traffic). Rows are deduplicated in memory, rows that haven't
+# changed since they were last written are skipped, and the rest are upserted in bulk by a background thread.
+USER_FLUSH_SIZE = 500  # pending rows that trigger an early flush
+USER_FLUSH_INTERVAL = 5  # seconds
+USER_FLUSH_CHUNK = 1000  # rows per INSERT statement
+SEEN_CACHE_SIZE = 100000
+SEEN_CACHE_TTL = 6 * 60 * 60
+
+BUFFER_LOCK = threading.Lock()
+FLUSH_LOCK = threading.Lock()
+FLUSH_EVENT = threading.Event()
+
+PENDING_USERS = {}  # user_id -> username
+PENDING_CHATS = {}  # str(chat_id) -> chat_name
+PENDING_MEMBERS = set()  # (str(chat_id), user_id)
+
+# what we know is already in the db
+SEEN_USERS = TTLCache(SEEN_CACHE_SIZE, SEEN_CACHE_TTL)
+SEEN_CHATS = TTLCache(SEEN_CACHE_SIZE, SEEN_CACHE_TTL)
+SEEN_MEMBERS = TTLCache(SEEN_CACHE_SIZE, SEEN_CACHE_TTL)
+
+_UNSEEN = object()
+
 
 def ensure_bot_in_db():
     with INSERTION_LOCK:
@@ -103,12 +134,112 @@ def update_user(user_id, username, chat_id=None, chat_name=None):
         SESSION.commit()
 
 
+def queue_user(user_id, username, chat_id=None, chat_name=None):
+    """Buffered version of update_user; the rows are written by the flush thread."""
+    with BUFFER_LOCK:
+        if PENDING_USERS.get(user_id, _UNSEEN) != username and SEEN_USERS.get(user_id, _UNSEEN) != username:
+            PENDING_USERS[user_id] = username
+
+        if chat_id and chat_name:
+            chat_id = str(chat_id)
+            if PENDING_CHATS.get(chat_id, _UNSEEN) != chat_name and SEEN_CHATS.get(chat_id, _UNSEEN) != chat_name:
+                PENDING_CHATS[chat_id] = chat_name
+
+            if (chat_id, user_id) not in SEEN_MEMBERS:
+                PENDING_MEMBERS.add((chat_id, user_id))
+
+        pending = len(PENDING_USERS) + len(PENDING_CHATS) + len(PENDING_MEMBERS)
+
+    if pending >= USER_FLUSH_SIZE:
+        FLUSH_EVENT.set()
+
+
+def _chunks(rows):
+    for i in range(0, len(rows), USER_FLUSH_CHUNK):
+        yield rows[i:i + USER_FLUSH_CHUNK]
+
+
+def flush_users():
+    global PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS
+    with FLUSH_LOCK:
+        with BUFFER_LOCK:
+            users, chats, members = PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS
+            PENDING_USERS, PENDING_CHATS, PENDING_MEMBERS = {}, {}, set()
+
+        if not (users or chats or members):
+            return
+
+        try:
+            # parents first, so the member rows' foreign keys resolve
+            rows = [{"user_id": user_id, "username": username} for user_id, username in sorted(users.items())]
+            for chunk in _chunks(rows):
+                stmt = insert(Users).values(chunk)
+                SESSION.execute(stmt.on_conflict_do_update(index_elements=[Users.user_id],
+                                                           set_={"username": stmt.excluded.username}))
+
+            rows = [{"chat_id": chat_id, "chat_name": chat_name} for chat_id, chat_name in sorted(chats.items())]
+            for chunk in _chunks(rows):
+                stmt = insert(Chats).values(chunk)
+                SESSION.execute(stmt.on_conflict_do_update(index_elements=[Chats.chat_id],
+                                                           set_={"chat_name": stmt.excluded.chat_name}))
+
+            rows = [{"chat": chat_id, "user": user_id} for chat_id, user_id in sorted(members)]
+            for chunk in _chunks(rows):
+                SESSION.execute(insert(ChatMembers).values(chunk).on_conflict_do_nothing(
+                    constraint="_chat_members_uc"))
+
+            SESSION.commit()
+        except SQLAlchemyError:
+            # not marked as seen, so they get queued again the next time these users talk
+            SESSION.rollback()
+            LOGGER.exception("Failed to flush %d users, %d chats and %d chat members",
+                             len(users), len(chats), len(members))
+            return
+        finally:
+            SESSION.close()
+
+        for user_id, username in users.items():
+            SEEN_USERS.set(user_id, username)
+        for chat_id, chat_name in chats.items():
+            SEEN_CHATS.set(chat_id, chat_name)
+        for member in members:
+            SEEN_MEMBERS.set(member, True)
+
+
+def __flush_worker():
+    while True:
+        FLUSH_EVENT.wait(USER_FLUSH_INTERVAL)
+        FLUSH_EVENT.clear()
+        try:
+            flush_users()
+        except Exception:
+            LOGGER.exception("User flush thread error")
+
+
+def _forget_chat(chat_id):
+    chat_id = str(chat_id)
+    with BUFFER_LOCK:
+        PENDING_CHATS.pop(chat_id, None)
+        PENDING_MEMBERS.difference_update({m for m in PENDING_MEMBERS if m[0] == chat_id})
+    SEEN_CHATS.pop(chat_id)
+    SEEN_MEMBERS.pop_matching(lambda member: member[0] == chat_id)
+
+
 def get_userid_by_name(username):
     try:
-        return SESSION.query(Users).filter(func.lower(Users.username) == username.lower()).all()
+        users = SESSION.query(Users).filter(func.lower(Users.username) == username.lower()).all()
     finally:
         SESSION.close()
 
+    # include users that are still waiting in the write-behind buffer
+    with BUFFER_LOCK:
+        pending = {user_id: name for user_id, name in PENDING_USERS.items()
+                   if name and name.lower() == username.lower()}
+    users = [user for user in users if user.user_id not in PENDING_USERS or user.user_id in pending]
+    known = {user.user_id for user in users}
+    users.extend(Users(user_id, name) for user_id, name in pending.items() if user_id not in known)
+    return users
+
 
 def get_name_by_userid(user_id):
     try:
@@ -131,6 +262,29 @@ def get_all_chats():
         SESSION.close()
 
 
+def get_chats_page(after=None, limit=100):
+    """Up to `limit` chats with a chat_id after `after`, in chat_id order, for walking the table in pages."""
+    try:
+        query = SESSION.query(Chats)
+        if after is not None:
+            query = query.filter(Chats.chat_id > str(after))
+        return query.order_by(Chats.chat_id).limit(limit).all()
+    finally:
+        SESSION.close()
+
+
+def get_user_chats(user_id):
+    """IDs of the chats the user has been seen in, including sightings still waiting to be flushed."""
+    try:
+        chats = [chat for (chat,) in SESSION.query(ChatMembers.chat).filter(ChatMembers.user == int(user_id))]
+    finally:
+        SESSION.close()
+
+    with BUFFER_LOCK:
+        pending = [chat for chat, member in PENDING_MEMBERS if member == int(user_id)]
+    return list(dict.fromkeys(chats + pending))
+
+
 def get_user_num_chats(user_id):
     try:
         return SESSION.query(ChatMembers).filter(ChatMembers.user == int(user_id)).count()
@@ -153,6 +307,8 @@ def num_users():
 
 
 def migrate_chat(old_chat_id, new_chat_id):
+    flush_users()
+    _forget_chat(old_chat_id)
     with INSERTION_LOCK:
         chat = SESSION.query(Chats).get(str(old_chat_id))
         if chat:
@@ -171,6 +327,7 @@ def migrate_chat(old_chat_id, new_chat_id):
 
 def del_chat(chat_id):
     """Remove a chat from the database when bot leaves or is removed."""
+    _forget_chat(chat_id)
     with INSERTION_LOCK:
         # Delete chat members first due to foreign key constraints
         chat_members = SESSION.query(ChatMembers).filter(ChatMembers.chat == str(chat_id)).all()
@@ -186,3 +343,6 @@ def del_chat(chat_id):
 
 
 ensure_bot_in_db()
+
+threading.Thread(target=__flush_worker, name="users_sql flush", daemon=True).start()
+atexit.register(flush_users)
@@ -3,7 +3,9 @@ import threading
 from sqlalchemy import BigInteger, Column, String, UnicodeText, func, distinct, Boolean
 from sqlalchemy.dialects import postgresql
 
+from utils.modules.helper_funcs.capabilities import CAP_WARN_FILTERS, register_capability, refresh_capabilities
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe
 
 
 class Warns(BASE):
@@ -136,9 +138,11 @@ def add_warn_filter(chat_id, keyword, reply):
         if keyword not in WARN_FILTERS.get(str(chat_id), []):
             WARN_FILTERS[str(chat_id)] = sorted(WARN_FILTERS.get(str(chat_id), []) + [keyword],
                                                 key=lambda x: (-len(x), x))
+            refresh_capabilities(chat_id)
 
         SESSION.merge(warn_filt)  # merge to avoid duplicate key issues
         SESSION.commit()
+    publish("warn_filters", chat_id)
 
 
 def remove_warn_filter(chat_id, keyword):
@@ -147,9 +151,11 @@ def remove_warn_filter(chat_id, keyword):
         if warn_filt:
             if keyword in WARN_FILTERS.get(str(chat_id), []):  # sanity check
                 WARN_FILTERS.get(str(chat_id), []).remove(keyword)
+                refresh_capabilities(chat_id)
 
             SESSION.delete(warn_filt)
             SESSION.commit()
+            publish("warn_filters", chat_id)
             return True
         SESSION.close()
         return False
@@ -261,6 +267,37 @@ def __load_chat_warn_filters():
         SESSION.close()
 
 
+def __reload_chat_warn_filters(chat_id):
+    """Reread one chat's warn triggers, after another process changed them."""
+    with WARN_FILTER_INSERTION_LOCK:
+        try:
+            keywords = {keyword for (keyword,) in
+                        SESSION.query(WarnFilters.keyword).filter(WarnFilters.chat_id == str(chat_id))}
+        finally:
+            SESSION.close()
+
+        if keywords:
+            WARN_FILTERS[str(chat_id)] = sorted(keywords, key=lambda x: (-len(x), x))
+        else:
+            WARN_FILTERS.pop(str(chat_id), None)
+        refresh_capabilities(chat_id)
+
+
+def __reload_all_warn_filters():
+    with WARN_FILTER_INSERTION_LOCK:
+        filters = {}
+        try:
+            for (chat_id, keyword) in SESSION.query(WarnFilters.chat_id, WarnFilters.keyword):
+                filters.setdefault(chat_id, set()).add(keyword)
+        finally:
+            SESSION.close()
+
+        for chat_id in set(WARN_FILTERS) - set(filters):
+            WARN_FILTERS.pop(chat_id, None)
+        for chat_id, keywords in filters.items():
+            WARN_FILTERS[chat_id] = sorted(keywords, key=lambda x: (-len(x), x))
+
+
 def migrate_chat(old_chat_id, new_chat_id):
     with WARN_INSERTION_LOCK:
         chat_notes = SESSION.query(Warns).filter(Warns.chat_id == str(old_chat_id)).all()
@@ -273,8 +310,10 @@ def migrate_chat(old_chat_id, new_chat_id):
         for filt in chat_filters:
             filt.chat_id = str(new_chat_id)
         SESSION.commit()
-        WARN_FILTERS[str(new_chat_id)] = WARN_FILTERS[str(old_chat_id)]
-        del WARN_FILTERS[str(old_chat_id)]
+        if str(old_chat_id) in WARN_FILTERS:
+            WARN_FILTERS[str(new_chat_id)] = WARN_FILTERS.pop(str(old_chat_id))
+        refresh_capabilities(old_chat_id, new_chat_id)
+    publish("warn_filters", old_chat_id, new_chat_id)
 
     with WARN_SETTINGS_LOCK:
         chat_settings = SESSION.query(WarnSettings).filter(WarnSettings.chat_id == str(old_chat_id)).all()
@@ -284,3 +323,5 @@ def migrate_chat(old_chat_id, new_chat_id):
 
 
 __load_chat_warn_filters()
+subscribe("warn_filters", __reload_chat_warn_filters, __reload_all_warn_filters)
+register_capability(CAP_WARN_FILTERS, lambda chat_id: bool(WARN_FILTERS.get(chat_id)))
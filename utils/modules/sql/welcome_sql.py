@@ -1,9 +1,12 @@
 import threading
+from collections import namedtuple
 
 from sqlalchemy import Column, String, Boolean, UnicodeText, Integer, BigInteger
 
+from utils.modules.helper_funcs.cache import ReadThroughCache
 from utils.modules.helper_funcs.msg_types import Types
 from utils.modules.sql import SESSION, BASE
+from utils.modules.sql.cache_bus import publish, subscribe_cache
 
 DEFAULT_WELCOME = "Hey {first}, how are you?"
 DEFAULT_GOODBYE = "Nice knowing ya!"
@@ -72,10 +75,31 @@ INSERTION_LOCK = threading.RLock()
 WELC_BTN_LOCK = threading.RLock()
 LEAVE_BTN_LOCK = threading.RLock()
 
+# a detached copy of a chat's Welcome row, safe to share between threads
+WelcomeSettings = namedtuple("WelcomeSettings", ["should_welcome", "should_goodbye", "custom_welcome", "welcome_type",
+                                                 "custom_leave", "leave_type", "clean_welcome", "del_joined",
+                                                 "del_commands"])
+
+
+def _load_settings(chat_id):
+    try:
+        welc = SESSION.query(Welcome).get(chat_id)
+        if not welc:
+            return None
+        return WelcomeSettings(welc.should_welcome, welc.should_goodbye, welc.custom_welcome, welc.welcome_type,
+                               welc.custom_leave, welc.leave_type, welc.clean_welcome, welc.del_joined,
+                               welc.del_commands)
+    finally:
+        SESSION.close()
+
+
+# str chat_id -> WelcomeSettings, or None for chats on the defaults; read on every join and leave
+SETTINGS_CACHE = ReadThroughCache("welcome", _load_settings, maxsize=20000)
+subscribe_cache(SETTINGS_CACHE)
+
 
 def get_welc_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
+    welc = SETTINGS_CACHE.get(str(chat_id))
     if welc:
         return welc.should_welcome, welc.custom_welcome, welc.welcome_type
     else:
@@ -84,8 +108,7 @@ def get_welc_pref(chat_id):
 
 
 def get_gdbye_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
+    welc = SETTINGS_CACHE.get(str(chat_id))
     if welc:
         return welc.should_goodbye, welc.custom_leave, welc.leave_type
     else:
@@ -103,11 +126,12 @@ def set_clean_welcome(chat_id, clean_welcome):
 
         SESSION.add(curr)
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def get_clean_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
+    welc = SETTINGS_CACHE.get(str(chat_id))
 
     if welc:
         return welc.clean_welcome
@@ -125,11 +149,12 @@ def set_del_joined(chat_id, del_joined):
 
         SESSION.add(curr)
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def get_del_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
+    welc = SETTINGS_CACHE.get(str(chat_id))
 
     if welc:
         return welc.del_joined
@@ -147,11 +172,12 @@ def set_cmd_joined(chat_id, cmd_joined):
 
         SESSION.add(curr)
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def get_cmd_pref(chat_id):
-    welc = SESSION.query(Welcome).get(str(chat_id))
-    SESSION.close()
+    welc = SETTINGS_CACHE.get(str(chat_id))
 
     if welc:
         return welc.del_commands
@@ -169,6 +195,8 @@ def set_welc_preference(chat_id, should_welcome):
 
         SESSION.add(curr)
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def set_gdbye_preference(chat_id, should_goodbye):
@@ -181,6 +209,8 @@ def set_gdbye_preference(chat_id, should_goodbye):
 
         SESSION.add(curr)
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def set_custom_welcome(chat_id, custom_welcome, welcome_type, buttons=None):
@@ -212,15 +242,16 @@ def set_custom_welcome(chat_id, custom_welcome, welcome_type, buttons=None):
                 SESSION.add(button)
 
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def get_custom_welcome(chat_id):
-    welcome_settings = SESSION.query(Welcome).get(str(chat_id))
+    welcome_settings = SETTINGS_CACHE.get(str(chat_id))
     ret = DEFAULT_WELCOME
     if welcome_settings and welcome_settings.custom_welcome:
         ret = welcome_settings.custom_welcome
 
-    SESSION.close()
     return ret
 
 
@@ -253,15 +284,16 @@ def set_custom_gdbye(chat_id, custom_goodbye, goodbye_type, buttons=None):
                 SESSION.add(button)
 
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(chat_id))
+        publish("welcome", str(chat_id))
 
 
 def get_custom_gdbye(chat_id):
-    welcome_settings = SESSION.query(Welcome).get(str(chat_id))
+    welcome_settings = SETTINGS_CACHE.get(str(chat_id))
     ret = DEFAULT_GOODBYE
     if welcome_settings and welcome_settings.custom_leave:
         ret = welcome_settings.custom_leave
 
-    SESSION.close()
     return ret
 
 
@@ -298,3 +330,5 @@ def migrate_chat(old_chat_id, new_chat_id):
                 btn.chat_id = str(new_chat_id)
 
         SESSION.commit()
+        SETTINGS_CACHE.invalidate(str(old_chat_id), str(new_chat_id))
+        publish("welcome", str(old_chat_id), str(new_chat_id))
@@ -16,7 +16,9 @@ from utils import dispatcher
 from utils.__main__ import STATS
 from utils.modules.disable import DisableAbleCommandHandler
 from utils.modules.helper_funcs.extraction import extract_user
+from utils.modules.helper_funcs.outbound import low_priority
 
+@low_priority
 def tts(bot: Bot, update: Update, args):
     current_time = datetime.strftime(datetime.now(), "%d.%m.%Y %H:%M:%S")
     filename = datetime.now().strftime("%d%m%y-%H%M%S%f")
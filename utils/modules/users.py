@@ -1,19 +1,23 @@
 from io import BytesIO
-from time import sleep
 from typing import Optional
 
-from telegram import TelegramError, Chat, Message, ParseMode
+from telegram import Chat, Message, ParseMode
 from telegram import Update, Bot
 from telegram.error import BadRequest
 from telegram.ext import MessageHandler, Filters, CommandHandler
 from telegram.ext.dispatcher import run_async
 
 import utils.modules.sql.users_sql as sql
-from utils import dispatcher, OWNER_ID, LOGGER, MESSAGE_DUMP
+from utils import dispatcher, OWNER_ID, LOGGER
+from utils.modules.helper_funcs import broadcast as broadcaster
+from utils.modules.helper_funcs.executor import long_running
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 
 USERS_GROUP = 4
 
+BROADCAST_CONTROLS = ("status", "pause", "resume", "cancel")
+
 
 def get_user_id(username):
     # ensure valid userid
@@ -56,6 +60,7 @@ def broadcast(bot: Bot, update: Update):
     Usage:
     /broadcast <message> - Send text message to all groups
     /broadcast [reply to message] - Forward/send replied message to all groups
+    /broadcast status|pause|resume|cancel - Manage the running broadcast
     """
     msg = update.effective_message
     user = update.effective_user
@@ -64,153 +69,78 @@ def broadcast(bot: Bot, update: Update):
     if user.id != OWNER_ID:
         return
     
+    to_send = msg.text.split(None, 1)
+    if not msg.reply_to_message and len(to_send) == 2 and to_send[1].strip().lower() in BROADCAST_CONTROLS:
+        broadcast_control(msg, to_send[1].strip().lower())
+        return
+
     # Check if replying to a message
     if msg.reply_to_message:
-        to_broadcast = msg.reply_to_message
-        broadcast_type = "forwarded message"
+        kwargs = {"from_chat_id": msg.chat_id, "message_id": msg.reply_to_message.message_id}
     else:
         # Extract message text
-        to_send = msg.text.split(None, 1)
         if len(to_send) < 2:
             msg.reply_text(
                 "❌ <b>Broadcast Usage:</b>\n\n"
                 "<b>Method 1:</b> Send text message\n"
                 "<code>/broadcast Your message here</code>\n\n"
                 "<b>Method 2:</b> Forward any message (text, photo, video, etc.)\n"
-                "Reply to any message with <code>/broadcast</code>",
+                "Reply to any message with <code>/broadcast</code>\n\n"
+                "Manage a running broadcast with <code>/broadcast status|pause|resume|cancel</code>",
                 parse_mode="HTML"
             )
             return
-        to_broadcast = to_send[1]
-        broadcast_type = "text message"
+        kwargs = {"text": to_send[1]}
     
-    # Get all chats
-    chats = sql.get_all_chats() or []
-    
-    if not chats:
+    if not sql.num_chats():
         msg.reply_text("⚠️ No groups found in database!")
         return
-    
-    # Send acknowledgement to user
-    msg.reply_text("Broadcast message is sent successfully ✅.")
-    
-    # Send initial status to log channel
-    if MESSAGE_DUMP:
-        try:
-            status_msg = bot.send_message(
-                MESSAGE_DUMP,
-                f"📡 <b>Broadcast Started</b>\n\n"
-                f"<b>Type:</b> {broadcast_type}\n"
-                f"<b>Initiated by:</b> {user.first_name} (<code>{user.id}</code>)\n"
-                f"<b>Total groups:</b> {len(chats)}\n"
-                f"<b>Status:</b> In progress...",
-                parse_mode="HTML"
-            )
-        except:
-            status_msg = None
-    else:
-        status_msg = None
-    
-    # Broadcast to all chats
-    success = 0
-    failed = 0
-    failed_chats = []
-    
-    for idx, chat in enumerate(chats):
-        try:
-            if msg.reply_to_message:
-                # Try to copy the message (preserves formatting, media, etc.)
-                try:
-                    msg.reply_to_message.copy(chat.chat_id)
-                except AttributeError:
-                    # Fallback for older python-telegram-bot versions
-                    msg.reply_to_message.forward(chat.chat_id)
-            else:
-                # Send text message
-                bot.sendMessage(int(chat.chat_id), to_broadcast, parse_mode="HTML")
-            
-            success += 1
-            sleep(0.1)  # Rate limiting
-            
-        except TelegramError as e:
-            failed += 1
-            failed_chats.append((chat.chat_name, chat.chat_id, str(e)))
-            LOGGER.warning("Couldn't send broadcast to %s (ID: %s): %s", 
-                          str(chat.chat_name), str(chat.chat_id), str(e))
-        
-        # Update progress in log channel every 20 chats
-        if MESSAGE_DUMP and status_msg and ((idx + 1) % 20 == 0 or (idx + 1) == len(chats)):
-            try:
-                status_msg.edit_text(
-                    f"📡 <b>Broadcast In Progress</b>\n\n"
-                    f"<b>Type:</b> {broadcast_type}\n"
-                    f"<b>Initiated by:</b> {user.first_name} (<code>{user.id}</code>)\n"
-                    f"<b>Total groups:</b> {len(chats)}\n"
-                    f"<b>Progress:</b> {idx + 1}/{len(chats)}\n"
-                    f"<b>✅ Success:</b> {success}\n"
-                    f"<b>❌ Failed:</b> {failed}",
-                    parse_mode="HTML"
-                )
-            except:
-                pass
-    
-    # Send final summary to log channel
-    if MESSAGE_DUMP:
-        summary = (
-            f"✅ <b>Broadcast Complete</b>\n\n"
-            f"<b>Type:</b> {broadcast_type}\n"
-            f"<b>Initiated by:</b> {user.first_name} (<code>{user.id}</code>)\n\n"
-            f"📊 <b>Statistics:</b>\n"
-            f"• Total groups: {len(chats)}\n"
-            f"• Successfully sent: {success}\n"
-            f"• Failed: {failed}\n"
-        )
-        
-        if failed > 0:
-            summary += f"\n⚠️ <i>{failed} groups failed to receive the message</i>"
-        
-        try:
-            if status_msg:
-                status_msg.edit_text(summary, parse_mode="HTML")
-            else:
-                bot.send_message(MESSAGE_DUMP, summary, parse_mode="HTML")
-        except:
-            pass
-        
-        # Send detailed failure report to log channel if there are failures
-        if failed_chats and failed <= 50:  # Show up to 50 failures
-            failure_report = "<b>📋 Failed Groups Report:</b>\n\n"
-            for name, chat_id, error in failed_chats[:50]:
-                failure_report += f"• {name or 'Unknown'} (<code>{chat_id}</code>)\n  <i>Error: {error[:80]}</i>\n\n"
-            
-            try:
-                bot.send_message(MESSAGE_DUMP, failure_report, parse_mode="HTML")
-            except:
-                pass
 
+    runner = broadcaster.start_broadcast(bot, user, **kwargs)
+    if not runner:
+        msg.reply_text("⚠️ Another broadcast is still active - see <code>/broadcast status</code>.",
+                       parse_mode="HTML")
+        return
+
+    # Send acknowledgement to user; progress goes to the log channel
+    msg.reply_text("📡 Broadcast #{} started ✅.".format(runner.broadcast.broadcast_id))
 
-@run_async
-def log_user(bot: Bot, update: Update):
+
+def broadcast_control(msg: Message, action: str):
+    # goes through the database when the broadcast runs in another shard process
+    result = broadcaster.control_broadcast(action)
+    if not result:
+        msg.reply_text("No broadcast is running.")
+        return
+
+    broadcast, progress = result
+    msg.reply_text("📡 <b>Broadcast #{}</b>\n\n{}".format(broadcast.broadcast_id, progress),
+                   parse_mode=ParseMode.HTML)
+
+
+# NOT ASYNC - only touches the in-memory write-behind buffer; also the "log_user" moderation pipeline stage
+def log_user(bot: Bot, update: Update, context=None):
     chat = update.effective_chat  # type: Optional[Chat]
     msg = update.effective_message  # type: Optional[Message]
 
-    sql.update_user(msg.from_user.id,
-                    msg.from_user.username,
-                    chat.id,
-                    chat.title)
+    sql.queue_user(msg.from_user.id,
+                   msg.from_user.username,
+                   chat.id,
+                   chat.title)
 
     if msg.reply_to_message:
-        sql.update_user(msg.reply_to_message.from_user.id,
-                        msg.reply_to_message.from_user.username,
-                        chat.id,
-                        chat.title)
+        sql.queue_user(msg.reply_to_message.from_user.id,
+                       msg.reply_to_message.from_user.username,
+                       chat.id,
+                       chat.title)
 
     if msg.forward_from:
-        sql.update_user(msg.forward_from.id,
-                        msg.forward_from.username)
+        sql.queue_user(msg.forward_from.id,
+                       msg.forward_from.username)
 
 
 @run_async
+@long_running
 def chats(bot: Bot, update: Update):
     all_chats = sql.get_all_chats() or []
     chatfile = 'List of chats.\n'
@@ -238,6 +168,10 @@ def __migrate__(old_chat_id, new_chat_id):
     sql.migrate_chat(old_chat_id, new_chat_id)
 
 
+def __startup__(bot: Bot):
+    broadcaster.resume_broadcast(bot)
+
+
 __help__ = ""  # no help string
 
 __mod_name__ = "Users"
@@ -246,6 +180,6 @@ BROADCAST_HANDLER = CommandHandler("broadcast", broadcast, filters=Filters.user(
 USER_HANDLER = MessageHandler(Filters.all & Filters.group, log_user)
 CHATLIST_HANDLER = CommandHandler("chatlist", chats, filters=CustomFilters.sudo_filter)
 
-dispatcher.add_handler(USER_HANDLER, USERS_GROUP)
+add_moderation_handler("log_user", USER_HANDLER, USERS_GROUP, always=True)
 dispatcher.add_handler(BROADCAST_HANDLER)
 dispatcher.add_handler(CHATLIST_HANDLER)
@@ -6,16 +6,20 @@ import telegram
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, ParseMode, User, CallbackQuery
 from telegram import Message, Chat, Update, Bot
 from telegram.error import BadRequest
-from telegram.ext import CommandHandler, run_async, DispatcherHandlerStop, MessageHandler, Filters, CallbackQueryHandler
+from telegram.ext import CommandHandler, run_async, DispatcherHandlerStop, Filters, CallbackQueryHandler
 from telegram.utils.helpers import mention_html
 
 from utils import dispatcher, BAN_STICKER
 from utils.modules.disable import DisableAbleCommandHandler
+from utils.modules.helper_funcs.capabilities import CAP_WARN_FILTERS
 from utils.modules.helper_funcs.chat_status import is_user_admin, bot_admin, user_admin_no_reply, user_admin, \
     can_restrict
-from utils.modules.helper_funcs.extraction import extract_text, extract_user_and_text, extract_user
+from utils.modules.helper_funcs.context import UpdateContext, get_context
+from utils.modules.helper_funcs.extraction import extract_user_and_text, extract_user
 from utils.modules.helper_funcs.filters import CustomFilters
+from utils.modules.helper_funcs.handlers import CapabilityMessageHandler
 from utils.modules.helper_funcs.misc import split_message
+from utils.modules.helper_funcs.pipeline import add_moderation_handler
 from utils.modules.helper_funcs.string_handling import split_quotes
 from utils.modules.log_channel import loggable
 from utils.modules.sql import warns_sql as sql
@@ -282,14 +286,18 @@ def list_warn_filters(bot: Bot, update: Update):
         update.effective_message.reply_text(filter_list, parse_mode=ParseMode.HTML)
 
 
-@run_async
+# NOT ASYNC - also the "warns" moderation pipeline stage
 @loggable
-def reply_filter(bot: Bot, update: Update) -> str:
+def reply_filter(bot: Bot, update: Update, context: UpdateContext = None) -> str:
     chat = update.effective_chat  # type: Optional[Chat]
     message = update.effective_message  # type: Optional[Message]
 
     chat_warn_filters = sql.get_chat_warn_triggers(chat.id)
-    to_match = extract_text(message)
+    if not chat_warn_filters:
+        return ""
+
+    context = context or get_context(update, bot)
+    to_match = context.text
     if not to_match:
         return ""
 
@@ -430,7 +438,8 @@ MYWARNS_HANDLER = DisableAbleCommandHandler("warns", warns, pass_args=True, filt
 ADD_WARN_HANDLER = CommandHandler("addwarn", add_warn_filter, filters=Filters.group)
 RM_WARN_HANDLER = CommandHandler(["nowarn", "stopwarn"], remove_warn_filter, filters=Filters.group)
 LIST_WARN_HANDLER = DisableAbleCommandHandler(["warnlist", "warnfilters"], list_warn_filters, filters=Filters.group, admin_ok=True)
-WARN_FILTER_HANDLER = MessageHandler(CustomFilters.has_text & Filters.group, reply_filter)
+WARN_FILTER_HANDLER = CapabilityMessageHandler(CustomFilters.has_text & Filters.group, run_async(reply_filter),
+                                               CAP_WARN_FILTERS)
 WARN_LIMIT_HANDLER = CommandHandler("warnlimit", set_warn_limit, pass_args=True, filters=Filters.group)
 WARN_STRENGTH_HANDLER = CommandHandler("strongwarn", set_warn_strength, pass_args=True, filters=Filters.group)
 
@@ -443,4 +452,4 @@ dispatcher.add_handler(RM_WARN_HANDLER)
 dispatcher.add_handler(LIST_WARN_HANDLER)
 dispatcher.add_handler(WARN_LIMIT_HANDLER)
 dispatcher.add_handler(WARN_STRENGTH_HANDLER)
-dispatcher.add_handler(WARN_FILTER_HANDLER, WARN_HANDLER_GROUP)
+add_moderation_handler("warns", WARN_FILTER_HANDLER, WARN_HANDLER_GROUP, stage=reply_filter)
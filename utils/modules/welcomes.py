@@ -13,6 +13,7 @@ from utils.modules.helper_funcs.chat_status import user_admin, can_delete
 from utils.modules.connection import connected
 from utils.modules.helper_funcs.misc import build_keyboard, revert_buttons
 from utils.modules.helper_funcs.msg_types import get_welcome_type
+from utils.modules.helper_funcs.outbound import low_priority
 from utils.modules.helper_funcs.string_handling import markdown_parser
 from utils.modules.log_channel import loggable
 
@@ -165,6 +166,70 @@ def delete_join(bot: Bot, update: Update):
         if del_join:
             update.effective_message.delete()
 
+@low_priority
+def welcome_members(bot: Bot, update: Update, cust_welcome, welc_type) -> Optional[Message]:
+    chat = update.effective_chat  # type: Optional[Chat]
+    sent = None
+    new_members = update.effective_message.new_chat_members
+    for new_mem in new_members:
+        # Give the owner a special welcome
+        if new_mem.id == OWNER_ID:
+            update.effective_message.reply_text("Master is in the houseeee, let's get this party started!")
+            continue
+
+        # Don't welcome yourself
+        elif new_mem.id == bot.id:
+            continue
+
+        else:
+            # If welcome message is media, send with appropriate function
+            if welc_type not in (sql.Types.TEXT.value, sql.Types.BUTTON_TEXT.value):
+                ENUM_FUNC_MAP[welc_type](chat.id, cust_welcome)
+                return
+            # else, move on
+            first_name = new_mem.first_name or "PersonWithNoName"  # edge case of empty name - occurs for some bugs.
+
+            if cust_welcome:
+                if new_mem.last_name:
+                    fullname = "{} {}".format(first_name, new_mem.last_name)
+                else:
+                    fullname = first_name
+                count = chat.get_members_count()
+                mention = mention_markdown(new_mem.id, escape_markdown(first_name))
+                if new_mem.username:
+                    username = "@" + escape_markdown(new_mem.username)
+                else:
+                    username = mention
+
+                res = cust_welcome.format(
+                    first=html.escape(first_name),
+                    last=html.escape(new_mem.last_name or first_name),
+                    fullname=html.escape(fullname),
+                    username=username,
+                    mention=mention_html(new_mem.id, first_name),
+                    count=count,
+                    chatname=html.escape(chat.title),
+                    id=new_mem.id,
+                )
+
+                # Some parsers escape '[' and ']' as '\[' '\]' which causes a literal backslash to
+                # appear in sent messages (e.g., "Hello Nibin \[6448...] "). Undo those escapes
+                # so placeholders like `[{id}]` render as expected.
+                res = res.replace("\\[", "[").replace("\\]", "]")
+
+                buttons = sql.get_welc_buttons(chat.id)
+                keyb = build_keyboard(buttons)
+            else:
+                res = sql.DEFAULT_WELCOME.format(first=first_name)
+                keyb = []
+
+            keyboard = InlineKeyboardMarkup(keyb)
+
+            sent = send(update, res, keyboard,
+                        sql.DEFAULT_WELCOME.format(first=first_name))  # type: Optional[Message]
+    return sent
+
+
 @run_async
 def new_member(bot: Bot, update: Update):
     chat = update.effective_chat  # type: Optional[Chat]
@@ -173,64 +238,8 @@ def new_member(bot: Bot, update: Update):
         should_welc, cust_welcome, welc_type = sql.get_welc_pref(chat.id)
         
         if should_welc:
-            sent = None
-            new_members = update.effective_message.new_chat_members
-            for new_mem in new_members:
-                # Give the owner a special welcome
-                if new_mem.id == OWNER_ID:
-                    update.effective_message.reply_text("Master is in the houseeee, let's get this party started!")
-                    continue
-
-                # Don't welcome yourself
-                elif new_mem.id == bot.id:
-                    continue
-
-                else:
-                    # If welcome message is media, send with appropriate function
-                    if welc_type not in (sql.Types.TEXT.value, sql.Types.BUTTON_TEXT.value):
-                        ENUM_FUNC_MAP[welc_type](chat.id, cust_welcome)
-                        return
-                    # else, move on
-                    first_name = new_mem.first_name or "PersonWithNoName"  # edge case of empty name - occurs for some bugs.
-
-                    if cust_welcome:
-                        if new_mem.last_name:
-                            fullname = "{} {}".format(first_name, new_mem.last_name)
-                        else:
-                            fullname = first_name
-                        count = chat.get_members_count()
-                        mention = mention_markdown(new_mem.id, escape_markdown(first_name))
-                        if new_mem.username:
-                            username = "@" + escape_markdown(new_mem.username)
-                        else:
-                            username = mention
-
-                        res = cust_welcome.format(
-                            first=html.escape(first_name),
-                            last=html.escape(new_mem.last_name or first_name),
-                            fullname=html.escape(fullname),
-                            username=username,
-                            mention=mention_html(new_mem.id, first_name),
-                            count=count,
-                            chatname=html.escape(chat.title),
-                            id=new_mem.id,
-                        )
-
-                        # Some parsers escape '[' and ']' as '\[' '\]' which causes a literal backslash to
-                        # appear in sent messages (e.g., "Hello Nibin \[6448...] "). Undo those escapes
-                        # so placeholders like `[{id}]` render as expected.
-                        res = res.replace("\\[", "[").replace("\\]", "]")
-
-                        buttons = sql.get_welc_buttons(chat.id)
-                        keyb = build_keyboard(buttons)
-                    else:
-                        res = sql.DEFAULT_WELCOME.format(first=first_name)
-                        keyb = []
-
-                    keyboard = InlineKeyboardMarkup(keyb)
-
-                    sent = send(update, res, keyboard,
-                                sql.DEFAULT_WELCOME.format(first=first_name))  # type: Optional[Message]
+            # the welcome itself can wait, or be skipped under load; cleaning up after joins can't
+            sent = welcome_members(bot, update, cust_welcome, welc_type)
 
             prev_welc = sql.get_clean_pref(chat.id)
             if prev_welc:
@@ -250,6 +259,7 @@ def new_member(bot: Bot, update: Update):
 
 
 @run_async
+@low_priority
 def left_member(bot: Bot, update: Update):
     chat = update.effective_chat  # type: Optional[Chat]
     should_goodbye, cust_goodbye, goodbye_type = sql.get_gdbye_pref(chat.id)